@@ -7,13 +7,10 @@ from wtforms import ValidationError, StringField, PasswordField, SubmitField, Se
 from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional, NumberRange
 import pytz
 import os
-import boto3
 from boto3.dynamodb.conditions import Key
 from werkzeug.utils import secure_filename
 import uuid
 from datetime import datetime, date, timedelta
-import io
-from PIL import Image, ExifTags
 from dateutil import parser
 from botocore.exceptions import ClientError
 import logging
@@ -22,7 +19,24 @@ import random
 from urllib.parse import urlparse, urljoin
 from uguu.timeline import uguu
 from uguu.post import post
+from uguu.upload import upload
+from uguu.dynamo import db as uguu_db, TIMELINE_CACHE_TIMEOUT
 from utils.count_experience import can_join_schedule
+from utils.storage import get_storage
+from utils.images import process_image, write_manifest, build_srcset, IMAGE_SIZES
+from utils.images import ImageProcessingError, ImageProcessingBusy, ImageTooLarge, init_upload_spooling
+from utils.gallery import get_gallery_manifest, list_gallery_objects
+from utils.image_refs import get_image_refs
+from utils.dynamo import users_table, schedules_table, posts_table
+from utils.dynamo import scan_plain, batch_get_plain, SCHEDULE_FIELDS, USER_SUMMARY_FIELDS
+from utils.dynamo import iter_scan, iter_scan_pages
+from utils.tracing import init_backend_tracing
+from utils.metrics import init_metrics
+from utils.scan_guard import init_scan_guard, allow_scan
+from utils.resilience import init_stale_responses, serve_stale
+from utils.warmer import init_cache_warmer
+from utils.compression import init_compression
+from utils.metrics import memoize as metered_memoize
 
 from dotenv import load_dotenv
 
@@ -56,6 +70,9 @@ def create_app():
             SESSION_COOKIE_SAMESITE = 'Lax'  # クロスサイトリクエスト制限
         )
         
+        # リクエスト本文の上限（画像アップロードを想定）。超えた場合は413を返す
+        app.config['MAX_CONTENT_LENGTH'] = int(os.getenv("MAX_CONTENT_LENGTH", str(32 * 1024 * 1024)))
+
         # キャッシュの設定と初期化
         app.config['CACHE_TYPE'] = 'SimpleCache'
         app.config['CACHE_DEFAULT_TIMEOUT'] = 600
@@ -68,13 +85,6 @@ def create_app():
         logger.info("Cache initialized with SimpleCache")                 
        
 
-        # AWS認証情報の設定
-        aws_credentials = {
-            'aws_access_key_id': os.getenv("AWS_ACCESS_KEY_ID"),
-            'aws_secret_access_key': os.getenv("AWS_SECRET_ACCESS_KEY"),
-            'region_name': os.getenv("AWS_REGION", "us-east-1")
-        }
-
         # 必須環境変数のチェック
         required_env_vars = ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "S3_BUCKET", "TABLE_NAME_USER", "TABLE_NAME_SCHEDULE","TABLE_NAME_BOARD"]
         missing_vars = [var for var in required_env_vars if not os.getenv(var)]
@@ -87,18 +97,28 @@ def create_app():
         app.config['S3_LOCATION'] = f"https://{app.config['S3_BUCKET']}.s3.{os.getenv('AWS_REGION')}.amazonaws.com/"
         print(f"S3_BUCKET: {app.config['S3_BUCKET']}")  # デバッグ用
 
-         # AWSクライアントの初期化
-        app.s3 = boto3.client('s3', **aws_credentials)
-        app.dynamodb = boto3.resource('dynamodb', **aws_credentials)
-        app.dynamodb_resource = boto3.resource('dynamodb', **aws_credentials)
-
-        # DynamoDBテーブルの設定
+        # DynamoDBテーブルの設定（リソースとテーブルは utils.dynamo で共有する）
         app.table_name = os.getenv("TABLE_NAME_USER")
         app.table_name_board = os.getenv("TABLE_NAME_BOARD")
         app.table_name_schedule = os.getenv("TABLE_NAME_SCHEDULE")
-        app.table = app.dynamodb_resource.Table(app.table_name)
-        app.table_board = app.dynamodb_resource.Table(app.table_name_board)
-        app.table_schedule = app.dynamodb_resource.Table(app.table_name_schedule)
+
+        # バックエンド（DynamoDB/S3）呼び出しの計測（Server-Timing・遅いリクエストのログ）
+        init_backend_tracing(app)
+
+        # ルートごとのレイテンシなどを /metrics で公開（gunicornの全ワーカー分を合算）
+        init_metrics(app)
+
+        # リクエスト中の Scan をルート・テーブルごとに報告（SCAN_GUARD_MODE=warn/log/raise）
+        init_scan_guard(app)
+
+        # DynamoDBの障害時に直近の値を返したことを Warning ヘッダーと画面で知らせる
+        init_stale_responses(app)
+
+        # アップロードされた画像は一時ファイルに1回だけ書き、画像処理はそのファイルを使う
+        init_upload_spooling(app)
+
+        # HTML / JSON を br・gzip で圧縮（/metrics のレスポンスサイズは圧縮後の値になる）
+        init_compression(app)
 
         # Flask-Loginの設定
         login_manager.init_app(app)
@@ -134,7 +154,7 @@ def load_user(user_id):
 
     try:
         # DynamoDBリソースでテーブルを取得
-        table = app.dynamodb.Table(app.table_name)  # テーブル名を取得
+        table = users_table()
         response = table.get_item(
             Key={
                 "user#user_id": user_id,   # パーティションキーをそのまま指定
@@ -197,7 +217,7 @@ class RegistrationForm(FlaskForm):
     def validate_email(self, field):
         try:
             # DynamoDB テーブル取得
-            table = app.dynamodb.Table(app.table_name)
+            table = users_table()
             current_app.logger.debug(f"Querying email-index for email: {field.data}")
 
             # email-indexを使用してクエリ
@@ -376,7 +396,7 @@ class TempRegistrationForm(FlaskForm):
     def validate_email(self, field):
         try:
             # DynamoDB テーブル取得
-            table = app.dynamodb.Table(app.table_name)
+            table = users_table()
             current_app.logger.debug(f"Querying email-index for email: {field.data}")
 
             # email-indexを使用してクエリ
@@ -414,7 +434,7 @@ class LoginForm(FlaskForm):
         """メールアドレスの存在確認"""
         try:
             # メールアドレスでユーザーを検索
-            response = app.table.query(
+            response = users_table().query(
                 IndexName='email-index',
                 KeyConditionExpression='email = :email',
                 ExpressionAttributeValues={
@@ -591,38 +611,28 @@ class User(UserMixin):
             return item
         
 
-@cache.memoize(timeout=900)
+@serve_stale
+@metered_memoize(cache, timeout=900)
 def get_participants_info(schedule): 
     logger.info("Executing get_schedules_with_formatting")
     participants_info = []
     try:
-        user_table = app.dynamodb.Table(app.table_name)
-        
         if 'participants' in schedule and schedule['participants']:
+            # 参加者ごとのスキャンではなく、キーで一括取得する
+            users = get_users_batch(schedule['participants'])
             for participant_id in schedule['participants']:
-                try:
-                    scan_response = user_table.scan(
-                        FilterExpression='contains(#uid, :pid)',
-                        ExpressionAttributeNames={
-                            '#uid': 'user#user_id'
-                        },
-                        ExpressionAttributeValues={
-                            ':pid': participant_id
-                        }
-                    )
-                    
-                    if scan_response.get('Items'):
-                        user = scan_response['Items'][0]
-                        participants_info.append({
-                            'user_id': participant_id,
-                            'display_name': user.get('display_name', '名前なし'),
-                            'experience': user.get('badminton_experience', '未設定')
-                        })
-                except Exception as e:
-                    app.logger.error(f"参加者情報の取得中にエラー: {str(e)}")
+                user = users.get(participant_id)
+                if user:
+                    participants_info.append({
+                        'user_id': participant_id,
+                        'display_name': user.get('display_name', '名前なし'),
+                        'experience': user.get('badminton_experience', '未設定')
+                    })
                     
     except Exception as e:
+        # 空のリストをキャッシュしないよう送出する（直近の値は serve_stale が返す）
         app.logger.error(f"参加者情報の取得中にエラー: {str(e)}")
+        raise
         
     return participants_info
 
@@ -638,74 +648,77 @@ def format_date(value):
 
 
 
+@app.template_filter('datetime')
+def format_datetime(value):
+    """日時を 'YYYY/MM/DD HH:MM' 形式にフォーマット"""
+    try:
+        return datetime.fromisoformat(value).strftime('%Y/%m/%d %H:%M')
+    except (TypeError, ValueError):
+        return value  # 変換できない場合はそのまま返す
+
+
+@app.template_filter('srcset')
+def srcset(variants, fmt='jpeg'):
+    """派生画像のリストから srcset 属性の値を作成"""
+    return build_srcset(variants, fmt)
+
+
+@app.template_global()
+def image_sizes(purpose):
+    """用途ごとの sizes 属性の値"""
+    return IMAGE_SIZES.get(purpose, '100vw')
+
+
+
+@app.errorhandler(413)
+def request_entity_too_large(e):
+    """アップロードが MAX_CONTENT_LENGTH を超えた場合"""
+    if request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({'error': 'ファイルサイズが大きすぎます'}), 413
+    flash('ファイルサイズが大きすぎます。', 'error')
+    return redirect(request.referrer or url_for('index'))
+
+
 @app.route('/schedules')
 def get_schedules():
-    schedules = get_schedules_with_formatting()
+    try:
+        schedules = get_schedules_with_formatting()
+    except Exception as e:
+        logger.error(f"Error in get_schedules: {str(e)}")
+        return jsonify({'error': 'スケジュールを取得できませんでした'}), 503
     return jsonify(schedules)
     
 def get_schedule_table():
-    """スケジュールテーブルを取得する関数"""
-    region = os.getenv('AWS_REGION', 'ap-northeast-1')
-    table_name = os.getenv('DYNAMODB_TABLE_NAME', 'bad_schedules')
-
-    logger.debug(f"Region: {region}")
-    logger.debug(f"Table name: {table_name}")
-
-    try:
-        dynamodb = boto3.resource('dynamodb', region_name=region)
-        table = dynamodb.Table(table_name)
-        return table
-    except Exception as e:
-        logger.error(f"Error getting schedule table: {e}")
-        raise
+    """スケジュールテーブルを取得する関数（共有のテーブルを返すので毎回の接続作成は発生しない）"""
+    return schedules_table()
     
 def get_users_batch(user_ids):
-    """ユーザー情報を一括取得する関数"""
+    """ユーザー情報（表示名・経験）を一括取得する関数"""
     try:
-        user_table = app.dynamodb.Table(os.getenv('TABLE_NAME_USER', 'bad-users'))
-        
-        # ユーザーIDのリストをバッチ処理用に変換
-        keys = [{'user#user_id': user_id} for user_id in user_ids]
-        
-        # バッチでユーザー情報を取得
-        response = app.dynamodb.batch_get_item(
-            RequestItems={
-                os.getenv('TABLE_NAME_USER', 'bad-users'): {
-                    'Keys': keys
-                }
-            }
-        )
-        
-        # 結果を辞書形式に整理
-        users = {}
-        if 'Responses' in response:
-            for user in response['Responses'][os.getenv('TABLE_NAME_USER', 'bad-users')]:
-                user_id = user['user#user_id']
-
-                # デバッグ用：各ユーザーの情報を確認
-                logger.info(f"User data: {user}")
-                users[user_id] = user
-                
+        users = batch_get_plain(users_table().name, 'user#user_id', user_ids, USER_SUMMARY_FIELDS)
+        logger.debug(f"Users fetched: {len(users)}")
         return users
-        
+
     except Exception as e:
+        # 「未登録」だらけの一覧をキャッシュしないよう、呼び出し側に送出する
         logger.error(f"Error batch getting users: {e}")
-        return {}
+        raise
     
     
 
-@cache.memoize(timeout=900)
+@serve_stale
+@metered_memoize(cache, timeout=900)
 def get_schedules_with_formatting():
     """スケジュール一覧を取得してフォーマットする"""
     logger.info("Cache: Attempting to get formatted schedules")
     
     try:
-        schedule_table = get_schedule_table()
-        response = schedule_table.scan()
+        # 表示用なので低レベルクライアントで必要な属性だけを読み、int / str に直接変換する
+        items = scan_plain(get_schedule_table().name, SCHEDULE_FIELDS)
         
         # アクティブなスケジュールのみをフィルタリングしてからソート
         active_schedules = [
-            schedule for schedule in response.get('Items', [])
+            schedule for schedule in items
             if schedule.get('status', 'active') == 'active'  # statusが設定されていない場合はactiveとみなす
         ]
         
@@ -760,8 +773,9 @@ def get_schedules_with_formatting():
         return formatted_schedules
         
     except Exception as e:
+        # 失敗時は空の一覧をキャッシュせずに送出する（直近の値は serve_stale が返す）
         logger.error(f"Error in get_schedules_with_formatting: {str(e)}")
-        return []
+        raise
 
 
 @app.route("/", methods=['GET'])
@@ -792,7 +806,7 @@ def temp_register():
             hashed_password = generate_password_hash(form.password.data, method='pbkdf2:sha256')
             user_id = str(uuid.uuid4())
 
-            table = app.dynamodb.Table(app.table_name)
+            table = users_table()
 
             temp_data = {
                 "user#user_id": user_id,
@@ -834,7 +848,7 @@ def join_schedule(schedule_id):
             return jsonify({'status': 'error', 'message': '日付が不足しています。'}), 400
 
         # スケジュールの取得
-        schedule_table = app.dynamodb.Table(app.table_name_schedule)
+        schedule_table = schedules_table()
         response = schedule_table.get_item(
             Key={
                 'schedule_id': schedule_id,
@@ -898,8 +912,8 @@ def signup():
             hashed_password = generate_password_hash(form.password.data, method='pbkdf2:sha256')
             user_id = str(uuid.uuid4())          
 
-            table = app.dynamodb.Table(app.table_name) 
-            posts_table = app.dynamodb.Table('posts')  # 投稿用テーブル
+            table = users_table() 
+            timeline_table = posts_table()  # 投稿用テーブル
 
             # メールアドレスの重複チェック用のクエリ
             email_check = table.query(
@@ -915,7 +929,7 @@ def signup():
                 flash('このメールアドレスは既に登録されています。', 'error')
                 return redirect(url_for('signup'))         
 
-            app.table.put_item(
+            users_table().put_item(
                 Item={
                     "user#user_id": user_id,                    
                     "address": form.address.data,
@@ -947,7 +961,7 @@ def signup():
                 }
             )
 
-            posts_table.put_item(
+            timeline_table.put_item(
                 Item={
                     'PK': f"USER#{user_id}",
                     'SK': 'TIMELINE#DATA',
@@ -1004,13 +1018,13 @@ def login():
     if current_user.is_authenticated:
         return redirect(url_for('index')) 
 
-    # form = LoginForm(dynamodb_table=app.table)
+    # form = LoginForm(dynamodb_table=users_table())
     form = LoginForm()
     if form.validate_on_submit():
         try:
             print("う")
             # メールアドレスでユーザーを取得
-            response = app.table.query(
+            response = users_table().query(
                 IndexName='email-index',
                 KeyConditionExpression='email = :email',
                 ExpressionAttributeValues={
@@ -1095,6 +1109,7 @@ def logout():
 
 
 @app.route("/admin/schedules", methods=['GET', 'POST'])
+@allow_scan
 @login_required
 def admin_schedules():
     if not current_user.administrator:
@@ -1133,8 +1148,7 @@ def admin_schedules():
 
     try:
         schedule_table = get_schedule_table()
-        response = schedule_table.scan()
-        all_schedules = response.get('Items', [])
+        all_schedules = list(iter_scan(schedule_table.scan))
         schedules = sorted(
             all_schedules,
             key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d').date()
@@ -1300,14 +1314,12 @@ def delete_schedule(schedule_id):
 
 
 @app.route("/user_maintenance", methods=["GET", "POST"])
+@allow_scan
 @login_required
 def user_maintenance():
     try:
-        # テーブルからすべてのユーザーを取得
-        response = app.table.scan()
-        
-        # デバッグ用に取得したユーザーデータを表示
-        users = response.get('Items', [])        
+        # テーブルからすべてのユーザーを取得（全ページ）
+        users = list(iter_scan(users_table().scan))
         for user in users:
             if 'user#user_id' in user:
                 user['user_id'] = user.pop('user#user_id').replace('user#', '')
@@ -1333,6 +1345,7 @@ def user_maintenance():
       
 
 @app.route("/table_info")
+@allow_scan
 def get_table_info():
     try:
         table = get_schedule_table()
@@ -1342,7 +1355,7 @@ def get_table_info():
             'key_schema': table.key_schema,
             'attribute_definitions': table.attribute_definitions,
             # サンプルデータも取得
-            'sample_data': table.scan(Limit=1)['Items']
+            'sample_data': next(iter_scan_pages(table.scan, Limit=1))['Items']
         }
         return str(response)
     except Exception as e:
@@ -1352,7 +1365,7 @@ def get_table_info():
 @app.route('/account/<string:user_id>', methods=['GET', 'POST'])
 def account(user_id):
     try:
-        table = app.dynamodb.Table(app.table_name)
+        table = users_table()
         response = table.get_item(Key={'user#user_id': user_id})
         user = response.get('Item')
 
@@ -1362,7 +1375,7 @@ def account(user_id):
         user['user_id'] = user.pop('user#user_id')
         app.logger.info(f"User loaded successfully: {user_id}")
 
-        form = UpdateUserForm(user_id=user_id, dynamodb_table=app.table)
+        form = UpdateUserForm(user_id=user_id, dynamodb_table=users_table())
 
         if request.method == 'GET':
             app.logger.debug("Initializing form with GET request.")
@@ -1463,7 +1476,7 @@ def account(user_id):
 @app.route("/delete_user/<string:user_id>")
 def delete_user(user_id):
     try:
-        table = app.dynamodb.Table(app.table_name)
+        table = users_table()
         response = table.get_item(
             TableName=app.table_name,
             Key={
@@ -1482,7 +1495,7 @@ def delete_user(user_id):
             abort(403)  # 権限がない場合は403エラー
         
         # ここで実際の削除処理を実行
-        table = app.dynamodb.Table(app.table_name)
+        table = users_table()
         table.delete_item(Key={'user#user_id': user_id})
 
          # ログイン中のユーザーが削除対象の場合はログアウト
@@ -1500,81 +1513,76 @@ def delete_user(user_id):
         return redirect(url_for('user_maintenance'))
     
 
+def ensure_gallery_manifest(manifest):
+    """マニフェスト未作成の環境では一度だけS3から作る"""
+    manifest.entries()
+    if manifest.version is None:
+        storage = get_storage()
+        manifest.rebuild(list_gallery_objects(storage), storage.public_url)
+
+
 @app.route("/gallery", methods=["GET", "POST"])
 def gallery():
-    posts = []
+    manifest = get_gallery_manifest()
 
     if request.method == "POST":
         image = request.files.get("image")
         if image and image.filename != '':
-            original_filename = secure_filename(image.filename)
-            unique_filename = f"gallery/{uuid.uuid4().hex}_{original_filename}"
-
-            img = Image.open(image)
-
+            # 最初の操作がアップロードでも既存の画像を取り込めるよう、追加する前に作る
+            # （追加で VERSION ができると、以降は作り直さなくなるため）
             try:
-                exif = img._getexif()
-                if exif is not None:
-                    for orientation in ExifTags.TAGS.keys():
-                        if ExifTags.TAGS[orientation] == "Orientation":
-                            break
-                    orientation_value = exif.get(orientation)
-                    if orientation_value == 3:
-                        img = img.rotate(180, expand=True)
-                    elif orientation_value == 6:
-                        img = img.rotate(270, expand=True)
-                    elif orientation_value == 8:
-                        img = img.rotate(90, expand=True)
-            except (AttributeError, KeyError, IndexError):
-                # EXIFが存在しない場合はそのまま続行
-                pass
-
-            max_width = 500           
-            if img.width > max_width:
-                # アスペクト比を維持したままリサイズ
-                new_height = int((max_width / img.width) * img.height)                
-                img = img.resize((max_width, new_height), Image.LANCZOS)
-
-            # リサイズされた画像をバイトIOオブジェクトに保存
-            img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format='JPEG')
-            img_byte_arr.seek(0)
-
-            # appを直接参照
-            app.s3.upload_fileobj(
-                img_byte_arr,
-                app.config["S3_BUCKET"],
-                unique_filename
-            )
-            image_url = f"{app.config['S3_LOCATION']}{unique_filename}"
+                ensure_gallery_manifest(manifest)
+            except Exception as e:
+                app.logger.error(f"Gallery manifest rebuild failed: {e}")
+                flash('画像の保存に失敗しました。', 'error')
+                return redirect(url_for("gallery"))
 
-            print(f"Uploaded Image URL: {image_url}")
+            # 幅・形式ごとの派生画像を gallery/<id>/ に保存
+            try:
+                image_manifest = process_image(get_storage(), image, "gallery", refs=get_image_refs())
+            except ImageTooLarge as e:
+                flash(f'画像が大きすぎます: {e}', 'error')
+                return redirect(url_for("gallery"))
+            except ImageProcessingBusy:
+                flash('画像の処理が混み合っています。しばらくしてから再度お試しください。', 'error')
+                return redirect(url_for("gallery"))
+            except ImageProcessingError as e:
+                app.logger.error(f"Gallery image processing failed: {e}")
+                flash('画像の処理に失敗しました。', 'error')
+                return redirect(url_for("gallery"))
+            write_manifest(get_storage(), image_manifest)
+            manifest.add(image_manifest, datetime.now().isoformat())
+
+            print(f"Uploaded Image URL: {image_manifest['url']}")
             return redirect(url_for("gallery"))  # POST後はGETリクエストにリダイレクト
 
-    # GETリクエスト: S3バケット内の画像を取得
+    # GETリクエスト: マニフェストから1ページ分を取得（S3の一覧取得は行わない）
+    page = max(request.args.get('page', 1, type=int), 1)
+    posts, has_next = [], False
     try:
-        response = app.s3.list_objects_v2(Bucket=app.config["S3_BUCKET"],
-                                          Prefix="gallery/")
-        if "Contents" in response:
-            for obj in response["Contents"]: 
-                if obj['Key'] != "gallery/":
-                            print(f"Found object key: {obj['Key']}")
-                            posts.append({
-                                "image_url": f"{app.config['S3_LOCATION']}{obj['Key']}"
-                            })
+        ensure_gallery_manifest(manifest)
+        posts, has_next = manifest.page(page)
     except Exception as e:
-        print(f"Error fetching images from S3: {e}")
+        print(f"Error fetching gallery manifest: {e}")
 
-    return render_template("gallery.html", posts=posts)
+    return render_template("gallery.html", posts=posts, page=page, has_next=has_next)
 
 
 @app.route("/delete_image/<filename>", methods=["POST"])
 @login_required
 def delete_image(filename):
     try:
-        # S3から指定されたファイルを削除
-        app.s3.delete_object(Bucket=app.config["S3_BUCKET"], Key=f"gallery/{filename}")
-        print(f"Deleted {filename} from S3")
+        filename = secure_filename(filename)
+        manifest = get_gallery_manifest()
+        entry = manifest.get(filename)
+        if entry:
+            # 他で使われている画像は参照数を減らすだけにし、最後の参照のときだけ削除
+            if not entry.get('digest') or get_image_refs().release(entry['digest']):
+                get_storage().delete_many(entry['keys'])
+            manifest.remove(entry)
+        else:
+            get_storage().delete(f"gallery/{filename}")
+        print(f"Deleted {filename} from storage")
 
         # 削除成功後にアップロードページにリダイレクト
         return redirect(url_for("gallery"))
@@ -1588,25 +1596,25 @@ def delete_image(filename):
 @app.route('/user/<string:user_id>')
 def user_profile(user_id):
     try:
-        table = app.dynamodb.Table(app.table_name)
+        table = users_table()
         response = table.get_item(Key={'user#user_id': user_id})
         user = response.get('Item')
 
         if not user:
             abort(404)
 
-        # 投稿データの取得を追加
-        posts_table = app.dynamodb.Table('posts')
-        posts_response = posts_table.query(
-            KeyConditionExpression="PK = :pk AND begins_with(SK, :sk_prefix)",
-            ExpressionAttributeValues={
-                ':pk': f"USER#{user_id}",
-                ':sk_prefix': 'METADATA#'
-            }
+        # 投稿データの取得（投稿者ごとのGSI1を新しい順にページング）
+        posts, next_cursor = uguu_db.get_user_posts_page(
+            user_id,
+            cursor=request.args.get('cursor')
         )
-        posts = posts_response.get('Items', [])
 
-        return render_template('user_profile.html', user=user, posts=posts)
+        is_following = False
+        if current_user.is_authenticated and current_user.id != user_id:
+            is_following = uguu_db.is_following(current_user.id, user_id)
+
+        return render_template('user_profile.html', user=user, posts=posts,
+                               next_cursor=next_cursor, is_following=is_following)
 
     except Exception as e:
         app.logger.error(f"Error loading profile: {str(e)}")
@@ -1625,6 +1633,13 @@ def video_link():
 # 新しい機能を追加
 app.register_blueprint(uguu, url_prefix='/uguu')
 app.register_blueprint(post, url_prefix='/uguu')
+app.register_blueprint(upload, url_prefix='/uploads')
+
+# 一覧のキャッシュを有効期限が切れる前に作り直す（gunicorn のワーカーでは起動時にも作る）
+init_cache_warmer(app, [
+    ('schedules', get_schedules_with_formatting.refresh, 900),
+    ('timeline', uguu_db.refresh_timeline, TIMELINE_CACHE_TIMEOUT),
+])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+"""リクエストごとに boto3.resource を作る従来の方法と、utils.dynamo の共有リソースを比較する
+
+    python benchmarks/dynamo_clients.py [回数]
+
+テーブル取得（get_schedule_table 相当）にかかる時間はネットワークなしで計測する。
+DYNAMODB_ENDPOINT_URL（DynamoDB Local など）を指定した場合は、GetItem 1回を含めた
+リクエスト相当の時間も比較する（毎回の接続確立とTLSの分が差に出る）。
+"""
+import os
+import sys
+import time
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import boto3
+from utils import dynamo
+
+TABLE_NAME = os.getenv("DYNAMODB_TABLE_NAME", "bad_schedules")
+REGION = os.getenv("AWS_REGION", "ap-northeast-1")
+
+
+def per_call_table():
+    """変更前の get_schedule_table() と同じ処理"""
+    return boto3.resource('dynamodb', region_name=REGION,
+                          endpoint_url=os.getenv("DYNAMODB_ENDPOINT_URL") or None).Table(TABLE_NAME)
+
+
+def shared_table():
+    return dynamo.get_table(TABLE_NAME)
+
+
+def measure(label, func, rounds):
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    p95 = times[int(len(times) * 0.95) - 1]
+    print(f"{label:<22} mean {statistics.mean(times) * 1000:8.2f}ms  "
+          f"p50 {statistics.median(times) * 1000:8.2f}ms  p95 {p95 * 1000:8.2f}ms")
+    return statistics.mean(times)
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"{rounds} rounds, table {TABLE_NAME}")
+
+    # 初回作成分は共有側でも1回だけ発生する
+    start = time.perf_counter()
+    shared_table()
+    print(f"{'shared first use':<22} {(time.perf_counter() - start) * 1000:8.2f}ms")
+
+    before = measure('per-call resource', per_call_table, rounds)
+    after = measure('shared resource', shared_table, rounds)
+    print(f"saved per request: {(before - after) * 1000:.2f}ms")
+
+    if os.getenv("DYNAMODB_ENDPOINT_URL"):
+        key = {'schedule_id': 'benchmark', 'date': '2000-01-01'}
+        print("\nwith one GetItem:")
+        before = measure('per-call resource', lambda: per_call_table().get_item(Key=key), rounds)
+        after = measure('shared resource', lambda: shared_table().get_item(Key=key), rounds)
+        print(f"saved per request: {(before - after) * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""DynamoDBの応答の変換時間を、リソース層（TypeDeserializer, Decimal）と utils.dynamo.plain_item で比較する
+
+    python benchmarks/dynamo_deserialize.py [回数]
+
+スケジュール一覧（12件・参加者30人）、ユーザー概要（100件）、投稿（100件・派生画像6枚）の
+低レベル応答を合成して変換する。ネットワークは使わない。
+"""
+import os
+import sys
+import time
+import json
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from boto3.dynamodb.types import TypeDeserializer
+from utils.dynamo import plain_item
+
+
+def schedule_items(count=12, participants=30):
+    return [{
+        'schedule_id': {'S': f"schedule-{i}"},
+        'date': {'S': f"2026-11-{i + 1:02d}"},
+        'day_of_week': {'S': '土'},
+        'venue': {'S': '北越谷体育館'},
+        'start_time': {'S': '18:00'},
+        'end_time': {'S': '21:00'},
+        'max_participants': {'N': '30'},
+        'participants': {'L': [{'S': f"user-{i}-{j}"} for j in range(participants)]},
+        'participants_count': {'N': str(participants)},
+        'status': {'S': 'active'},
+    } for i in range(count)]
+
+
+def user_items(count=100):
+    return [{
+        'user#user_id': {'S': f"user-{i}"},
+        'display_name': {'S': f"ユーザー{i}"},
+        'user_name': {'S': f"user{i}"},
+        'badminton_experience': {'S': '3年以上'},
+    } for i in range(count)]
+
+
+def post_items(count=100):
+    return [{
+        'PK': {'S': f"POST#{i}"},
+        'SK': {'S': f"METADATA#{i}"},
+        'post_id': {'S': str(i)},
+        'user_id': {'S': f"user-{i % 10}"},
+        'content': {'S': '今日の練習お疲れさまでした！' * 4},
+        'image_url': {'S': f"https://example.com/posts/{i}/w960.jpg"},
+        'image_variants': {'L': [
+            {'M': {'url': {'S': f"https://example.com/posts/{i}/w{w}.{ext}"},
+                   'width': {'N': str(w)}, 'height': {'N': str(w * 3 // 4)}, 'format': {'S': fmt}}}
+            for w in (160, 480, 960) for fmt, ext in (('webp', 'webp'), ('jpeg', 'jpg'))
+        ]},
+        'image_status': {'S': 'ready'},
+        'created_at': {'S': '2026-10-01T12:00:00'},
+        'likes_count': {'N': str(i)},
+    } for i in range(count)]
+
+
+def resource_layer(items):
+    """リソース層と同じ変換（Decimal）と、表示前に int へ戻す処理"""
+    deserializer = TypeDeserializer()
+    converted = [{k: deserializer.deserialize(v) for k, v in item.items()} for item in items]
+    return json.dumps(converted, default=lambda o: int(o) if o == o.to_integral_value() else float(o),
+                      ensure_ascii=False)
+
+
+def fast_path(items):
+    return json.dumps([plain_item(item) for item in items], ensure_ascii=False)
+
+
+def measure(func, items, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(items)
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    datasets = [
+        ('schedules', schedule_items()),
+        ('users', user_items()),
+        ('posts', post_items()),
+    ]
+    # 変換結果が同じ値になることを確認
+    for _, items in datasets:
+        deserializer = TypeDeserializer()
+        assert [plain_item(item) for item in items[:3]] == \
+            [{k: deserializer.deserialize(v) for k, v in item.items()} for item in items[:3]]
+
+    print(f"{rounds} rounds (deserialize + json.dumps)")
+    print(f"{'dataset':<10} {'resource':>12} {'fast path':>12} {'speedup':>8}")
+    for name, items in datasets:
+        slow = measure(resource_layer, items, rounds)
+        fast = measure(fast_path, items, rounds)
+        print(f"{name:<10} {slow * 1e6:10.0f}us {fast * 1e6:10.0f}us {slow / fast:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""1ページ表示あたりの画像転送量を、従来の単一画像と派生画像(srcset)で比較する
+
+    python benchmarks/image_bytes.py [画像ファイル ...]
+
+画像を指定しない場合はスマートフォン写真相当（4032x3024）の合成画像を使う。
+ブラウザが srcset から選ぶ幅は「表示幅 x デバイスピクセル比」以上の最小の派生画像とする。
+"""
+import os
+import sys
+import random
+from io import BytesIO
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PIL import Image, ImageDraw, ImageFilter
+from utils.images import open_oriented, make_derivatives
+
+# 1ページに表示する画像数
+IMAGES_PER_PAGE = 20
+
+# (名前, CSS上の表示幅px, デバイスピクセル比, WebP対応)
+CLIENTS = [
+    ('mobile 1x', 360, 1, True),
+    ('mobile 3x', 390, 3, True),
+    ('desktop 1x', 600, 1, True),
+    ('old browser', 600, 1, False),
+]
+
+
+def synthetic_photo(width=4032, height=3024, seed=0):
+    """写真に近い圧縮率になるよう、グラデーションと図形とノイズを重ねた画像を作る"""
+    rnd = random.Random(seed)
+    img = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    draw = ImageDraw.Draw(img)
+    for _ in range(200):
+        x, y = rnd.randrange(width), rnd.randrange(height)
+        r = rnd.randrange(20, 400)
+        color = tuple(rnd.randrange(256) for _ in range(3))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=color)
+    noise = Image.effect_noise((width, height), 40).convert('RGB')
+    return Image.blend(img.filter(ImageFilter.GaussianBlur(3)), noise, 0.15)
+
+
+def legacy_bytes(img, max_width, **save_args):
+    """従来の処理（単一サイズのJPEG）の出力サイズ"""
+    img = img.copy()
+    img.thumbnail((max_width, max_width * 10), Image.LANCZOS)
+    output = BytesIO()
+    img.save(output, format='JPEG', **save_args)
+    return len(output.getvalue())
+
+
+def chosen_bytes(derivatives, css_width, dpr, webp):
+    fmt = 'webp' if webp else 'jpeg'
+    candidates = sorted((d for d in derivatives if d['format'] == fmt), key=lambda d: d['width'])
+    needed = css_width * dpr
+    for d in candidates:
+        if d['width'] >= needed:
+            return len(d['data'])
+    return len(candidates[-1]['data'])
+
+
+def main(paths):
+    if paths:
+        images = [open_oriented(open(p, 'rb')) for p in paths]
+    else:
+        images = []
+        for seed in range(3):
+            buf = BytesIO()
+            synthetic_photo(seed=seed).save(buf, format='JPEG', quality=92)
+            buf.seek(0)
+            images.append(open_oriented(buf))
+
+    legacy_post = sum(legacy_bytes(img, 800, quality=85, optimize=True) for img in images) / len(images)
+    legacy_gallery = sum(legacy_bytes(img, 500) for img in images) / len(images)
+    derivatives = [make_derivatives(img) for img in images]
+
+    print(f"images: {len(images)}, per page: {IMAGES_PER_PAGE}")
+    print(f"legacy: timeline {legacy_post * IMAGES_PER_PAGE / 1024:.0f} KiB/page, "
+          f"gallery {legacy_gallery * IMAGES_PER_PAGE / 1024:.0f} KiB/page")
+    print(f"{'client':<14}{'srcset KiB/page':>18}{'vs timeline':>14}{'vs gallery':>14}")
+    for name, css_width, dpr, webp in CLIENTS:
+        per_image = sum(chosen_bytes(d, css_width, dpr, webp) for d in derivatives) / len(derivatives)
+        page = per_image * IMAGES_PER_PAGE
+        print(f"{name:<14}{page / 1024:>18.0f}"
+              f"{page / (legacy_post * IMAGES_PER_PAGE) * 100:>13.0f}%"
+              f"{page / (legacy_gallery * IMAGES_PER_PAGE) * 100:>13.0f}%")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,80 @@
+"""アップロード1件あたりのピークRSSを、従来の全体デコードとdraftデコードで比較する
+
+    python benchmarks/image_memory.py [画像ファイル ...]
+
+計測ごとに新しいプロセスを起動し、そのプロセスの ru_maxrss から起動直後の値を引いて報告する。
+画像を指定しない場合は 12MP / 48MP のスマートフォン写真相当の合成JPEGを使う。
+"""
+import os
+import sys
+import resource
+import tempfile
+import multiprocessing
+from io import BytesIO
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _maxrss_mib():
+    # Linuxでは KiB、macOSでは byte
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def _legacy(path):
+    """従来の gallery() と同じ処理（全体をデコードしてから縮小）"""
+    from PIL import Image
+    with open(path, 'rb') as f:
+        img = Image.open(f)
+        img.load()
+        if img.width > 500:
+            img = img.resize((500, int(500 / img.width * img.height)), Image.LANCZOS)
+        img.save(BytesIO(), format='JPEG')
+
+
+def _bounded(path):
+    from utils.images import render_derivatives_file
+    render_derivatives_file(path)
+
+
+def _measure(func_name, path, queue):
+    from PIL import Image  # noqa: F401 ライブラリ読み込み分は基準値に含める
+    import utils.images  # noqa: F401
+    baseline = _maxrss_mib()
+    globals()[func_name](path)
+    queue.put(_maxrss_mib() - baseline)
+
+
+def measure(func_name, path):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_measure, args=(func_name, path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main(paths):
+    tmpdir = None
+    if not paths:
+        from benchmarks.image_bytes import synthetic_photo
+        tmpdir = tempfile.TemporaryDirectory()
+        for name, size in (('12MP', (4032, 3024)), ('48MP', (8064, 6048))):
+            path = os.path.join(tmpdir.name, f"{name}.jpg")
+            synthetic_photo(*size).save(path, format='JPEG', quality=90)
+            paths.append(path)
+
+    print(f"{'image':<24}{'size':>10}{'legacy MiB':>12}{'bounded MiB':>13}")
+    for path in paths:
+        legacy = measure('_legacy', path)
+        bounded = measure('_bounded', path)
+        print(f"{os.path.basename(path):<24}{os.path.getsize(path) / 1024 / 1024:>9.1f}M"
+              f"{legacy:>12.0f}{bounded:>13.0f}")
+
+    if tmpdir:
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,79 @@
+"""同時アップロード時の画像処理スループットを、リクエストスレッド内処理とプロセスプールで比較する
+
+    python benchmarks/image_pool.py [同時アップロード数] [画像ファイル]
+
+保存先は一時ディレクトリの LocalStorage（AWS不要）。
+"""
+import os
+import sys
+import time
+import tempfile
+import statistics
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import images
+from utils.storage import LocalStorage
+from benchmarks.image_bytes import synthetic_photo
+
+# gunicorn gthread の1ワーカーあたりのスレッド数を想定
+REQUEST_THREADS = 8
+
+
+def inline_upload(storage, image_bytes):
+    """従来どおりリクエストスレッド内で処理"""
+    derivatives = images.render_derivatives(image_bytes)
+    return images.store_derivatives(storage, f"bench/{time.perf_counter_ns()}", derivatives)
+
+
+def pooled_upload(storage, image_bytes):
+    return images.process_image(storage, BytesIO(image_bytes), 'bench')
+
+
+def run(label, func, storage, image_bytes, uploads):
+    latencies = []
+
+    def _one(_):
+        start = time.perf_counter()
+        try:
+            func(storage, image_bytes)
+        except images.ImageProcessingError as e:
+            return f"error: {e}"
+        latencies.append(time.perf_counter() - start)
+        return None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=REQUEST_THREADS) as executor:
+        errors = [r for r in executor.map(_one, range(uploads)) if r]
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+    print(f"{label:<10} {uploads / elapsed:6.2f} uploads/s  "
+          f"p50 {statistics.median(latencies) * 1000:7.0f}ms  p95 {p95 * 1000:7.0f}ms  "
+          f"errors {len(errors)}")
+
+
+def main():
+    uploads = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'rb') as f:
+            image_bytes = f.read()
+    else:
+        buf = BytesIO()
+        synthetic_photo().save(buf, format='JPEG', quality=92)
+        image_bytes = buf.getvalue()
+
+    print(f"{uploads} concurrent uploads, {len(image_bytes) / 1024:.0f} KiB each, "
+          f"{REQUEST_THREADS} request threads, {images.IMAGE_POOL_WORKERS} pool workers")
+    with tempfile.TemporaryDirectory() as root:
+        storage = LocalStorage(root=root)
+        run('inline', inline_upload, storage, image_bytes, uploads)
+        # 子プロセスの起動時間を計測に含めないよう先に1回処理しておく
+        pooled_upload(storage, image_bytes)
+        run('pool', pooled_upload, storage, image_bytes, uploads)
+
+
+if __name__ == "__main__":
+    main()
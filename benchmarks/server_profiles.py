@@ -0,0 +1,145 @@
+"""gunicorn のプロファイル（sync / gthread / gevent）ごとに、トップページと参加登録の負荷試験を行う
+
+    python benchmarks/server_profiles.py [秒数] [同時接続数]
+
+プロファイルごとに gunicorn -c gunicorn.conf.py app:app を起動し、
+GET / と POST /schedule/<id>/join を同時接続数のスレッドから指定秒数だけ送り続けて、
+スループットとレイテンシ（p50 / p95）を表示する。
+
+参加登録はログインが必要で、実際に参加者を追加・削除する（同じリクエストを繰り返すと交互に切り替わる）。
+ステージングのテーブルに対して、次の環境変数を指定した場合のみ計測する。
+    BENCH_SESSION_COOKIE  ログイン済みの session クッキーの値
+    BENCH_SCHEDULE_ID / BENCH_SCHEDULE_DATE  参加登録するスケジュール
+"""
+import os
+import sys
+import json
+import time
+import signal
+import threading
+import subprocess
+import statistics
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PORT = int(os.getenv("BENCH_PORT", "8765"))
+BASE_URL = f"http://127.0.0.1:{PORT}"
+PROFILES = ('sync', 'gthread', 'gevent')
+
+
+def start_server(profile):
+    env = dict(os.environ, GUNICORN_PROFILE=profile, GUNICORN_BIND=f"127.0.0.1:{PORT}")
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    # 起動（preload・キャッシュの作成を含む）を待つ
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(server.stderr.read().decode('utf-8', 'replace')[-2000:])
+        try:
+            urllib.request.urlopen(f"{BASE_URL}/", timeout=5).read()
+            return server
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError(f"{profile}: server did not start")
+
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def index_request():
+    return urllib.request.Request(f"{BASE_URL}/")
+
+
+def join_request():
+    body = json.dumps({'date': os.environ["BENCH_SCHEDULE_DATE"]}).encode('utf-8')
+    return urllib.request.Request(
+        f"{BASE_URL}/schedule/{os.environ['BENCH_SCHEDULE_ID']}/join",
+        data=body, method='POST',
+        headers={
+            'Content-Type': 'application/json',
+            'Cookie': f"session={os.environ['BENCH_SESSION_COOKIE']}"
+        }
+    )
+
+
+def run_load(make_request, seconds, concurrency):
+    """(1秒あたりの件数, レイテンシのリスト, エラー数) を返す"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + seconds
+
+    def _client():
+        nonlocal errors
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(make_request(), timeout=30) as response:
+                    response.read()
+                ok = True
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    threads = [threading.Thread(target=_client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return len(latencies) / (time.perf_counter() - started), latencies, errors
+
+
+def report(profile, route, result):
+    rate, latencies, errors = result
+    if not latencies:
+        print(f"{profile:<8} {route:<6} no successful requests ({errors} errors)")
+        return
+    latencies.sort()
+    p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+    print(f"{profile:<8} {route:<6} {rate:8.1f} req/s  p50 {statistics.median(latencies) * 1000:7.1f}ms  "
+          f"p95 {p95 * 1000:7.1f}ms  errors {errors}")
+
+
+def main():
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    with_join = all(os.getenv(name) for name in
+                    ('BENCH_SESSION_COOKIE', 'BENCH_SCHEDULE_ID', 'BENCH_SCHEDULE_DATE'))
+
+    print(f"{seconds}s per route, {concurrency} concurrent clients")
+    for profile in PROFILES:
+        if profile == 'gevent':
+            try:
+                import gevent  # noqa: F401
+            except ImportError:
+                print("gevent   skipped (pip install gevent)")
+                continue
+        server = start_server(profile)
+        try:
+            report(profile, 'index', run_load(index_request, seconds, concurrency))
+            if with_join:
+                report(profile, 'join', run_load(join_request, seconds, concurrency))
+        finally:
+            stop_server(server)
+    if not with_join:
+        print("join skipped (set BENCH_SESSION_COOKIE, BENCH_SCHEDULE_ID and BENCH_SCHEDULE_DATE)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""ワーカー起動時間の内訳（モジュールごとの import 時間と、初回利用時の初期化時間）を表示する
+
+    python benchmarks/startup_profile.py [表示件数]
+
+import 時間は別プロセスで `python -X importtime -c "import app"` を実行して集計する
+（.env の必須環境変数が必要。AWSへの接続は行わない）。
+初期化時間は AWS クライアント・Pillow・テンプレートなど、初回リクエストで作られるものを計測する。
+"""
+import os
+import re
+import sys
+import time
+import subprocess
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+# 自前のモジュール（それ以外はトップレベルのパッケージ単位でまとめる）
+FIRST_PARTY = ('app', 'uguu', 'utils')
+
+_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)')
+
+
+def profile_imports():
+    """-X importtime の出力を [(モジュール名, 自身us, 累積us)] にする"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((m.group(3), int(m.group(1)), int(m.group(2))))
+    if result.returncode != 0:
+        print(result.stderr.splitlines()[-1] if result.stderr else "import app failed")
+    return rows
+
+
+def summarize(rows, limit):
+    total = sum(self_us for _, self_us, _ in rows)
+    first_party = [(name, cum) for name, _, cum in rows if name.split('.')[0] in FIRST_PARTY]
+
+    packages = defaultdict(int)
+    for name, self_us, _ in rows:
+        top = name.split('.')[0]
+        if top not in FIRST_PARTY:
+            packages[top] += self_us
+
+    print(f"total import time: {total / 1000:.0f}ms ({len(rows)} modules)\n")
+    print("first-party modules (cumulative)")
+    for name, cum in sorted(first_party, key=lambda r: -r[1])[:limit]:
+        print(f"  {name:<30} {cum / 1000:8.1f}ms")
+    print("\nthird-party packages (self time)")
+    for name, us in sorted(packages.items(), key=lambda r: -r[1])[:limit]:
+        print(f"  {name:<30} {us / 1000:8.1f}ms")
+
+
+def profile_init():
+    """初回利用時に作られるものの初期化時間"""
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(ROOT, '.env'))
+
+    from utils import aws, dynamo, s3, images
+    steps = [
+        ('boto3 session', aws.get_session),
+        ('dynamodb resource', dynamo.get_dynamodb),
+        ('dynamodb tables', lambda: [dynamo.users_table(), dynamo.schedules_table(), dynamo.posts_table()]),
+        ('s3 client', s3.get_s3_client),
+        ('pillow', images._pil),
+    ]
+    print("\nfirst-use initialization")
+    for label, func in steps:
+        start = time.perf_counter()
+        func()
+        print(f"  {label:<30} {(time.perf_counter() - start) * 1000:8.1f}ms")
+
+
+def main():
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    summarize(profile_imports(), limit)
+    profile_init()
+
+
+if __name__ == "__main__":
+    main()
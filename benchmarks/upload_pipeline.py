@@ -0,0 +1,99 @@
+"""アップロード処理全体（一時保存 → ハッシュ → 検査 → 縮小・エンコード → 保存 → マニフェスト）の
+スループットを AWS なしで計測する
+
+    python benchmarks/upload_pipeline.py [アップロード数] [同時実行数]
+
+保存先は一時ディレクトリの LocalStorage。画像は毎回内容を変えて、重複排除に当たらないようにする。
+段階ごとの所要時間（1スレッドで順に実行）と、同時実行時の uploads/s を表示する。
+"""
+import os
+import sys
+import time
+import tempfile
+import statistics
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import images
+from utils.storage import LocalStorage
+from utils.gallery import list_gallery_objects
+from benchmarks.image_bytes import synthetic_photo
+
+
+def make_uploads(count, width=4032, height=3024):
+    """内容の異なるJPEGをcount枚作る（合成は重いので1枚を元に画素を少しずつ変える）"""
+    base = synthetic_photo(width, height)
+    uploads = []
+    for i in range(count):
+        img = base.copy()
+        img.putpixel((i % width, i // width), (i % 256, 0, 0))
+        buf = BytesIO()
+        img.save(buf, format='JPEG', quality=92)
+        uploads.append(buf.getvalue())
+    return uploads
+
+
+def staged_upload(storage, image_bytes, timings):
+    """process_image と同じ処理を段階ごとに時間を測りながら行う"""
+    def _timed(stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        timings.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    path = _timed('spool', images.spool_upload, BytesIO(image_bytes))
+    try:
+        digest = _timed('digest', images.file_digest, path)
+        _timed('inspect', images.inspect_image, path)
+        derivatives = _timed('render', images.run_in_pool, images.render_derivatives_file, path)
+    finally:
+        os.remove(path)
+    base_key = f"gallery/{digest[:images.CONTENT_KEY_LENGTH]}"
+    manifest = _timed('store', images.store_derivatives, storage, base_key, derivatives)
+    manifest['base_key'] = base_key
+    _timed('manifest', images.write_manifest, storage, manifest)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    uploads = make_uploads(count + 1)
+    print(f"{count} uploads, {statistics.mean(map(len, uploads)) / 1024:.0f} KiB each, "
+          f"{concurrency} threads, {images.IMAGE_POOL_WORKERS} pool workers")
+
+    with tempfile.TemporaryDirectory() as root:
+        storage = LocalStorage(root=root)
+        # 子プロセスの起動時間を計測に含めないよう先に1回処理しておく
+        images.process_image(storage, BytesIO(uploads[-1]), 'warmup')
+
+        timings = {}
+        half = uploads[:count // 2]
+        for image_bytes in half:
+            staged_upload(storage, image_bytes, timings)
+        total = sum(sum(v) for v in timings.values())
+        print("\nstage        mean ms   share")
+        for stage, values in timings.items():
+            print(f"{stage:<10} {statistics.mean(values) * 1000:9.1f}  {sum(values) / total:6.1%}")
+
+        rest = uploads[count // 2:count]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            manifests = list(executor.map(
+                lambda b: images.process_image(storage, BytesIO(b), 'gallery'), rest
+            ))
+        elapsed = time.perf_counter() - start
+        print(f"\nconcurrent {len(rest) / elapsed:6.2f} uploads/s ({elapsed:.1f}s for {len(rest)})")
+
+        start = time.perf_counter()
+        listed = sum(1 for _ in list_gallery_objects(storage))
+        print(f"list       {listed} objects in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        start = time.perf_counter()
+        for manifest in manifests:
+            images.delete_stored(storage, manifest)
+        print(f"delete     {len(manifests)} images in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
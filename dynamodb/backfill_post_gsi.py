@@ -0,0 +1,58 @@
+import boto3
+import os
+import sys
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.dynamo import iter_scan
+
+# .envファイルを読み込む
+load_dotenv()
+
+POSTS_TABLE_NAME = 'posts'
+
+
+def init_table():
+    """
+    posts テーブルを初期化する
+    """
+    dynamodb = boto3.resource(
+        'dynamodb',
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        region_name=os.getenv("AWS_REGION")
+    )
+    return dynamodb.Table(POSTS_TABLE_NAME)
+
+
+def backfill_post_gsi(table):
+    """
+    既存の投稿に投稿者ごとの一覧用キー（GSI1PK/GSI1SK）を追加する
+    """
+    updated = 0
+    items = iter_scan(
+        table.scan,
+        FilterExpression="begins_with(PK, :pk_prefix) AND begins_with(SK, :sk_prefix) AND attribute_not_exists(GSI1PK)",
+        ExpressionAttributeValues={
+            ':pk_prefix': 'POST#',
+            ':sk_prefix': 'METADATA#'
+        }
+    )
+    for item in items:
+        if not item.get('user_id'):
+            continue
+        table.update_item(
+            Key={'PK': item['PK'], 'SK': item['SK']},
+            UpdateExpression='SET GSI1PK = :gpk, GSI1SK = :gsk',
+            ExpressionAttributeValues={
+                ':gpk': f"USER#{item['user_id']}",
+                ':gsk': item.get('created_at', '')
+            }
+        )
+        updated += 1
+
+    print(f"{updated} 件の投稿を更新しました")
+
+
+if __name__ == "__main__":
+    backfill_post_gsi(init_table())
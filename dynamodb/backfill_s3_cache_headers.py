@@ -0,0 +1,98 @@
+import os
+import sys
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.s3 import get_s3_client
+from utils.images import variants_from_keys, IMMUTABLE_CACHE_CONTROL, MANIFEST_CACHE_CONTROL
+
+# .envファイルを読み込む
+load_dotenv()
+
+# 対象のプレフィックス
+PREFIXES = ('gallery/', 'posts/')
+
+# 同時に書き換えるオブジェクト数と、1回にまとめて投入する件数
+WORKERS = int(os.getenv("BACKFILL_WORKERS", "16"))
+BATCH_SIZE = 500
+
+# 旧形式（元のファイル名のまま保存したもの）は同じキーで上書きされうるので短め
+LEGACY_CACHE_CONTROL = 'public, max-age=86400'
+
+
+def cache_control_for(key):
+    """キーの形式から付けるべき Cache-Control を決める"""
+    if key.endswith('/manifest.json'):
+        return MANIFEST_CACHE_CONTROL
+    if variants_from_keys([key], lambda k: k):
+        return IMMUTABLE_CACHE_CONTROL
+    return LEGACY_CACHE_CONTROL
+
+
+def rewrite_metadata(s3, bucket, key, dry_run=False):
+    """Cache-Control / Content-Type が無い（違う）オブジェクトを自分自身へコピーして書き換える
+
+    戻り値: 'updated' / 'skipped' / 'error'
+    """
+    try:
+        head = s3.head_object(Bucket=bucket, Key=key)
+        cache_control = cache_control_for(key)
+        content_type = head.get('ContentType')
+        if not content_type or content_type in ('binary/octet-stream', 'application/octet-stream'):
+            content_type = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+        if head.get('CacheControl') == cache_control and head.get('ContentType') == content_type:
+            return 'skipped'
+        if not dry_run:
+            s3.copy_object(
+                Bucket=bucket,
+                Key=key,
+                CopySource={'Bucket': bucket, 'Key': key},
+                MetadataDirective='REPLACE',
+                Metadata=head.get('Metadata', {}),
+                CacheControl=cache_control,
+                ContentType=content_type
+            )
+        return 'updated'
+    except Exception as e:
+        print(f"Error rewriting {key}: {e}")
+        return 'error'
+
+
+def iter_keys(s3, bucket):
+    paginator = s3.get_paginator('list_objects_v2')
+    for prefix in PREFIXES:
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                if not obj['Key'].endswith('/'):
+                    yield obj['Key']
+
+
+def backfill_cache_headers(dry_run=False):
+    """
+    既存の画像オブジェクトに Cache-Control と Content-Type を付け直す
+
+    BATCH_SIZE 件ずつ一覧を取り、WORKERS 本のスレッドで並行してコピーする。
+    """
+    s3 = get_s3_client()
+    bucket = os.getenv("S3_BUCKET")
+    counts = {'updated': 0, 'skipped': 0, 'error': 0}
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        keys = iter_keys(s3, bucket)
+        while True:
+            batch = [key for _, key in zip(range(BATCH_SIZE), keys)]
+            if not batch:
+                break
+            for result in executor.map(lambda key: rewrite_metadata(s3, bucket, key, dry_run), batch):
+                counts[result] += 1
+            print(f"updated={counts['updated']} skipped={counts['skipped']} error={counts['error']}")
+
+    label = "（dry run）" if dry_run else ""
+    print(f"{counts['updated']} 件のオブジェクトを更新しました{label}")
+
+
+if __name__ == "__main__":
+    backfill_cache_headers(dry_run='--dry-run' in sys.argv)
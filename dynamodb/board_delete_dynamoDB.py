@@ -7,6 +7,9 @@ from botocore.exceptions import ClientError
 import uuid
 from typing import Optional, Dict, Any, List
 from werkzeug.security import generate_password_hash
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.dynamo import iter_scan, iter_scan_pages
 
 def create_app():
     app = Flask(__name__)
@@ -53,36 +56,30 @@ if __name__ == "__main__":
 
     # 掲示板テーブルへのアクセス確認（任意）
     try:
-        response = app.board_table.scan()
-        items = response.get('Items', [])
-        print(f"Found {len(items)} item(s) in board table.")
+        count = sum(page['Count'] for page in iter_scan_pages(app.board_table.scan, Select='COUNT'))
+        print(f"Found {count} item(s) in board table.")
     except ClientError as e:
         print(f"Error scanning board table: {e}")
 
     # registration_date属性を削除する処理
     # ここでは例としてユーザーテーブルの全アイテムをscanして、registration_dateがあれば削除
     try:
-        scan_kwargs = {}
-        while True:
-            response = app.user_table.scan(**scan_kwargs)
-            items = response.get('Items', [])
-            for item in items:
-                if 'registration_date' in item:
-                    # ユーザーテーブルの主キー（例：user_id）を想定
-                    # 実際にはあなたのテーブルで定義されているキーに合わせて修正してください。
-                    user_id = item['user#user_id']
-                    print(f"Removing registration_date from user: {user_id}")
+        items = iter_scan(
+            app.user_table.scan,
+            FilterExpression='attribute_exists(registration_date)',
+            ProjectionExpression='#uid',
+            ExpressionAttributeNames={'#uid': 'user#user_id'}
+        )
+        for item in items:
+            # ユーザーテーブルの主キー（例：user_id）を想定
+            # 実際にはあなたのテーブルで定義されているキーに合わせて修正してください。
+            user_id = item['user#user_id']
+            print(f"Removing registration_date from user: {user_id}")
 
-                    app.user_table.update_item(
-                        Key={'user#user_id': user_id},
-                        UpdateExpression='REMOVE registration_date'
-                    )
-
-            # ページング処理
-            if 'LastEvaluatedKey' in response:
-                scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
-            else:
-                break
+            app.user_table.update_item(
+                Key={'user#user_id': user_id},
+                UpdateExpression='REMOVE registration_date'
+            )
 
     except ClientError as e:
         print(f"Error removing registration_date: {e}")
\ No newline at end of file
@@ -7,6 +7,9 @@ from botocore.exceptions import ClientError
 import uuid
 from typing import Optional, Dict, Any, List
 from werkzeug.security import generate_password_hash
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.dynamo import iter_scan_pages
 
 def create_app():
     app = Flask(__name__)
@@ -52,8 +55,7 @@ if __name__ == "__main__":
     app = create_app()
     # ここでDynamoDBテーブルへのアクセスを試してみる（任意）
     try:
-        response = app.board_table.scan()
-        items = response.get('Items', [])
-        print(f"Found {len(items)} item(s) in board table.")
+        count = sum(page['Count'] for page in iter_scan_pages(app.board_table.scan, Select='COUNT'))
+        print(f"Found {count} item(s) in board table.")
     except ClientError as e:
         print(f"Error scanning board table: {e}")
\ No newline at end of file
@@ -0,0 +1,26 @@
+import os
+import sys
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from uguu.search import SearchIndex, SEARCH_INDEX_PATH, export_posts
+from utils.dynamo import posts_table
+
+# 作り直しはオフラインで行うので、セグメントごとに並行して読む
+SCAN_SEGMENTS = int(os.getenv("SEARCH_BUILD_SEGMENTS", "4"))
+
+# .envファイルを読み込む
+load_dotenv()
+
+
+def build_search_index(path=SEARCH_INDEX_PATH):
+    """
+    postsテーブルをページ単位でエクスポートして検索インデックスを作り直す
+    """
+    index = SearchIndex(path)
+    index.build(export_posts(posts_table(), segments=SCAN_SEGMENTS))
+    print(f"検索インデックスを作成しました: {path}")
+
+
+if __name__ == "__main__":
+    build_search_index(sys.argv[1] if len(sys.argv) > 1 else SEARCH_INDEX_PATH)
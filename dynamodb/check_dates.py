@@ -4,6 +4,9 @@ import boto3
 from dotenv import load_dotenv
 from dateutil import parser
 from datetime import datetime
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.dynamo import iter_scan
 
 # .env ファイルから環境変数を読み込む
 load_dotenv()
@@ -30,8 +33,7 @@ def check_date_formats():
     
     # 全ての投稿を取得
     logger.info("Scanning DynamoDB table for posts...")
-    response = table.scan()
-    posts = response.get('Items', [])
+    posts = list(iter_scan(table.scan))
     
     logger.info(f"Found {len(posts)} posts")
     print("\n=== 日付フォーマットチェック ===")
@@ -2,6 +2,9 @@ import boto3
 import os
 import logging
 from dotenv import load_dotenv
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.dynamo import iter_scan
 
 # .envファイルを読み込む
 load_dotenv()
@@ -32,22 +35,26 @@ def clean_password_hash(table):
     DynamoDB から password_hash フィールドを削除する
     """
     try:
-        # 全データをスキャン
-        response = table.scan()
-        items = response.get('Items', [])
-        logger.info(f"Found {len(items)} items in DynamoDB.")
+        # password_hash が存在する項目だけを全ページ分スキャン
+        items = iter_scan(
+            table.scan,
+            FilterExpression='attribute_exists(password_hash)',
+            ProjectionExpression='#uid',
+            ExpressionAttributeNames={'#uid': 'user#user_id'}
+        )
 
+        removed = 0
         for item in items:
-            # password_hash が存在する場合のみ削除
-            if 'password_hash' in item:
-                user_id = item['user#user_id']
-                logger.info(f"Removing 'password_hash' for user: {user_id}")
-
-                # password_hash を削除
-                table.update_item(
-                    Key={'user#user_id': user_id},
-                    UpdateExpression="REMOVE password_hash"
-                )
+            user_id = item['user#user_id']
+            logger.info(f"Removing 'password_hash' for user: {user_id}")
+
+            # password_hash を削除
+            table.update_item(
+                Key={'user#user_id': user_id},
+                UpdateExpression="REMOVE password_hash"
+            )
+            removed += 1
+        logger.info(f"Removed password_hash from {removed} items.")
 
         logger.info("Cleanup completed successfully.")
     except Exception as e:
@@ -8,6 +8,7 @@ load_dotenv()
 # テーブル名の定義
 POSTS_TABLE_NAME = 'posts'
 FOLLOWS_TABLE_NAME = 'follows'
+FEEDS_TABLE_NAME = 'feeds'
 
 def init_dynamodb():
     """
@@ -111,6 +112,17 @@ def create_follows_table(dynamodb):
                 {'AttributeName': 'followerId', 'AttributeType': 'S'},
                 {'AttributeName': 'followedId', 'AttributeType': 'S'}
             ],
+            # フォロワー一覧の取得（フィード配信）用
+            GlobalSecondaryIndexes=[
+                {
+                    'IndexName': 'followedId-index',
+                    'KeySchema': [
+                        {'AttributeName': 'followedId', 'KeyType': 'HASH'},
+                        {'AttributeName': 'followerId', 'KeyType': 'RANGE'}
+                    ],
+                    'Projection': {'ProjectionType': 'KEYS_ONLY'}
+                }
+            ],
             BillingMode='PAY_PER_REQUEST'
         )
         print(f"テーブル '{FOLLOWS_TABLE_NAME}' を作成中...")
@@ -121,14 +133,44 @@ def create_follows_table(dynamodb):
         print(f"Followsテーブルの作成中にエラーが発生しました: {str(e)}")
         raise
 
+def create_feeds_table(dynamodb):
+    """
+    Feeds テーブル（ホームフィード）を作成し、expires_at での自動削除（TTL）を有効にする
+    """
+    try:
+        table = dynamodb.create_table(
+            TableName=FEEDS_TABLE_NAME,
+            KeySchema=[
+                {'AttributeName': 'PK', 'KeyType': 'HASH'},
+                {'AttributeName': 'SK', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'PK', 'AttributeType': 'S'},
+                {'AttributeName': 'SK', 'AttributeType': 'S'}
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        print(f"テーブル '{FEEDS_TABLE_NAME}' を作成中...")
+        table.meta.client.get_waiter('table_exists').wait(TableName=FEEDS_TABLE_NAME)
+        table.meta.client.update_time_to_live(
+            TableName=FEEDS_TABLE_NAME,
+            TimeToLiveSpecification={'Enabled': True, 'AttributeName': 'expires_at'}
+        )
+        print(f"テーブル '{FEEDS_TABLE_NAME}' が作成されました。")
+        return table
+    except Exception as e:
+        print(f"Feedsテーブルの作成中にエラーが発生しました: {str(e)}")
+        raise
+
 def create_remaining_tables():
     """
-    Posts と Follows テーブルを作成する
+    Posts・Follows・Feeds テーブルを作成する
     """
     try:
         dynamodb = init_dynamodb()
         create_posts_table(dynamodb)
         create_follows_table(dynamodb)
+        create_feeds_table(dynamodb)
         print("全てのテーブルが正常に作成されました。")
     except Exception as e:
         print(f"テーブル作成中にエラーが発生しました: {str(e)}")
@@ -4,6 +4,9 @@ from flask import Flask
 from dotenv import load_dotenv
 from boto3.dynamodb.conditions import Key, Attr
 from botocore.exceptions import ClientError
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.dynamo import iter_scan
 
 # Flask アプリケーションの作成
 def create_app():
@@ -35,14 +38,8 @@ def migrate_data():
         source_table = dynamodb.Table(source_table_name)
         destination_table = dynamodb.Table(destination_table_name)
 
-        # データをスキャン（全件取得）
-        response = source_table.scan()
-        items = response.get('Items', [])
-
-        # ページネーション対応
-        while 'LastEvaluatedKey' in response:
-            response = source_table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-            items.extend(response.get('Items', []))
+        # データをスキャン（全件取得、ページネーションは iter_scan が行う）
+        items = list(iter_scan(source_table.scan))
 
         print(f"移行対象データ: {len(items)} 件")
 
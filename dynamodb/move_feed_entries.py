@@ -0,0 +1,55 @@
+import boto3
+import os
+import sys
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.dynamo import iter_scan
+
+# .envファイルを読み込む
+load_dotenv()
+
+POSTS_TABLE_NAME = 'posts'
+FEEDS_TABLE_NAME = 'feeds'
+
+
+def init_tables():
+    """
+    posts テーブルと feeds テーブルを初期化する
+    """
+    dynamodb = boto3.resource(
+        'dynamodb',
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        region_name=os.getenv("AWS_REGION")
+    )
+    return dynamodb.Table(POSTS_TABLE_NAME), dynamodb.Table(FEEDS_TABLE_NAME)
+
+
+def move_feed_entries(posts, feeds):
+    """
+    posts テーブルに書き込まれていたフィードの項目（FEED#・FANOUT#READ）を整理する
+
+    FANOUT#READ（読み込み時に取得するアカウント）は feeds テーブルに移す。
+    FEED# の項目は古いものしか残っていないので移さずに削除する（新しい投稿は feeds テーブルに配信される）。
+    """
+    items = iter_scan(
+        posts.scan,
+        FilterExpression="begins_with(PK, :feed) OR PK = :fanout",
+        ExpressionAttributeValues={':feed': 'FEED#', ':fanout': 'FANOUT#READ'}
+    )
+    moved = deleted = 0
+    with posts.batch_writer(overwrite_by_pkeys=['PK', 'SK']) as posts_batch, \
+            feeds.batch_writer(overwrite_by_pkeys=['PK', 'SK']) as feeds_batch:
+        for item in items:
+            if item['PK'] == 'FANOUT#READ':
+                feeds_batch.put_item(Item=item)
+                moved += 1
+            posts_batch.delete_item(Key={'PK': item['PK'], 'SK': item['SK']})
+            deleted += 1
+
+    print(f"{moved} 件を feeds テーブルに移し、posts テーブルから {deleted} 件を削除しました")
+
+
+if __name__ == "__main__":
+    move_feed_entries(*init_tables())
@@ -3,6 +3,9 @@ from datetime import datetime
 import uuid
 import os
 from dotenv import load_dotenv
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.dynamo import iter_scan
 
 # .envファイルから環境変数を読み込む
 load_dotenv()
@@ -21,9 +24,12 @@ class ScheduleManager:
     def add_participants_count_to_all_items(self):
         """既存の全スケジュールにparticipants_countを追加"""
         try:
-            # 全ての項目を取得
-            response = self.table.scan()
-            items = response.get('Items', [])
+            # 全ての項目をページごとに取得（キーだけ読めばよい）
+            items = iter_scan(
+                self.table.scan,
+                ProjectionExpression='schedule_id, #date',
+                ExpressionAttributeNames={'#date': 'date'}
+            )
             
             for item in items:
                 self.table.update_item(
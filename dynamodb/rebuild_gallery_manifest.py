@@ -0,0 +1,22 @@
+import os
+import sys
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.gallery import get_gallery_manifest, list_gallery_objects
+from utils.storage import get_storage
+
+# .envファイルを読み込む
+load_dotenv()
+
+
+def rebuild_gallery_manifest():
+    """
+    ストレージの gallery/ 以下を一覧してギャラリーマニフェストを作り直す
+    """
+    storage = get_storage()
+    get_gallery_manifest().rebuild(list_gallery_objects(storage), storage.public_url)
+
+
+if __name__ == "__main__":
+    rebuild_gallery_manifest()
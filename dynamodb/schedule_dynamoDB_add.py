@@ -3,6 +3,9 @@ from datetime import datetime
 import uuid
 import os
 from dotenv import load_dotenv
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.dynamo import iter_scan
 
 # .envファイルから環境変数を読み込む
 load_dotenv()
@@ -46,8 +49,7 @@ class ScheduleManager:
     def get_schedules(self):
         """全てのスケジュールを取得する"""
         try:
-            response = self.table.scan()
-            items = response.get('Items', [])
+            items = list(iter_scan(self.table.scan))
             
             # 見やすく整形して表示
             if items:
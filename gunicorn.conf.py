@@ -0,0 +1,77 @@
+"""gunicorn の設定（gunicorn -c gunicorn.conf.py app:app）
+
+GUNICORN_PROFILE でワーカーの種類を選ぶ。処理時間のほとんどは DynamoDB / S3 の応答待ちなので、
+待っている間に他のリクエストを処理できる gthread を既定にする。
+
+    gthread : ワーカーごとに GUNICORN_THREADS 本のスレッド（既定）
+    gevent  : 協調スレッド（グリーンレット）。同時接続が多い場合向け。pip install gevent が必要
+    sync    : 1ワーカー1リクエスト（以前の gunicorn app:app と同じ）
+
+preload_app でアプリをマスターで1回だけ読み込み、ワーカーは fork して共有する（コピーオンライト）。
+マスターで作った boto3 のセッション・クライアントは fork 後の子プロセスで作り直す
+（utils.aws / utils.dynamo / utils.s3 の os.register_at_fork）。
+"""
+import os
+import multiprocessing
+
+PROFILE = os.getenv("GUNICORN_PROFILE", "gthread")
+if PROFILE not in ('gthread', 'gevent', 'sync'):
+    raise ValueError(f"GUNICORN_PROFILE must be gthread, gevent or sync: {PROFILE}")
+
+if PROFILE == 'gevent':
+    # アプリ（boto3・urllib3・threading）を読み込む前にパッチを当てる
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = os.getenv("GUNICORN_BIND") or f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# メモリはワーカー数に比例するので、CPU数が多くても上限を設ける
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count() * 2 + 1, 4))))
+
+if PROFILE == 'gthread':
+    worker_class = 'gthread'
+    threads = int(os.getenv("GUNICORN_THREADS", "8"))
+elif PROFILE == 'gevent':
+    worker_class = 'gevent'
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "100"))
+    # 同時に DynamoDB を呼ぶグリーンレットの数に合わせて、コネクションプールを広げる
+    os.environ.setdefault("DYNAMODB_MAX_POOL_CONNECTIONS", str(worker_connections))
+else:
+    worker_class = 'sync'
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# 画像処理などでメモリが少しずつ増えても、一定数のリクエストごとにワーカーを入れ替える
+# （jitter で全ワーカーが同時に再起動しないようにする）
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+# 1回の DynamoDB 呼び出しは utils.dynamo の設定で十数秒以内に終わる
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    server.log.info(
+        f"profile={PROFILE} workers={workers} worker_class={worker_class} "
+        f"threads={globals().get('threads', 1)} preload={preload_app} max_requests={max_requests}"
+    )
+
+
+def post_fork(server, worker):
+    server.log.info(f"Worker spawned (pid: {worker.pid}, profile: {PROFILE})")
+
+
+def post_worker_init(worker):
+    # 入れ替わったワーカーはマスターで作った古いキャッシュを引き継ぐので、
+    # リクエストを受け付ける前に作り直し、作り直しスレッドを開始する
+    from utils.warmer import warmer, CACHE_WARMER_ENABLED
+    if not CACHE_WARMER_ENABLED:
+        return
+    from app import app
+    warmer.warm(app)
+    warmer.start(app)
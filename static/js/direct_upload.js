@@ -0,0 +1,76 @@
+// 画像をFlaskを経由せずにストレージへ直接アップロードする
+// form に data-upload-purpose（gallery / post）を付けると有効になる
+async function directUpload(form) {
+    const fileInput = form.querySelector('input[type="file"]');
+    const file = fileInput && fileInput.files[0];
+    if (!file) {
+        return false;  // 画像なしは通常の送信
+    }
+    const purpose = form.dataset.uploadPurpose;
+
+    const presignResponse = await fetch('/uploads/presign', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        credentials: 'same-origin',
+        body: JSON.stringify({content_type: file.type, size: file.size, purpose: purpose})
+    });
+    const presign = await presignResponse.json();
+    if (!presignResponse.ok) {
+        alert(presign.error || 'アップロードに失敗しました');
+        return true;
+    }
+
+    // ストレージへ直接送信（file は最後に追加する必要がある）
+    const body = new FormData();
+    Object.entries(presign.fields).forEach(([name, value]) => body.append(name, value));
+    body.append('file', file);
+    const uploadResponse = await fetch(presign.url, {method: 'POST', body: body});
+    if (!uploadResponse.ok) {
+        alert('アップロードに失敗しました');
+        return true;
+    }
+
+    const contentInput = form.querySelector('[name="content"]');
+    const completeResponse = await fetch('/uploads/complete', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        credentials: 'same-origin',
+        body: JSON.stringify({
+            key: presign.key,
+            purpose: purpose,
+            content: contentInput ? contentInput.value : ''
+        })
+    });
+    const result = await completeResponse.json();
+    if (!completeResponse.ok) {
+        alert(result.error || 'アップロードに失敗しました');
+        return true;
+    }
+    window.location.href = result.redirect;
+    return true;
+}
+
+document.querySelectorAll('form[data-upload-purpose]').forEach((form) => {
+    form.addEventListener('submit', async (event) => {
+        const fileInput = form.querySelector('input[type="file"]');
+        if (!fileInput || !fileInput.files.length) {
+            return;  // 画像なしは通常の送信
+        }
+        event.preventDefault();
+        const button = form.querySelector('button[type="submit"]');
+        if (button) {
+            button.disabled = true;
+        }
+        try {
+            await directUpload(form);
+        } catch (error) {
+            console.error('Error:', error);
+            // 直接アップロードできない場合は従来どおりサーバー経由で送信
+            form.submit();
+        } finally {
+            if (button) {
+                button.disabled = false;
+            }
+        }
+    });
+});
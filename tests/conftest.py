@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# テストでは AWS に接続しない（テーブル名・認証情報はダミー）
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("AWS_REGION", "ap-northeast-1")
+os.environ.setdefault("S3_BUCKET", "test-bucket")
+os.environ.setdefault("TABLE_NAME_USER", "test-users")
+os.environ.setdefault("TABLE_NAME_SCHEDULE", "test-schedules")
+os.environ.setdefault("TABLE_NAME_BOARD", "test-board")
+os.environ.setdefault("CACHE_WARMER", "0")
+
+
+import pytest
+from flask_login import UserMixin
+
+
+class _TestUser(UserMixin):
+    def __init__(self, user_id, display_name='テストユーザー'):
+        self.id = user_id
+        self.display_name = display_name
+        self.user_name = 'test'
+        self.administrator = False
+
+
+@pytest.fixture
+def app(monkeypatch):
+    from app import app
+    monkeypatch.setitem(app.config, 'TESTING', True)
+    # テストクライアントは http で送るので、Secure 属性のクッキーを使わない
+    monkeypatch.setitem(app.config, 'SESSION_COOKIE_SECURE', False)
+    monkeypatch.setattr(app.login_manager, 'session_protection', None)
+    # DynamoDB からユーザーを読まずに、セッションの ID のユーザーとしてログインさせる
+    monkeypatch.setattr(app.login_manager, '_user_callback', lambda user_id: _TestUser(user_id))
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    def _login(user_id='user-1'):
+        with client.session_transaction() as session:
+            session['_user_id'] = user_id
+            session['_fresh'] = True
+        return user_id
+    return _login
@@ -0,0 +1,67 @@
+import io
+import os
+import pytest
+from flask import Flask, request
+from utils import images
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, 'UPLOAD_TMP_DIR', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def upload_app(spool_dir):
+    app = Flask(__name__)
+    images.init_upload_spooling(app)
+    spooled = []
+
+    @app.route('/spool', methods=['POST'])
+    def spool():
+        spooled.append(images.spool_upload(request.files['image'], max_bytes=1024 * 1024))
+        return ''
+
+    @app.route('/ignore', methods=['POST'])
+    def ignore():
+        request.files['image']
+        return ''
+
+    app.spooled = spooled
+    return app
+
+
+def _upload(app, url, data):
+    return app.test_client().post(url, data={'image': (io.BytesIO(data), 'photo.jpg')},
+                                  content_type='multipart/form-data')
+
+
+def test_spool_upload_reuses_request_file(upload_app, spool_dir):
+    data = os.urandom(700 * 1024)
+    assert _upload(upload_app, '/spool', data).status_code == 200
+
+    path, = upload_app.spooled
+    # Werkzeug が書いたファイルをそのまま引き取る（コピーしない）
+    assert os.listdir(spool_dir) == [os.path.basename(path)]
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+
+def test_unclaimed_request_files_are_removed(upload_app, spool_dir):
+    assert _upload(upload_app, '/ignore', b'x' * 1024).status_code == 200
+    assert os.listdir(spool_dir) == []
+
+
+def test_spool_upload_rejects_large_request_file(upload_app, spool_dir):
+    response = _upload(upload_app, '/spool', b'x' * (1024 * 1024 + 1))
+    assert response.status_code == 500
+    assert os.listdir(spool_dir) == []
+
+
+def test_spool_upload_copies_other_streams(spool_dir):
+    path = images.spool_upload(io.BytesIO(b'image bytes'))
+    try:
+        with open(path, 'rb') as f:
+            assert f.read() == b'image bytes'
+    finally:
+        os.remove(path)
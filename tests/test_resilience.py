@@ -0,0 +1,122 @@
+import json
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from utils import resilience
+from utils.call_target import register_call_target
+from utils.metrics import registry
+
+
+class _Raw:
+    def __init__(self, body):
+        self._body = body
+
+    def stream(self, **kwargs):
+        yield self._body
+
+
+class _FakeDynamoDB:
+    """before-send で HTTP 応答を差し替える（DynamoDB には送らない）"""
+
+    def __init__(self):
+        self.responses = []
+        self.sent = 0
+
+    def fail(self, code='InternalServerError', status=500, times=1):
+        body = json.dumps({'__type': f"com.amazonaws.dynamodb.v20120810#{code}", 'message': code})
+        self.responses.extend([(status, body.encode())] * times)
+
+    def succeed(self, body):
+        self.responses.append((200, json.dumps(body).encode()))
+
+    def __call__(self, request, **kwargs):
+        self.sent += 1
+        status, body = self.responses.pop(0)
+        return AWSResponse(request.url, status, {'Content-Type': 'application/x-amz-json-1.0'}, _Raw(body))
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    monkeypatch.setattr(resilience, '_breakers', {})
+    session = boto3.session.Session(
+        aws_access_key_id='testing', aws_secret_access_key='testing', region_name='ap-northeast-1'
+    )
+    register_call_target(session)
+    resilience.register_circuit_breakers(session)
+    client = session.client('dynamodb', config=Config(retries={'total_max_attempts': 1, 'mode': 'standard'}))
+    fake = _FakeDynamoDB()
+    client.meta.events.register('before-send.dynamodb.*', fake)
+    return client, fake
+
+
+def _get_item(client, table='breaker-test'):
+    return client.get_item(TableName=table, Key={'id': {'S': '1'}})
+
+
+def _rejections(table):
+    return registry._values['circuit_rejections_total'].get((table,), 0)
+
+
+def test_breaker_opens_and_short_circuits(dynamodb):
+    client, fake = dynamodb
+    fake.fail(times=resilience.BREAKER_FAILURE_THRESHOLD)
+    for _ in range(resilience.BREAKER_FAILURE_THRESHOLD):
+        with pytest.raises(ClientError):
+            _get_item(client)
+
+    assert resilience.get_breaker('breaker-test').state == 'open'
+    sent, rejected = fake.sent, _rejections('breaker-test')
+
+    # 開いている間は DynamoDB に送らずに失敗する
+    with pytest.raises(resilience.CircuitOpenError):
+        _get_item(client)
+    assert fake.sent == sent
+    assert _rejections('breaker-test') == rejected + 1
+
+
+def test_breaker_records_batch_get_tables(dynamodb):
+    client, fake = dynamodb
+    fake.fail(times=resilience.BREAKER_FAILURE_THRESHOLD)
+    for _ in range(resilience.BREAKER_FAILURE_THRESHOLD):
+        with pytest.raises(ClientError):
+            client.batch_get_item(RequestItems={'batch-test': {'Keys': [{'id': {'S': '1'}}]}})
+
+    assert resilience.get_breaker('batch-test').state == 'open'
+
+
+def test_breaker_is_per_table(dynamodb):
+    client, fake = dynamodb
+    fake.fail(times=resilience.BREAKER_FAILURE_THRESHOLD)
+    for _ in range(resilience.BREAKER_FAILURE_THRESHOLD):
+        with pytest.raises(ClientError):
+            _get_item(client)
+
+    fake.succeed({'Item': {'id': {'S': '1'}}})
+    assert _get_item(client, table='other-table')['Item'] == {'id': {'S': '1'}}
+    assert resilience.get_breaker('other-table').state == 'closed'
+
+
+def test_request_errors_do_not_open_breaker(dynamodb):
+    client, fake = dynamodb
+    fake.fail('ValidationException', status=400, times=resilience.BREAKER_FAILURE_THRESHOLD + 1)
+    for _ in range(resilience.BREAKER_FAILURE_THRESHOLD + 1):
+        with pytest.raises(ClientError):
+            _get_item(client)
+
+    assert resilience.get_breaker('breaker-test').state == 'closed'
+
+
+def test_half_open_probe_closes_breaker(dynamodb, monkeypatch):
+    client, fake = dynamodb
+    fake.fail(times=resilience.BREAKER_FAILURE_THRESHOLD)
+    for _ in range(resilience.BREAKER_FAILURE_THRESHOLD):
+        with pytest.raises(ClientError):
+            _get_item(client)
+
+    breaker = resilience.get_breaker('breaker-test')
+    monkeypatch.setattr(breaker, 'reset_seconds', 0)
+    fake.succeed({'Item': {'id': {'S': '1'}}})
+    _get_item(client)
+    assert breaker.state == 'closed'
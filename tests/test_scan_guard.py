@@ -0,0 +1,56 @@
+import json
+import boto3
+import pytest
+from flask import Flask
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config
+from utils import scan_guard
+from utils.call_target import register_call_target
+
+
+class _Raw:
+    def __init__(self, body):
+        self._body = body
+
+    def stream(self, **kwargs):
+        yield self._body
+
+
+def _scan_response(request, **kwargs):
+    body = json.dumps({'Items': [], 'Count': 0, 'ScannedCount': 3}).encode()
+    return AWSResponse(request.url, 200, {}, _Raw(body))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(scan_guard, 'SCAN_GUARD_MODE', 'raise')
+    session = boto3.session.Session(
+        aws_access_key_id='testing', aws_secret_access_key='testing', region_name='ap-northeast-1'
+    )
+    register_call_target(session)
+    scan_guard.register_scan_guard(session)
+    client = session.client('dynamodb', config=Config(retries={'total_max_attempts': 1}))
+    client.meta.events.register('before-send.dynamodb.*', _scan_response)
+    return client
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+
+    @app.route('/timeline')
+    def timeline():
+        return ''
+
+    return app
+
+
+def test_scan_in_request_names_the_table(client, app):
+    with app.test_request_context('/timeline'):
+        with pytest.raises(scan_guard.ScanInRequestError) as e:
+            client.scan(TableName='scan-table')
+    assert 'Scan in request GET /timeline: table=scan-table pages=1 items_examined=3' in str(e.value)
+
+
+def test_scan_outside_request_is_ignored(client):
+    assert client.scan(TableName='scan-table')['ScannedCount'] == 3
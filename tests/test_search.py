@@ -0,0 +1,75 @@
+import threading
+import pytest
+from uguu.search import SearchIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(str(tmp_path / 'search_index.pkl'))
+    index.build([{'post_id': 'p0', 'content': 'テニスの練習', 'created_at': '2024-01-01'}])
+    return index
+
+
+def test_search_is_not_blocked_while_building(index):
+    exported = threading.Event()
+    resume = threading.Event()
+
+    def _export():
+        yield {'post_id': 'p1', 'content': 'バドミントン大会'}
+        exported.set()
+        # エクスポートが止まっている間（RCU の上限で待っている間）に検索する
+        resume.wait(5)
+        yield {'post_id': 'p2', 'content': 'バドミントン練習'}
+
+    builder = threading.Thread(target=index.build, args=(_export(),))
+    builder.start()
+    try:
+        assert exported.wait(5)
+        searched = []
+        searcher = threading.Thread(target=lambda: searched.append(index.search('テニス')))
+        searcher.start()
+        searcher.join(1)
+        assert searched == [(['p0'], 1)]
+    finally:
+        resume.set()
+        builder.join(5)
+
+    assert sorted(index.search('バドミントン')[0]) == ['p1', 'p2']
+    assert index.search('テニス') == ([], 0)
+
+
+def _saved(index):
+    saved = SearchIndex(index.path)
+    assert saved.load()
+    return saved
+
+
+def test_changes_during_build_are_kept(index):
+    def _export():
+        yield {'post_id': 'p1', 'content': 'バドミントン大会'}
+        # エクスポートがキーを通り過ぎた後の追加・削除
+        index._building = True
+        index.add_post('p3', 'バドミントン合宿')
+        index.remove_post('p1')
+        index._building = False
+        yield {'post_id': 'p2', 'content': 'バドミントン練習'}
+
+    index.build(_export())
+
+    assert sorted(index.search('バドミントン')[0]) == ['p2', 'p3']
+    assert sorted(_saved(index).search('バドミントン')[0]) == ['p2', 'p3']
+
+
+def test_changes_before_the_index_file_exists_are_merged(tmp_path):
+    path = str(tmp_path / 'search_index.pkl')
+    other = SearchIndex(path)
+    # 別のワーカーが構築を終える前に受け付けた投稿
+    other.add_post('p9', 'バドミントンの試合')
+    other.save()
+
+    builder = SearchIndex(path)
+    builder.build([{'post_id': 'p1', 'content': 'バドミントン大会'}])
+    other.save()
+
+    assert sorted(other.search('バドミントン')[0]) == ['p1', 'p9']
+    assert sorted(_saved(builder).search('バドミントン')[0]) == ['p1', 'p9']
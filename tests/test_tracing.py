@@ -0,0 +1,60 @@
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config
+from utils.call_target import register_call_target
+from utils.metrics import registry
+from utils.tracing import register_botocore_hooks
+
+
+class _Raw:
+    def __init__(self, body):
+        self._body = body
+
+    def stream(self, **kwargs):
+        yield self._body
+
+
+def _respond(body):
+    def _send(request, **kwargs):
+        return AWSResponse(request.url, 200, {}, _Raw(body))
+    return _send
+
+
+@pytest.fixture
+def session():
+    session = boto3.session.Session(
+        aws_access_key_id='testing', aws_secret_access_key='testing', region_name='ap-northeast-1'
+    )
+    register_call_target(session)
+    register_botocore_hooks(session)
+    return session
+
+
+def _calls(service, operation, target):
+    return registry._values['backend_calls_total'].get((service, operation, target), 0)
+
+
+def test_dynamodb_calls_are_labelled_with_table(session):
+    client = session.client('dynamodb', config=Config(retries={'total_max_attempts': 1}))
+    client.meta.events.register('before-send.dynamodb.*', _respond(b'{}'))
+    before = _calls('dynamodb', 'GetItem', 'trace-table')
+
+    client.get_item(TableName='trace-table', Key={'id': {'S': '1'}})
+    client.batch_get_item(RequestItems={
+        'trace-b': {'Keys': [{'id': {'S': '1'}}]},
+        'trace-a': {'Keys': [{'id': {'S': '1'}}]}
+    })
+
+    assert _calls('dynamodb', 'GetItem', 'trace-table') == before + 1
+    assert _calls('dynamodb', 'BatchGetItem', 'trace-a,trace-b') >= 1
+
+
+def test_s3_calls_are_labelled_with_bucket(session):
+    client = session.client('s3', config=Config(retries={'total_max_attempts': 1}))
+    client.meta.events.register('before-send.s3.*', _respond(b''))
+    before = _calls('s3', 'DeleteObject', 'trace-bucket')
+
+    client.delete_object(Bucket='trace-bucket', Key='gallery/a.webp')
+
+    assert _calls('s3', 'DeleteObject', 'trace-bucket') == before + 1
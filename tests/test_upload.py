@@ -0,0 +1,42 @@
+import pytest
+from utils import storage as storage_module
+from utils.storage import LocalStorage
+
+
+@pytest.fixture
+def local_storage(tmp_path, monkeypatch):
+    storage = LocalStorage(root=str(tmp_path))
+    monkeypatch.setattr(storage_module, '_storage', storage)
+    return storage
+
+
+@pytest.mark.parametrize('size', ['abc', '1.5', 1.5, None, True, [1]])
+def test_presign_rejects_invalid_size(client, login, local_storage, size):
+    login()
+    response = client.post('/uploads/presign', json={
+        'content_type': 'image/jpeg', 'size': size, 'purpose': 'post'
+    })
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_presign_accepts_numeric_size(client, login, local_storage):
+    user_id = login()
+    response = client.post('/uploads/presign', json={
+        'content_type': 'image/jpeg', 'size': '1024', 'purpose': 'post'
+    })
+    assert response.status_code == 200
+    assert response.get_json()['key'].startswith(f"incoming/post/{user_id}/")
+
+
+def test_local_file_does_not_serve_incoming_uploads(client, local_storage):
+    local_storage.put('incoming/post/user-1/original', b'raw image with exif', content_type='image/jpeg')
+    assert client.get('/uploads/local/incoming/post/user-1/original').status_code == 404
+
+
+def test_local_file_serves_published_images(client, local_storage):
+    local_storage.put('posts/abc/w480.webp', b'derivative', content_type='image/webp')
+    response = client.get('/uploads/local/posts/abc/w480.webp')
+    assert response.status_code == 200
+    assert response.data == b'derivative'
+    assert 'immutable' in response.headers['Cache-Control']
@@ -0,0 +1,47 @@
+import pytest
+import app as app_module
+
+
+class _UsersTable:
+    def __init__(self, users):
+        self.users = users
+
+    def get_item(self, Key):
+        user = self.users.get(Key['user#user_id'])
+        return {'Item': user} if user else {}
+
+
+@pytest.fixture
+def profile(monkeypatch):
+    users = {
+        'user-2': {'user#user_id': 'user-2', 'display_name': '山田', 'organization': 'other',
+                   'badminton_experience': '3年', 'followers_count': 4, 'following_count': 1}
+    }
+    posts = [{'post_id': 'p1', 'user_id': 'user-2', 'content': '練習しました',
+              'created_at': '2024-05-01T09:30:15.123456'}]
+    pages = {None: (posts, 'cursor-2'), 'cursor-2': ([], None)}
+    monkeypatch.setattr(app_module, 'users_table', lambda: _UsersTable(users))
+    monkeypatch.setattr(app_module.uguu_db, 'get_user_posts_page',
+                        lambda user_id, limit=20, cursor=None: pages[cursor])
+    monkeypatch.setattr(app_module.uguu_db, 'is_following', lambda follower_id, followed_id: False)
+
+
+def test_user_profile_renders_posts_and_pagination(client, profile):
+    response = client.get('/user/user-2')
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    assert '練習しました' in html
+    assert '2024/05/01 09:30' in html
+    assert '/user/user-2?cursor=cursor-2' in html
+    assert 'もっと見る' in html
+
+    response = client.get('/user/user-2?cursor=cursor-2')
+    assert response.status_code == 200
+    assert 'もっと見る' not in response.get_data(as_text=True)
+
+
+def test_user_profile_shows_follow_form(client, login, profile):
+    login('user-1')
+    html = client.get('/user/user-2').get_data(as_text=True)
+    assert '/uguu/follow/user-2' in html
+    assert 'フォローする' in html
@@ -1,64 +1,121 @@
-import boto3
 import os
+import time
+import itertools
 from datetime import datetime
 import uuid
+import json
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from .search import search_index
+from utils.dynamo import get_dynamodb, posts_table, users_table, follows_table, feeds_table
+from utils.dynamo import scan_plain, batch_get_plain, POST_FIELDS, USER_SUMMARY_FIELDS
+from utils.resilience import mark_stale
+
+
+# フォロワー数がこの値を超えるアカウントは書き込み時に配信せず、読み込み時に取得する
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv("FEED_FANOUT_MAX_FOLLOWERS", "1000"))
+
+# フィードの項目は feeds テーブルの TTL（expires_at）でこの日数後に削除される。
+# ホームフィードは新しい順に1ページ分しか読まないので、古い項目は残しておく必要がない
+FEED_ENTRY_TTL_DAYS = int(os.getenv("FEED_ENTRY_TTL_DAYS", "30"))
+
+# フォロー中ユーザー一覧などのキャッシュ有効期限（秒）
+FOLLOW_CACHE_TIMEOUT = 60
+
+# ユーザーごとの投稿一覧（1ページ目）のキャッシュ有効期限（秒）
+USER_POSTS_CACHE_TIMEOUT = 300
+
+# タイムライン（1ページ目）のキャッシュ有効期限（秒）。期限前に utils.warmer が作り直す
+TIMELINE_CACHE_TIMEOUT = 60
+
+# フィードへの書き込みはリクエストを待たせないようにバックグラウンドで実行
+_fanout_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='feed-fanout')
 
 
 class DynamoDB:
     def __init__(self):
-        self.dynamodb = boto3.resource(
-            'dynamodb',
-            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-            region_name=os.getenv("AWS_REGION")
+        # {key: (有効期限, 値)}
+        self._local_cache = {}
+
+    # リソースとテーブルは utils.dynamo で共有し、初回アクセス時に作る（import 時には接続しない）
+
+    @property
+    def dynamodb(self):
+        return get_dynamodb()
+
+    @property
+    def posts_table(self):
+        return posts_table()
+
+    @property
+    def users_table(self):
+        return users_table()
+
+    @property
+    def follows_table(self):
+        return follows_table()
+
+    @property
+    def feeds_table(self):
+        # フィードの項目はフォロワー数分作られるので、posts テーブルのスキャンに含めないよう別テーブルにする
+        return feeds_table()
+
+
+    def _load_posts(self, limit=20):
+        """最新の投稿を表示名付きで取得（失敗時は例外）"""
+        # 表示用なので低レベルクライアントで読み、数値は Decimal ではなく int にする
+        posts = scan_plain(
+            self.posts_table.name, POST_FIELDS,
+            "begins_with(PK, :pk_prefix) AND begins_with(SK, :sk_prefix)",
+            {':pk_prefix': {'S': 'POST#'}, ':sk_prefix': {'S': 'METADATA#'}}
         )
-        self.posts_table = self.dynamodb.Table('posts')
-        self.users_table = self.dynamodb.Table('bad-users')
+        if not posts:
+            print("No posts found.")
+            return []
+
+        # 投稿者の表示名を一括で付与
+        self._attach_user_info(posts)
 
+        return sorted(posts, key=lambda x: x.get('created_at', ''), reverse=True)[:limit]
 
     def get_posts(self, limit=20):
         try:
             print("Attempting to get posts...")
-            
-            response = self.posts_table.scan(
-                FilterExpression="begins_with(PK, :pk_prefix) AND begins_with(SK, :sk_prefix)",
-                ExpressionAttributeValues={
-                    ':pk_prefix': 'POST#',
-                    ':sk_prefix': 'METADATA#'
-                }
-            )
-            
-            posts = response.get('Items', [])
-            if not posts:
-                print("No posts found.")
-                return []
 
-            # 各投稿にユーザー情報を追加
-            for post in posts:
-                user_id = post.get('user_id')
-                if user_id:
-                    try:
-                            # ユーザーIDのフォーマットを修正
-                        user_response = self.users_table.get_item(
-                            Key={
-                                'user#user_id': user_id  # テーブルの設定に合わせて修正
-                            }
-                        )
-                        user = user_response.get('Item', {})
-                        post['display_name'] = user.get('display_name', '名前なし')
-                        post['user_name'] = user.get('user_name', 'unknown')
-                    except Exception as e:
-                        print(f"Error getting user data: {str(e)}")
-                        post['display_name'] = '名前なし'
-                        post['user_name'] = 'unknown'
-
-            return sorted(posts, key=lambda x: x.get('created_at', ''), reverse=True)[:limit]
+            cached = self._cache_get(('timeline', limit))
+            if cached is None:
+                try:
+                    cached = self.refresh_timeline(limit)
+                except Exception as e:
+                    # 読み直せない間は、期限切れでも前回のタイムラインを返す
+                    entry = self._local_cache.get(('timeline', limit))
+                    if entry is None:
+                        raise
+                    print(f"Serving stale timeline: {e}")
+                    mark_stale('timeline')
+                    cached = entry[1]
+            # 閲覧者ごとに is_liked_by_user を付けるので、キャッシュの辞書はコピーして渡す
+            return [dict(post) for post in cached]
 
         except Exception as e:
             print(f"Error getting posts: {e}")
             return []
 
-    def create_post(self, user_id, content, image_url=None):
+    def refresh_timeline(self, limit=20):
+        """タイムラインの1ページ目を読み直してキャッシュを入れ替える（失敗時は例外で、古い値は残る）"""
+        posts = self._load_posts(limit)
+        self._cache_set(('timeline', limit), posts, timeout=TIMELINE_CACHE_TIMEOUT)
+        return posts
+
+    def invalidate_timeline(self):
+        """タイムラインのキャッシュを破棄"""
+        for key in list(self._local_cache):
+            if key[0] == 'timeline':
+                self._local_cache.pop(key, None)
+
+    def create_post(self, user_id, content, image_url=None, image_status=None):
         """新規投稿を作成"""
         try:
             post_id = str(uuid.uuid4())
@@ -71,36 +128,109 @@ class DynamoDB:
                 'user_id': user_id,
                 'content': content,
                 'image_url': image_url,
+                'image_status': image_status,  # 'pending' の間は画像をアップロード中
                 'created_at': timestamp,
-                'updated_at': timestamp
+                'updated_at': timestamp,
+                # 投稿者ごとの投稿一覧用（GSI1）
+                'GSI1PK': f"USER#{user_id}",
+                'GSI1SK': timestamp
             }
             print(f"Post data: {post}")  # デバッグログ
             
             self.posts_table.put_item(Item=post)
             print("Post created successfully in DynamoDB")
+
+            # 投稿者の投稿一覧とタイムラインのキャッシュを破棄
+            self.invalidate_user_posts(user_id)
+            self.invalidate_timeline()
+
+            # 検索インデックスに追加
+            search_index.add_post(post_id, content, timestamp)
+
+            # フォロワーのフィードへ配信
+            _fanout_executor.submit(self._fan_out_post, post)
             return post
             
         except Exception as e:
             print(f"DynamoDB Error: {str(e)}")
             raise
 
+    def get_post(self, post_id):
+        """投稿を1件取得"""
+        try:
+            response = self.posts_table.get_item(
+                Key={
+                    'PK': f"POST#{post_id}",
+                    'SK': f"METADATA#{post_id}"
+                }
+            )
+            return response.get('Item')
+        except Exception as e:
+            print(f"Error getting post: {e}")
+            return None
+
     def update_post(self, post_id, content):
         """投稿を更新"""
         try:
             timestamp = datetime.now().isoformat()
-            self.posts_table.update_item(
-                Key={'post_id': post_id},
+            response = self.posts_table.update_item(
+                Key={
+                    'PK': f"POST#{post_id}",
+                    'SK': f"METADATA#{post_id}"
+                },
                 UpdateExpression='SET content = :content, updated_at = :updated_at',
                 ExpressionAttributeValues={
                     ':content': content,
                     ':updated_at': timestamp
-                }
+                },
+                ReturnValues='ALL_NEW'
             )
+            updated = response.get('Attributes', {})
+            if updated.get('user_id'):
+                self.invalidate_user_posts(updated['user_id'])
+            self.invalidate_timeline()
+            search_index.add_post(post_id, content, updated.get('created_at', ''))
             return True
         except Exception as e:
             print(f"Error updating post: {e}")
             raise
 
+    def attach_post_image(self, post_id, user_id, manifest):
+        """バックグラウンドで処理した画像（派生画像のマニフェスト）を投稿に反映"""
+        try:
+            if manifest:
+                update_expression = ('SET image_url = :url, image_variants = :variants, '
+                                     'image_status = :status, updated_at = :updated_at')
+                values = {
+                    ':url': manifest['url'],
+                    ':variants': [
+                        {k: v[k] for k in ('url', 'width', 'height', 'format') if k in v}
+                        for v in manifest['variants']
+                    ],
+                    ':status': 'ready'
+                }
+                if manifest.get('digest'):
+                    # 共有している画像の参照（utils.image_refs）を後から辿れるようにする
+                    update_expression += ', image_digest = :digest'
+                    values[':digest'] = manifest['digest']
+            else:
+                update_expression = 'SET image_status = :status, updated_at = :updated_at'
+                values = {':status': 'failed'}
+            values[':updated_at'] = datetime.now().isoformat()
+
+            self.posts_table.update_item(
+                Key={
+                    'PK': f"POST#{post_id}",
+                    'SK': f"METADATA#{post_id}"
+                },
+                UpdateExpression=update_expression,
+                ExpressionAttributeValues=values
+            )
+            self.invalidate_user_posts(user_id)
+            self.invalidate_timeline()
+        except Exception as e:
+            print(f"Error attaching post image: {e}")
+
     def create_posts_table(self):
         """postsテーブルが存在しない場合は作成"""
         try:
@@ -200,10 +330,20 @@ class DynamoDB:
                     ':inc': increment
                 }
             )
+            # いいねのたびにタイムラインを読み直さないよう、キャッシュ内の件数だけ更新する
+            self._adjust_cached_likes(post_id, increment)
         except Exception as e:
             print(f"Error updating likes count: {e}")
             raise
 
+    def _adjust_cached_likes(self, post_id, increment):
+        for key, (_, posts) in list(self._local_cache.items()):
+            if key[0] != 'timeline':
+                continue
+            for post in posts:
+                if post.get('post_id') == post_id:
+                    post['likes_count'] = post.get('likes_count', 0) + increment
+
     def get_likes_count(self, post_id):
         """投稿のいいね数を取得"""
         try:
@@ -232,5 +372,302 @@ class DynamoDB:
             print(f"Error checking like status: {e}")
             return False
 
+    # ---- フォロー ----
+
+    def _cache_get(self, key):
+        entry = self._local_cache.get(key)
+        if entry and entry[0] > time.time():
+            return entry[1]
+        return None
+
+    def _cache_set(self, key, value, timeout=FOLLOW_CACHE_TIMEOUT):
+        self._local_cache[key] = (time.time() + timeout, value)
+
+    def follow_user(self, follower_id, followed_id):
+        """ユーザーをフォロー"""
+        if follower_id == followed_id:
+            return False
+        try:
+            self.follows_table.put_item(
+                Item={
+                    'followerId': follower_id,
+                    'followedId': followed_id,
+                    'created_at': datetime.now().isoformat()
+                },
+                ConditionExpression='attribute_not_exists(followedId)'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return True  # 既にフォロー済み
+            print(f"Error following user: {e}")
+            raise
+
+        self._update_follow_counts(follower_id, followed_id, 1)
+        self._local_cache.pop(('following', follower_id), None)
+
+        # フォローしたユーザーの最近の投稿をフィードに取り込む
+        _fanout_executor.submit(self._backfill_feed, follower_id, followed_id)
+        return True
+
+    def unfollow_user(self, follower_id, followed_id):
+        """フォローを解除"""
+        try:
+            self.follows_table.delete_item(
+                Key={'followerId': follower_id, 'followedId': followed_id},
+                ConditionExpression='attribute_exists(followedId)'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False  # フォローしていない
+            print(f"Error unfollowing user: {e}")
+            raise
+
+        self._update_follow_counts(follower_id, followed_id, -1)
+        self._local_cache.pop(('following', follower_id), None)
+        return False
+
+    def toggle_follow(self, follower_id, followed_id):
+        """フォロー/フォロー解除を切り替え、切り替え後のフォロー状態を返す"""
+        if self.is_following(follower_id, followed_id):
+            return self.unfollow_user(follower_id, followed_id)
+        return self.follow_user(follower_id, followed_id)
+
+    def is_following(self, follower_id, followed_id):
+        """フォローしているか確認"""
+        return followed_id in self.get_following_ids(follower_id)
+
+    def _update_follow_counts(self, follower_id, followed_id, increment):
+        """ユーザーテーブルのフォロー数・フォロワー数を更新"""
+        try:
+            self.users_table.update_item(
+                Key={'user#user_id': follower_id},
+                UpdateExpression='ADD following_count :inc',
+                ExpressionAttributeValues={':inc': increment}
+            )
+            self.users_table.update_item(
+                Key={'user#user_id': followed_id},
+                UpdateExpression='ADD followers_count :inc',
+                ExpressionAttributeValues={':inc': increment}
+            )
+        except Exception as e:
+            print(f"Error updating follow counts: {e}")
+
+    def get_following_ids(self, user_id):
+        """フォロー中のユーザーIDの集合を取得"""
+        cached = self._cache_get(('following', user_id))
+        if cached is not None:
+            return cached
+
+        following = set()
+        kwargs = {'KeyConditionExpression': Key('followerId').eq(user_id)}
+        while True:
+            response = self.follows_table.query(**kwargs)
+            following.update(item['followedId'] for item in response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        self._cache_set(('following', user_id), following)
+        return following
+
+    def iter_follower_ids(self, user_id):
+        """フォロワーのユーザーIDを順に返す（followedId-indexをページング）"""
+        kwargs = {
+            'IndexName': 'followedId-index',
+            'KeyConditionExpression': Key('followedId').eq(user_id)
+        }
+        while True:
+            response = self.follows_table.query(**kwargs)
+            for item in response.get('Items', []):
+                yield item['followerId']
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _get_followers_count(self, user_id):
+        response = self.users_table.get_item(
+            Key={'user#user_id': user_id},
+            ProjectionExpression='followers_count'
+        )
+        return int(response.get('Item', {}).get('followers_count', 0))
+
+    # ---- ホームフィード ----
+
+    @staticmethod
+    def _feed_entry(owner_id, post):
+        return {
+            'PK': f"FEED#{owner_id}",
+            'SK': f"POST#{post['created_at']}#{post['post_id']}",
+            'post_id': post['post_id'],
+            'author_id': post['user_id'],
+            'created_at': post['created_at'],
+            'expires_at': int(time.time()) + FEED_ENTRY_TTL_DAYS * 86400
+        }
+
+    def _fan_out_post(self, post):
+        """投稿を投稿者本人とフォロワーのフィードに書き込む（バックグラウンド実行）"""
+        try:
+            author_id = post['user_id']
+            if self._get_followers_count(author_id) > FEED_FANOUT_MAX_FOLLOWERS:
+                # フォロワーが多すぎる場合は読み込み時に取得する
+                self._mark_fanout_on_read(author_id)
+                targets = [author_id]
+            else:
+                targets = itertools.chain([author_id], self.iter_follower_ids(author_id))
+
+            # batch_writerが25件ずつまとめて書き込む
+            with self.feeds_table.batch_writer(overwrite_by_pkeys=['PK', 'SK']) as batch:
+                for owner_id in targets:
+                    batch.put_item(Item=self._feed_entry(owner_id, post))
+        except Exception as e:
+            print(f"Error fanning out post {post.get('post_id')}: {e}")
+
+    def _backfill_feed(self, follower_id, followed_id, limit=20):
+        """フォローしたユーザーの最近の投稿をフォロワーのフィードに書き込む"""
+        try:
+            posts = self._query_author_posts(followed_id, limit)
+            with self.feeds_table.batch_writer(overwrite_by_pkeys=['PK', 'SK']) as batch:
+                for post in posts:
+                    batch.put_item(Item=self._feed_entry(follower_id, post))
+        except Exception as e:
+            print(f"Error backfilling feed: {e}")
+
+    def _mark_fanout_on_read(self, author_id):
+        self.feeds_table.put_item(Item={'PK': 'FANOUT#READ', 'SK': f"USER#{author_id}", 'user_id': author_id})
+        self._local_cache.pop(('fanout_on_read',), None)
+
+    def get_fanout_on_read_authors(self):
+        """読み込み時に取得するアカウントのIDの集合"""
+        cached = self._cache_get(('fanout_on_read',))
+        if cached is not None:
+            return cached
+
+        response = self.feeds_table.query(KeyConditionExpression=Key('PK').eq('FANOUT#READ'))
+        authors = {item['user_id'] for item in response.get('Items', [])}
+        self._cache_set(('fanout_on_read',), authors)
+        return authors
+
+    def _query_author_posts(self, author_id, limit=20):
+        """投稿者の投稿を新しい順に取得（GSI1）"""
+        response = self.posts_table.query(
+            IndexName='GSI1',
+            KeyConditionExpression=Key('GSI1PK').eq(f"USER#{author_id}"),
+            ScanIndexForward=False,
+            Limit=limit
+        )
+        return response.get('Items', [])
+
+    def _batch_get_posts(self, post_ids):
+        """投稿のメタデータを一括取得（読み残しはバックオフ付きで読み直す）"""
+        posts = batch_get_plain(
+            self.posts_table.name, 'post_id', post_ids, POST_FIELDS,
+            key=lambda pid: {'PK': f"POST#{pid}", 'SK': f"METADATA#{pid}"}
+        )
+        return list(posts.values())
+
+    def _attach_user_info(self, posts):
+        """投稿に投稿者の表示名を一括で付与"""
+        user_ids = [post['user_id'] for post in posts if post.get('user_id')]
+        users = batch_get_plain(self.users_table.name, 'user#user_id', user_ids, USER_SUMMARY_FIELDS)
+
+        for post in posts:
+            user = users.get(post.get('user_id'), {})
+            post['display_name'] = user.get('display_name', '名前なし')
+            post['user_name'] = user.get('user_name', 'unknown')
+        return posts
+
+    # ---- ユーザーごとの投稿一覧 ----
+
+    @staticmethod
+    def _encode_cursor(last_key):
+        if not last_key:
+            return None
+        return base64.urlsafe_b64encode(json.dumps(last_key).encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        if not cursor:
+            return None
+        try:
+            return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except ValueError:
+            return None
+
+    def get_user_posts_page(self, user_id, limit=20, cursor=None):
+        """ユーザーの投稿を新しい順に1ページ分取得し、(投稿, 次ページのカーソル)を返す"""
+        cache_key = ('user_posts', user_id, limit)
+        if cursor is None:
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return cached
+
+        kwargs = {
+            'IndexName': 'GSI1',
+            'KeyConditionExpression': Key('GSI1PK').eq(f"USER#{user_id}"),
+            'ScanIndexForward': False,
+            'Limit': limit
+        }
+        start_key = self._decode_cursor(cursor)
+        if start_key:
+            kwargs['ExclusiveStartKey'] = start_key
+
+        response = self.posts_table.query(**kwargs)
+        posts = self._attach_user_info(response.get('Items', []))
+        page = (posts, self._encode_cursor(response.get('LastEvaluatedKey')))
+
+        # 1ページ目のみキャッシュする
+        if cursor is None:
+            self._cache_set(cache_key, page, timeout=USER_POSTS_CACHE_TIMEOUT)
+        return page
+
+    def get_user_posts(self, user_id, limit=20):
+        """ユーザーの最新の投稿を取得"""
+        try:
+            posts, _ = self.get_user_posts_page(user_id, limit)
+            return posts
+        except Exception as e:
+            print(f"Error getting user posts: {e}")
+            return []
+
+    def invalidate_user_posts(self, user_id):
+        """ユーザーの投稿一覧キャッシュを破棄"""
+        for key in list(self._local_cache):
+            if key[0] == 'user_posts' and key[1] == user_id:
+                self._local_cache.pop(key, None)
+
+    def get_posts_by_ids(self, post_ids):
+        """指定したIDの投稿を表示名付きで取得（post_idsの順に並べる）"""
+        posts = {p['post_id']: p for p in self._attach_user_info(self._batch_get_posts(post_ids))}
+        return [posts[pid] for pid in post_ids if pid in posts]
+
+    def get_home_feed(self, user_id, limit=20):
+        """フォロー中ユーザーと自分の投稿を新しい順に取得"""
+        try:
+            following = self.get_following_ids(user_id)
+            allowed = following | {user_id}
+
+            # 書き込み時に配信されたフィードはパーティション1回のクエリで取得
+            response = self.feeds_table.query(
+                KeyConditionExpression=Key('PK').eq(f"FEED#{user_id}"),
+                ScanIndexForward=False,
+                Limit=limit
+            )
+            # フォロー解除済みユーザーの投稿は除外
+            post_ids = [
+                entry['post_id'] for entry in response.get('Items', [])
+                if entry.get('author_id') in allowed
+            ]
+
+            # フォロワーの多いアカウントは読み込み時に取得
+            for author_id in self.get_fanout_on_read_authors() & following:
+                post_ids.extend(p['post_id'] for p in self._query_author_posts(author_id, limit))
+
+            posts = self.get_posts_by_ids(post_ids)
+            return sorted(posts, key=lambda x: x.get('created_at', ''), reverse=True)[:limit]
+
+        except Exception as e:
+            print(f"Error getting home feed: {e}")
+            return []
+
 # インスタンスを作成
 db = DynamoDB()
\ No newline at end of file
@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import render_template
+from markupsafe import Markup
+
+
+# キャッシュする投稿カードの最大数（古いものから破棄）
+POST_CARD_CACHE_SIZE = 500
+
+# キャッシュしたHTML内の、閲覧者ごとに差し替える箇所
+# 投稿本文はエスケープされ " を含まないため、属性ごと一致させれば本文と衝突しない
+LIKED_PLACEHOLDER = 'class="__LIKED_CLASS__ '
+
+
+class PostCardCache:
+    """投稿カードの描画結果を post_id + updated_at + likes_count をキーに保持する"""
+
+    def __init__(self, max_size=POST_CARD_CACHE_SIZE):
+        self.max_size = max_size
+        self._cards = OrderedDict()
+        self._lock = threading.Lock()
+        # キャッシュミス時の平均描画時間（秒）。短縮時間の見積もりに使う
+        self._avg_render_time = 0.0
+        self._renders = 0
+
+    @staticmethod
+    def _key(post):
+        # 表示名の変更も反映されるよう、カードに出す投稿者の情報もキーに含める
+        return (post.get('post_id'), post.get('updated_at'), str(post.get('likes_count', 0)),
+                post.get('display_name'))
+
+    def _get(self, key):
+        with self._lock:
+            html = self._cards.get(key)
+            if html is not None:
+                self._cards.move_to_end(key)
+            return html
+
+    def _set(self, key, html, elapsed):
+        with self._lock:
+            self._cards[key] = html
+            self._cards.move_to_end(key)
+            while len(self._cards) > self.max_size:
+                self._cards.popitem(last=False)
+            self._renders += 1
+            self._avg_render_time += (elapsed - self._avg_render_time) / self._renders
+
+    def render(self, posts):
+        """投稿カードを描画し、(カードのリスト, 統計)を返す"""
+        cards = []
+        hits = misses = 0
+        render_time = 0.0
+
+        for post in posts:
+            key = self._key(post)
+            html = self._get(key)
+            if html is None:
+                misses += 1
+                start = time.perf_counter()
+                html = render_template('uguu/_post_card.html', post=post)
+                elapsed = time.perf_counter() - start
+                render_time += elapsed
+                self._set(key, html, elapsed)
+            else:
+                hits += 1
+
+            # いいね状態はキャッシュに含めず、ここで差し替える
+            liked_class = 'fas' if post.get('is_liked_by_user') else 'far'
+            cards.append(Markup(html.replace(LIKED_PLACEHOLDER, f'class="{liked_class} ', 1)))
+
+        stats = {
+            'hits': hits,
+            'misses': misses,
+            'render_ms': render_time * 1000,
+            'saved_ms': hits * self._avg_render_time * 1000
+        }
+        return cards, stats
+
+    def clear(self):
+        with self._lock:
+            self._cards.clear()
+
+
+post_card_cache = PostCardCache()
+
+
+def render_post_cards(posts):
+    """タイムライン用の投稿カードを描画"""
+    cards, stats = post_card_cache.render(posts)
+    print(f"Post cards: {stats['hits']} hits / {stats['misses']} misses, "
+          f"rendered {stats['render_ms']:.1f}ms, saved ~{stats['saved_ms']:.1f}ms")
+    return cards
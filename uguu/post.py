@@ -1,7 +1,9 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import current_user, login_required
 from .dynamo import db
-from utils.s3 import upload_image_to_s3
+import os
+from utils.s3 import spool_image, enqueue_image_upload
+from utils.images import ImageTooLarge
 
 post = Blueprint('post', __name__)
 
@@ -12,41 +14,63 @@ def create_post():
         content = request.form.get('content')
         image = request.files.get('image')  # 画像ファイルを取得        
         
+        image_path = None
         try:
-            # 画像がアップロードされた場合、S3にアップロード
-            image_url = None
-            if image:
-                image_url = upload_image_to_s3(image)                
-            
-            # DynamoDBに保存（画像URLも含める）
-            db.create_post(current_user.id, content, image_url)            
+            # 投稿を保存する前に一時ファイルへ書き出し、サイズを確認する
+            # （保存後に失敗すると「画像を処理中」の投稿が残るため）
+            if image and image.filename:
+                image_path = spool_image(image)
+
+            # 先に投稿を保存し、画像は処理中として後からURLを反映する
+            new_post = db.create_post(
+                current_user.id,
+                content,
+                image_status='pending' if image_path else None
+            )
+
+            if image_path:
+                post_id = new_post['post_id']
+                user_id = current_user.id
+                path, image_path = image_path, None  # 一時ファイルの削除は enqueue_image_upload が行う
+                try:
+                    enqueue_image_upload(
+                        path,
+                        lambda manifest: db.attach_post_image(post_id, user_id, manifest)
+                    )
+                except Exception as e:
+                    print(f"Error enqueueing image upload: {e}")
+                    db.attach_post_image(post_id, user_id, None)
             
             flash('投稿が完了しました', 'success')
             return redirect(url_for('uguu.show_timeline'))
-            
+
+        except ImageTooLarge as e:
+            flash(str(e), 'error')
+            return redirect(url_for('post.create_post'))
         except Exception as e:            
             flash('投稿の作成に失敗しました', 'error')
             return redirect(url_for('post.create_post'))
+        finally:
+            if image_path:
+                os.remove(image_path)
     
     return render_template('uguu/create_post.html')
 
 @post.route('/post/<post_id>/edit', methods=['GET', 'POST'])
+@login_required
 def edit_post(post_id):
     """投稿を編集"""
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-        
     # 投稿を取得
     post = db.get_post(post_id)
-    if not post or post['user_id'] != session['user_id']:
+    if not post or post['user_id'] != current_user.id:
         flash('投稿が見つからないか、編集権限がありません')
-        return redirect(url_for('timeline.show_timeline'))
+        return redirect(url_for('uguu.show_timeline'))
         
     if request.method == 'POST':
         content = request.form.get('content')
         if not content:
             flash('投稿内容を入力してください')
-            return redirect(url_for('timeline.show_timeline'))
+            return redirect(url_for('uguu.show_timeline'))
             
         try:
             # 投稿を更新
@@ -56,7 +80,7 @@ def edit_post(post_id):
             print(f"Error: {e}")
             flash('更新に失敗しました')
             
-        return redirect(url_for('timeline.show_timeline'))
+        return redirect(url_for('uguu.show_timeline'))
         
     # GET リクエストの場合は編集フォームを表示
     return render_template('uguu/edit_post.html', post=post)
@@ -0,0 +1,493 @@
+import os
+import re
+import math
+import time
+import fcntl
+import pickle
+import socket
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from utils.dynamo import iter_scan
+
+
+# 文字n-gramの長さ（日本語は単語区切りがないため文字2-gramで索引する）
+NGRAM_SIZE = 2
+
+# 索引ファイルの保存先（ワーカー起動時はここから読み込む）
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", os.path.join('instance', 'search_index.pkl'))
+
+# 追加・更新後、まとめてディスクに保存するまでの待ち時間（秒）
+SAVE_DELAY = 30
+
+# 他のワーカーが保存した索引を読み直すか確認する間隔（秒）
+RELOAD_CHECK_INTERVAL = 30
+
+# 索引を構築中のワーカーが落ちた場合に、ロックファイルを古いとみなすまでの秒数
+BUILD_LOCK_STALE_SECONDS = int(os.getenv("SEARCH_BUILD_LOCK_STALE_SECONDS", "3600"))
+
+# 削除済み文書がこの割合を超えたら保存時に詰め直す
+COMPACT_RATIO = 0.2
+
+SEARCH_PAGE_SIZE = 20
+
+# ワーカー内で索引を作るときの消費RCUの上限（毎秒）。表示側の読み込みを妨げないようにする
+BUILD_MAX_CAPACITY = float(os.getenv("SEARCH_BUILD_MAX_CAPACITY", "50"))
+
+INDEX_FORMAT_VERSION = 1
+
+# BM25のパラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize(text):
+    """全角/半角・大文字/小文字・カタカナ/ひらがなの違いを吸収"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    # カタカナをひらがなに寄せる（「バドミントン」と「ばどみんとん」を同一視）
+    text = ''.join(
+        chr(ord(c) - 0x60) if 'ァ' <= c <= 'ヶ' else c
+        for c in text
+    )
+    return _SPACE_RE.sub(' ', text).strip()
+
+
+def ngrams(text):
+    """正規化した文字列を文字n-gramに分割（空白をまたぐn-gramは作らない）"""
+    grams = []
+    for chunk in normalize(text).split(' '):
+        if not chunk:
+            continue
+        if len(chunk) < NGRAM_SIZE:
+            grams.append(chunk)
+            continue
+        grams.extend(chunk[i:i + NGRAM_SIZE] for i in range(len(chunk) - NGRAM_SIZE + 1))
+    return grams
+
+
+class SearchIndex:
+    """投稿本文の文字n-gram転置インデックス
+
+    ポスティングリストは文書番号(array('I'))と出現回数(array('H'))の配列で保持する。
+    文書番号は追加順に振るため、追加はリスト末尾への追記だけで済む。
+    更新された投稿は新しい番号で追加し、古い番号は削除済みとして扱う。
+    """
+
+    def __init__(self, path=SEARCH_INDEX_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._save_timer = None
+        self._loaded_mtime = None
+        self._last_reload_check = 0.0
+        self._building = False
+        self._pending = {}              # 前回の保存以降の変更 post_id -> (content, created_at) / None(削除)
+        self._reset()
+
+    def _reset(self):
+        self.doc_ids = []               # 文書番号 -> post_id
+        self.doc_created = []           # 文書番号 -> created_at（同点時の並び順）
+        self.doc_lengths = array('I')   # 文書番号 -> n-gram数
+        self.post_docno = {}            # post_id -> 文書番号
+        self.deleted = set()
+        self.postings = {}              # n-gram -> (array('I'), array('H'))
+        self.total_length = 0
+        self.dirty = False
+
+    @property
+    def live_count(self):
+        return len(self.doc_ids) - len(self.deleted)
+
+    # ---- 追加・削除 ----
+
+    def _add(self, post_id, content, created_at=''):
+        if post_id in self.post_docno:
+            self._remove(post_id)
+
+        grams = ngrams(content)
+        docno = len(self.doc_ids)
+        self.doc_ids.append(post_id)
+        self.doc_created.append(created_at or '')
+        self.doc_lengths.append(len(grams))
+        self.post_docno[post_id] = docno
+        self.total_length += len(grams)
+
+        for gram, tf in Counter(grams).items():
+            docs, tfs = self.postings.setdefault(gram, (array('I'), array('H')))
+            docs.append(docno)
+            tfs.append(min(tf, 0xFFFF))
+        self.dirty = True
+
+    def _remove(self, post_id):
+        docno = self.post_docno.pop(post_id, None)
+        if docno is None:
+            return
+        self.deleted.add(docno)
+        self.total_length -= self.doc_lengths[docno]
+        self.dirty = True
+
+    def _ready(self):
+        """索引がメモリにあるか。未読み込みならディスクから読み込む"""
+        if self._loaded_mtime is not None:
+            return True
+        return not self._building and self.load()
+
+    def _apply(self, post_id, doc):
+        if doc is None:
+            self._remove(post_id)
+        else:
+            self._add(post_id, *doc)
+
+    def _apply_pending(self):
+        for post_id, doc in self._pending.items():
+            self._apply(post_id, doc)
+
+    def _update(self, post_id, doc):
+        # 構築中・索引ファイルがまだない間は変更を _pending に残し、読み込み・構築の後で適用する
+        # （エクスポートが通り過ぎた後の追加・更新を失わないため）
+        self._ready()
+        with self._lock:
+            self._pending[post_id] = doc
+            # 読み込み・構築は _pending の適用までロックを持って行うので、ここで確認し直す
+            if self._loaded_mtime is not None:
+                self._apply(post_id, doc)
+        self._schedule_save()
+
+    def add_post(self, post_id, content, created_at=''):
+        """投稿を索引に追加（既にあれば置き換え）"""
+        self._update(post_id, (content, created_at))
+
+    def remove_post(self, post_id):
+        """投稿を索引から削除"""
+        self._update(post_id, None)
+
+    # ---- 検索 ----
+
+    def _term_postings(self, gram):
+        """n-gramの {文書番号: 出現回数} を返す（n未満の語はそれを含むn-gramに展開）"""
+        if len(gram) >= NGRAM_SIZE:
+            terms = [gram] if gram in self.postings else []
+        else:
+            terms = [term for term in self.postings if gram in term]
+
+        matches = {}
+        for term in terms:
+            docs, tfs = self.postings[term]
+            for docno, tf in zip(docs, tfs):
+                if docno not in self.deleted:
+                    matches[docno] = matches.get(docno, 0) + tf
+        return matches
+
+    def search(self, query, page=1, per_page=SEARCH_PAGE_SIZE):
+        """クエリの全n-gramを含む投稿をBM25順に返す -> (post_idのリスト, 総件数)"""
+        grams = list(dict.fromkeys(ngrams(query)))
+        if not grams:
+            return [], 0
+
+        with self._lock:
+            n_docs = self.live_count
+            if n_docs == 0:
+                return [], 0
+            avg_length = self.total_length / n_docs
+
+            # 出現文書の少ないn-gramから絞り込む
+            term_matches = sorted((self._term_postings(g) for g in grams), key=len)
+            candidates = set(term_matches[0])
+            for matches in term_matches[1:]:
+                candidates.intersection_update(matches)
+                if not candidates:
+                    return [], 0
+
+            scores = {}
+            for matches in term_matches:
+                idf = math.log(1 + (n_docs - len(matches) + 0.5) / (len(matches) + 0.5))
+                for docno in candidates:
+                    tf = matches[docno]
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[docno] / avg_length)
+                    scores[docno] = scores.get(docno, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+            ranked = sorted(scores, key=lambda d: (scores[d], self.doc_created[d]), reverse=True)
+            start = (max(page, 1) - 1) * per_page
+            return [self.doc_ids[d] for d in ranked[start:start + per_page]], len(ranked)
+
+    # ---- 保存・読み込み ----
+
+    def _compact(self):
+        """削除済み文書を取り除いて文書番号を振り直す"""
+        docs = [
+            (self.doc_ids[d], self.doc_created[d])
+            for d in range(len(self.doc_ids)) if d not in self.deleted
+        ]
+        remap = {}
+        new_docno = 0
+        for old_docno in range(len(self.doc_ids)):
+            if old_docno not in self.deleted:
+                remap[old_docno] = new_docno
+                new_docno += 1
+
+        postings = {}
+        for gram, (old_docs, old_tfs) in self.postings.items():
+            new_docs, new_tfs = array('I'), array('H')
+            for docno, tf in zip(old_docs, old_tfs):
+                if docno in remap:
+                    new_docs.append(remap[docno])
+                    new_tfs.append(tf)
+            if new_docs:
+                postings[gram] = (new_docs, new_tfs)
+
+        self.doc_lengths = array('I', (self.doc_lengths[d] for d in sorted(remap)))
+        self.doc_ids = [post_id for post_id, _ in docs]
+        self.doc_created = [created for _, created in docs]
+        self.post_docno = {post_id: i for i, post_id in enumerate(self.doc_ids)}
+        self.deleted = set()
+        self.postings = postings
+
+    def _merge_saved(self):
+        """他のワーカーが保存した索引を読み直す（このワーカーの未保存の変更は load が適用し直す）"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._loaded_mtime:
+            self.load()
+
+    def save(self, merge=True):
+        """索引をディスクに保存（一時ファイルに書いてから置き換える）
+
+        ワーカーごとに索引を持つので、保存用のロックを取ってから他のワーカーの保存分を取り込み、
+        その上に自分の変更を重ねて書く（後から保存したワーカーが他の追加を消さないようにする）。
+        """
+        with self._lock:
+            self._save_timer = None
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                lock_file = open(f"{self.path}.save.lock", 'a')
+            except OSError as e:
+                print(f"Error saving search index: {e}")
+                return
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                if merge:
+                    self._merge_saved()
+                if self._loaded_mtime is None and merge:
+                    # 索引ファイルがまだない（構築中）。変更だけの索引で置き換えないよう、後で保存し直す
+                    if not self._building:
+                        self._schedule_save()
+                    return
+                self._write()
+            finally:
+                lock_file.close()
+
+    def _write(self):
+        with self._lock:
+            if self.doc_ids and len(self.deleted) > len(self.doc_ids) * COMPACT_RATIO:
+                self._compact()
+
+            data = {
+                'version': INDEX_FORMAT_VERSION,
+                'ngram_size': NGRAM_SIZE,
+                'doc_ids': self.doc_ids,
+                'doc_created': self.doc_created,
+                'doc_lengths': self.doc_lengths,
+                'deleted': self.deleted,
+                'postings': self.postings,
+            }
+            try:
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self.path)
+                self._loaded_mtime = os.path.getmtime(self.path)
+                self.dirty = False
+                self._pending = {}
+                print(f"Search index saved: {self.live_count} posts, {len(self.postings)} terms")
+            except OSError as e:
+                print(f"Error saving search index: {e}")
+
+    def load(self):
+        """ディスクから索引を読み込む。読み込めた場合はTrue"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+            mtime = os.path.getmtime(self.path)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            print(f"Search index not loaded: {e}")
+            return False
+
+        if data.get('version') != INDEX_FORMAT_VERSION or data.get('ngram_size') != NGRAM_SIZE:
+            print("Search index format changed; rebuild required")
+            return False
+
+        with self._lock:
+            self._reset()
+            self.doc_ids = data['doc_ids']
+            self.doc_created = data['doc_created']
+            self.doc_lengths = data['doc_lengths']
+            self.deleted = data['deleted']
+            self.postings = data['postings']
+            self.post_docno = {
+                post_id: docno for docno, post_id in enumerate(self.doc_ids)
+                if docno not in self.deleted
+            }
+            self.total_length = sum(self.doc_lengths[d] for d in self.post_docno.values())
+            self._loaded_mtime = mtime
+            # まだ保存していない変更（読み込み前・他のワーカーの保存より後の変更）を適用し直す
+            self._apply_pending()
+        return True
+
+    def _schedule_save(self):
+        with self._lock:
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(SAVE_DELAY, self.save)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def maybe_reload(self):
+        """他のワーカーが保存した新しい索引があれば読み直す"""
+        now = time.time()
+        if now - self._last_reload_check < RELOAD_CHECK_INTERVAL:
+            return
+        self._last_reload_check = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        # 未保存の変更がある場合は自分の保存を優先する
+        if not self.dirty and (self._loaded_mtime is None or mtime > self._loaded_mtime):
+            self.load()
+
+    # ---- 構築 ----
+
+    def build(self, items):
+        """投稿のエクスポートから索引を作り直して保存
+
+        エクスポートはテーブル全体を RCU の上限付きで読むので時間がかかる。
+        その間も検索できるよう、別の索引に作ってから入れ替える。
+        """
+        fresh = SearchIndex(self.path)
+        for item in items:
+            if item.get('post_id'):
+                fresh._add(item['post_id'], item.get('content', ''), item.get('created_at', ''))
+
+        with self._lock:
+            self.doc_ids = fresh.doc_ids
+            self.doc_created = fresh.doc_created
+            self.doc_lengths = fresh.doc_lengths
+            self.post_docno = fresh.post_docno
+            self.deleted = fresh.deleted
+            self.postings = fresh.postings
+            self.total_length = fresh.total_length
+            # エクスポート中に受け付けた変更を適用する（エクスポートに含まれていても置き換えになるだけ）
+            self._apply_pending()
+            # テーブル全体から作った索引なので、保存済みの索引は取り込まずに置き換える
+            self.save(merge=False)
+
+    def ensure_loaded(self, posts_table):
+        """索引を読み込む。ファイルがなければバックグラウンドで構築を開始する"""
+        if self._loaded_mtime is not None or self._building:
+            self.maybe_reload()
+            return
+        if self.load():
+            return
+
+        # 複数ワーカーで同時に構築しないようロックファイルで排他
+        lock_path = f"{self.path}.lock"
+        if not _acquire_build_lock(lock_path):
+            return
+
+        def _build():
+            try:
+                self.build(export_posts(posts_table, max_capacity_per_second=BUILD_MAX_CAPACITY))
+            except Exception as e:
+                print(f"Error building search index: {e}")
+            finally:
+                self._building = False
+                try:
+                    os.remove(lock_path)
+                except OSError:
+                    pass
+
+        self._building = True
+        threading.Thread(target=_build, name='search-index-build', daemon=True).start()
+
+
+def _build_lock_is_stale(lock_path):
+    """構築用ロックファイルの持ち主が終了しているか、一定時間を過ぎていれば True"""
+    try:
+        with open(lock_path) as f:
+            host, pid, started = f.read().split()
+        pid, started = int(pid), float(started)
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError):
+        # 書き込み途中・以前の形式（空ファイル）の場合は作成時刻で判断する
+        try:
+            started = os.path.getmtime(lock_path)
+        except OSError:
+            return False
+        return time.time() - started > BUILD_LOCK_STALE_SECONDS
+
+    if time.time() - started > BUILD_LOCK_STALE_SECONDS:
+        return True
+    if host != socket.gethostname():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def _acquire_build_lock(lock_path):
+    """構築用のロックファイルを作る（ホスト名・pid・開始時刻を書く）。古いロックは引き継ぐ"""
+    try:
+        os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+    except OSError as e:
+        print(f"Error creating search index lock: {e}")
+        return False
+
+    for _ in range(2):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not _build_lock_is_stale(lock_path):
+                return False
+            print(f"Taking over stale search index lock: {lock_path}")
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error removing stale search index lock: {e}")
+                return False
+            continue
+        except OSError as e:
+            print(f"Error creating search index lock: {e}")
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(f"{socket.gethostname()} {os.getpid()} {time.time()}")
+        return True
+    return False
+
+
+def export_posts(posts_table, segments=1, max_capacity_per_second=None):
+    """postsテーブルから索引用の項目をページ単位で取得（並列数・消費RCUの上限は iter_scan と同じ）"""
+    return iter_scan(
+        posts_table.scan,
+        segments=segments,
+        max_capacity_per_second=max_capacity_per_second,
+        FilterExpression="begins_with(PK, :pk_prefix) AND begins_with(SK, :sk_prefix)",
+        ProjectionExpression='post_id, content, created_at',
+        ExpressionAttributeValues={
+            ':pk_prefix': 'POST#',
+            ':sk_prefix': 'METADATA#'
+        }
+    )
+
+
+# ワーカー内で共有する索引
+search_index = SearchIndex()
@@ -1,10 +1,21 @@
-from flask import Blueprint, render_template, redirect, url_for, flash
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from .dynamo import db
+from .fragments import render_post_cards
+from .search import search_index, SEARCH_PAGE_SIZE
 from flask_login import current_user, login_required
 
 # Blueprintの作成
 uguu = Blueprint('uguu', __name__)
 
+def render_timeline(posts, **context):
+    """投稿カードをキャッシュ経由で描画してタイムラインを表示"""
+    return render_template(
+        'uguu/timeline.html',
+        posts=posts,
+        post_cards=render_post_cards(posts),
+        **context
+    )
+
 @uguu.route('/')
 @login_required
 def show_timeline():
@@ -24,32 +35,94 @@ def show_timeline():
         if posts:
             posts = sorted(posts, key=lambda x: x.get('updated_at', x.get('created_at', '')), reverse=True)
             
-        return render_template(
-            'uguu/timeline.html',
-            posts=posts
-        )
+        return render_timeline(posts)
         
     except Exception as e:
         print(f"Timeline Error: {str(e)}")
         flash('タイムラインの取得中にエラーが発生しました。', 'danger')
         return redirect(url_for('index'))
 
+@uguu.route('/home')
+@login_required
+def show_home_feed():
+    """フォロー中のユーザーの投稿を表示"""
+    try:
+        posts = db.get_home_feed(current_user.id)
+
+        for post in posts:
+            try:
+                post['is_liked_by_user'] = db.check_if_liked(post['post_id'], current_user.id)
+            except Exception as e:
+                post['is_liked_by_user'] = False
+
+        return render_timeline(posts, show_home_feed=True)
+
+    except Exception as e:
+        print(f"Home Feed Error: {e}")
+        flash('タイムラインの取得中にエラーが発生しました。', 'danger')
+        return redirect(url_for('uguu.show_timeline'))
+
+@uguu.route('/follow/<user_id>', methods=['POST'])
+@login_required
+def toggle_follow(user_id):
+    """フォロー/フォロー解除"""
+    try:
+        is_following = db.toggle_follow(current_user.id, user_id)
+    except Exception as e:
+        print(f"Error in toggle_follow route: {e}")
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'error': 'フォローの処理に失敗しました'}), 500
+        flash('フォローの処理に失敗しました', 'error')
+        return redirect(url_for('user_profile', user_id=user_id))
+
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({'is_following': is_following})
+    return redirect(url_for('user_profile', user_id=user_id))
+
+@uguu.route('/search')
+@login_required
+def search_posts():
+    """投稿を全文検索"""
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    posts = []
+    total = 0
+
+    if query:
+        try:
+            search_index.ensure_loaded(db.posts_table)
+            post_ids, total = search_index.search(query, page=page)
+            posts = db.get_posts_by_ids(post_ids)
+
+            for post in posts:
+                try:
+                    post['is_liked_by_user'] = db.check_if_liked(post['post_id'], current_user.id)
+                except Exception as e:
+                    post['is_liked_by_user'] = False
+        except Exception as e:
+            print(f"Search Error: {e}")
+            flash('検索中にエラーが発生しました。', 'danger')
+
+    return render_timeline(
+        posts,
+        search_query=query,
+        search_total=total,
+        search_page=page,
+        search_has_next=page * SEARCH_PAGE_SIZE < total
+    )
+
 @uguu.route('/my_posts')
 @login_required
 def show_my_posts():
     """自分の投稿のみを表示"""
     try:
-        # ユーザーの投稿を取得
-        posts = db.get_user_posts(current_user.id)
-        
-        if posts:
-            posts = sorted(posts, key=lambda x: x['updated_at'], reverse=True)
-            
-        return render_template(
-            'uguu/timeline.html',
-            posts=posts,
-            show_my_posts=True
+        # ユーザーの投稿を新しい順に取得
+        posts, next_cursor = db.get_user_posts_page(
+            current_user.id,
+            cursor=request.args.get('cursor')
         )
+            
+        return render_timeline(posts, next_cursor=next_cursor, show_my_posts=True)
         
     except Exception as e:
         print(f"My Posts Error: {e}")
@@ -0,0 +1,161 @@
+from flask import Blueprint, request, jsonify, abort, send_from_directory, url_for
+from flask_login import current_user, login_required
+from concurrent.futures import ThreadPoolExecutor
+import tempfile
+import uuid
+import os
+from datetime import datetime
+from .dynamo import db
+from utils.images import process_image, write_manifest, UPLOAD_TMP_DIR
+from utils.storage import get_storage, LocalStorage, INCOMING_PREFIX
+from utils.gallery import get_gallery_manifest
+from utils.image_refs import get_image_refs
+
+# ブラウザから直接ストレージへアップロードするためのBlueprint
+upload = Blueprint('upload', __name__)
+
+ALLOWED_IMAGE_TYPES = {'image/jpeg', 'image/png', 'image/webp'}
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+
+# 用途ごとの公開先
+UPLOAD_PURPOSES = {
+    'gallery': {'prefix': 'gallery/'},
+    'post': {'prefix': 'posts/'},
+}
+
+# /local/<key> で配信するキー（処理済みの画像の公開先）
+PUBLISHED_PREFIXES = tuple(settings['prefix'] for settings in UPLOAD_PURPOSES.values())
+
+# incoming/ に届いた画像の縮小・公開はリクエスト外で行う
+_processing_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-publish')
+
+
+def publish_incoming_image(incoming_key, purpose):
+    """incoming/ の画像から派生画像を作って公開先に保存し、マニフェストを返す（失敗時None）"""
+    storage = get_storage()
+    settings = UPLOAD_PURPOSES[purpose]
+    fd, path = tempfile.mkstemp(prefix='incoming-', dir=UPLOAD_TMP_DIR)
+    os.close(fd)
+    try:
+        storage.download(incoming_key, path)
+        manifest = process_image(storage, path, settings['prefix'], refs=get_image_refs())
+        if purpose == 'gallery':
+            write_manifest(storage, manifest)
+            get_gallery_manifest().add(manifest, datetime.now().isoformat())
+        storage.delete(incoming_key)
+        print(f"Published {incoming_key} -> {manifest['base_key']}")
+        return manifest
+    except Exception as e:
+        print(f"Error publishing {incoming_key}: {e}")
+        return None
+    finally:
+        os.remove(path)
+
+
+def _valid_incoming_key(key, purpose):
+    return (
+        purpose in UPLOAD_PURPOSES
+        and key.startswith(f"{INCOMING_PREFIX}{purpose}/{current_user.id}/")
+        and '..' not in key
+    )
+
+
+@upload.route('/presign', methods=['POST'])
+@login_required
+def presign_upload():
+    """ブラウザがストレージへ直接アップロードするための署名付きポリシーを発行"""
+    data = request.get_json(silent=True) or {}
+    content_type = data.get('content_type', '')
+    purpose = data.get('purpose', 'post')
+    try:
+        # 数値・数字の文字列のみ受け付ける（"1.5" や true は不正）
+        size = int(str(data.get('size', '')))
+    except ValueError:
+        return jsonify({'error': '画像のサイズが不正です'}), 400
+
+    if purpose not in UPLOAD_PURPOSES:
+        return jsonify({'error': '不正なアップロード先です'}), 400
+    if content_type not in ALLOWED_IMAGE_TYPES:
+        return jsonify({'error': 'この形式の画像はアップロードできません'}), 400
+    if not 0 < size <= MAX_UPLOAD_BYTES:
+        return jsonify({'error': f'画像は{MAX_UPLOAD_BYTES // (1024 * 1024)}MBまでです'}), 400
+
+    key = f"{INCOMING_PREFIX}{purpose}/{current_user.id}/{uuid.uuid4().hex}"
+    try:
+        presigned = get_storage().presign_post(key, content_type, MAX_UPLOAD_BYTES)
+    except Exception as e:
+        print(f"Error presigning upload: {e}")
+        return jsonify({'error': 'アップロードの準備に失敗しました'}), 500
+
+    return jsonify({'key': key, 'url': presigned['url'], 'fields': presigned['fields']})
+
+
+@upload.route('/complete', methods=['POST'])
+@login_required
+def complete_upload():
+    """直接アップロードの完了通知。画像の処理はバックグラウンドで行う"""
+    data = request.get_json(silent=True) or {}
+    key = data.get('key', '')
+    purpose = data.get('purpose', 'post')
+
+    if not _valid_incoming_key(key, purpose):
+        return jsonify({'error': '不正なアップロードです'}), 400
+
+    if purpose == 'gallery':
+        _processing_executor.submit(publish_incoming_image, key, purpose)
+        return jsonify({'status': 'processing', 'redirect': url_for('gallery')})
+
+    # 投稿は先に保存し、画像は処理後に反映する
+    content = data.get('content', '')
+    if not content:
+        return jsonify({'error': '投稿内容を入力してください'}), 400
+
+    new_post = db.create_post(current_user.id, content, image_status='pending')
+    post_id = new_post['post_id']
+    user_id = current_user.id
+
+    def _publish():
+        db.attach_post_image(post_id, user_id, publish_incoming_image(key, purpose))
+
+    _processing_executor.submit(_publish)
+    return jsonify({'status': 'processing', 'post_id': post_id, 'redirect': url_for('uguu.show_timeline')})
+
+
+@upload.route('/local', methods=['POST'])
+def local_upload():
+    """LocalStorage用のアップロード受け口（S3の署名付きPOSTの代わり）"""
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        abort(404)
+
+    policy = storage.verify_policy(request.form.get('policy', ''))
+    if not policy or policy['key'] != request.form.get('key'):
+        abort(403)
+
+    file = request.files.get('file')
+    if not file or request.form.get('Content-Type') != policy['content_type']:
+        abort(400)
+
+    data = file.read(policy['max_bytes'] + 1)
+    if not data or len(data) > policy['max_bytes']:
+        abort(413)
+
+    storage.put(policy['key'], data, content_type=policy['content_type'])
+    return '', 204
+
+
+@upload.route('/local/<path:key>')
+def local_file(key):
+    """LocalStorageに保存したファイルを配信（公開先の画像のみ）"""
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        abort(404)
+    # incoming/ の元画像は縮小前で EXIF（位置情報など）が残っているので配信しない
+    if not key.startswith(PUBLISHED_PREFIXES):
+        abort(404)
+    if key.endswith('/manifest.json'):
+        return send_from_directory(storage.root, key)
+    # 派生画像のキーは内容から決まるので長期間キャッシュさせる
+    response = send_from_directory(storage.root, key, max_age=31536000)
+    response.cache_control.immutable = True
+    return response
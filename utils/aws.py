@@ -0,0 +1,52 @@
+import os
+import threading
+import boto3
+from utils.call_target import register_call_target
+from utils.tracing import register_botocore_hooks
+from utils.scan_guard import register_scan_guard
+from utils.resilience import register_circuit_breakers
+from utils.coalesce import register_coalescing
+
+
+# プロセス内で共有するセッション（クライアント・リソースはすべてここから作る）
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """プロセス内で共有する boto3 セッションを取得
+
+    セッションの作成（認証情報・サービス定義の読み込み）は重いので、プロセスごとに1回だけ行う。
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = boto3.session.Session(
+                    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                    region_name=os.getenv("AWS_REGION", "us-east-1")
+                )
+                # 呼び出し先のテーブル・バケットを記録する（以下のハンドラーが使う）
+                register_call_target(session)
+                # リクエストごとの呼び出し回数・時間の記録（クライアント作成前に登録する）
+                register_botocore_hooks(session)
+                # 開発・ステージングでリクエスト中の Scan を検出する（SCAN_GUARD_MODE）
+                register_scan_guard(session)
+                # 失敗が続くテーブルへの呼び出しを止める
+                register_circuit_breakers(session)
+                # 同じ内容の実行中の読み込みをまとめる（他の before-call より後に登録する）
+                register_coalescing(session)
+                _session = session
+    return _session
+
+
+def _reset_after_fork():
+    """fork したワーカーでは親のセッションを使わない（gunicorn の preload_app）"""
+    global _session, _session_lock
+    _session = None
+    _session_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,31 @@
+def call_tables(params):
+    """呼び出し先の DynamoDB テーブル名のリスト"""
+    if 'TableName' in params:
+        return [params['TableName']]
+    return sorted(params.get('RequestItems', {}))
+
+
+def call_target(params):
+    """呼び出し先のテーブル名（S3はバケット名）"""
+    if 'TableName' in params:
+        return params['TableName']
+    if 'RequestItems' in params:
+        return ','.join(sorted(params['RequestItems']))
+    if 'TransactItems' in params:
+        return 'transaction'
+    return params.get('Bucket', '')
+
+
+def _record_target(params, context, **kwargs):
+    # before-call の params はシリアライズ済みのリクエスト（url・body など）なので、
+    # API のパラメーターが見えるこの時点で呼び出し先を context に残す
+    context['call_tables'] = call_tables(params)
+    context['call_target'] = call_target(params)
+
+
+def register_call_target(session):
+    """呼び出し先を context['call_tables'] / context['call_target'] に記録する
+
+    before-call 以降のハンドラー（計測・Scan の検出・サーキットブレーカー）はここで記録した値を使う。
+    """
+    session.events.register('before-parameter-build.*.*', _record_target)
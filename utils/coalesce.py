@@ -0,0 +1,102 @@
+import os
+import re
+import copy
+import threading
+from utils.metrics import registry
+
+
+# 0 にすると同じ読み込みをまとめない
+COALESCING_ENABLED = os.getenv("REQUEST_COALESCING", "1") == "1"
+
+# まとめる対象の読み込み操作（書き込みや S3 のストリーミング応答はまとめない）
+COALESCED_OPERATIONS = {'GetItem', 'BatchGetItem', 'Query', 'Scan'}
+
+# 先行する呼び出しをこの秒数まで待つ（超えたら自分で呼び出す）。
+# utils.dynamo の max_attempts × (connect_timeout + read_timeout) より長くする
+FOLLOWER_TIMEOUT = 30
+
+# 強い整合性の読み込みは、書き込みより前に始まった呼び出しの結果を使えないのでまとめない
+_CONSISTENT_READ = re.compile(rb'"ConsistentRead"\s*:\s*true')
+
+
+class _InFlight:
+    __slots__ = ('done', 'response', 'followers')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.followers = 0
+
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def _key(model, params):
+    """操作とシリアライズ済みのリクエスト本文が同じ呼び出しを同じキーにする"""
+    if model.name not in COALESCED_OPERATIONS:
+        return None
+    body = params.get('body')
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if not isinstance(body, bytes) or _CONSISTENT_READ.search(body):
+        return None
+    return (model.service_model.service_name, model.name, params.get('url'), body)
+
+
+def _before_call(model, params, context, **kwargs):
+    """同じ読み込みが実行中なら、その結果を待って使う（戻り値を返すと HTTP 呼び出しは行われない）"""
+    key = _key(model, params)
+    if key is None:
+        return None
+    with _in_flight_lock:
+        flight = _in_flight.get(key)
+        if flight is None:
+            _in_flight[key] = context['coalesce_flight'] = _InFlight()
+            context['coalesce_key'] = key
+            return None
+        flight.followers += 1
+
+    if not flight.done.wait(FOLLOWER_TIMEOUT) or flight.response is None:
+        # 先行する呼び出しが失敗した・終わらない場合は自分で呼び出す
+        return None
+    http_response, parsed = flight.response
+    context['coalesced'] = True
+    registry.inc('coalesced_calls_total', (model.service_model.service_name, model.name,
+                                           context.get('trace_target', '')))
+    # 応答はリソース層が書き換えるので、待っていた呼び出しごとにコピーを渡す
+    return http_response, copy.deepcopy(parsed)
+
+
+def _finish(context, response):
+    flight = context.pop('coalesce_flight', None)
+    if flight is None:
+        return
+    with _in_flight_lock:
+        _in_flight.pop(context.pop('coalesce_key'), None)
+        followers = flight.followers
+    if followers and response is not None:
+        http_response, parsed = response
+        flight.response = (http_response, copy.deepcopy(parsed))
+    flight.done.set()
+
+
+def _after_call(http_response, parsed, context, **kwargs):
+    _finish(context, (http_response, parsed))
+
+
+def _after_call_error(context, **kwargs):
+    _finish(context, None)
+
+
+def register_coalescing(session):
+    """boto3 セッションの DynamoDB の読み込みで、同じ内容の実行中の呼び出しをまとめる
+
+    他の before-call ハンドラー（計測・サーキットブレーカー）より後に登録する。
+    after-call はリソース層の変換（Decimal など）より先に呼ばれるので、変換前の応答を共有できる。
+    """
+    if not COALESCING_ENABLED:
+        return
+    session.events.register('before-call.dynamodb.*', _before_call)
+    session.events.register('after-call.dynamodb.*', _after_call)
+    session.events.register('after-call-error.dynamodb.*', _after_call_error)
@@ -0,0 +1,202 @@
+import os
+import zlib
+import threading
+import functools
+from collections import OrderedDict
+from flask import request
+from utils.metrics import registry
+
+
+# 0 にするとレスポンスを圧縮しない（前段のプロキシで圧縮する場合など）
+COMPRESSION_ENABLED = os.getenv("COMPRESSION", "1") == "1"
+
+# これより小さいレスポンスは圧縮しない（ヘッダーの分で効果がない）
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+
+GZIP_LEVEL = 6
+# 動的なレスポンスは毎回圧縮するので、速度と圧縮率のバランスがよい品質にする
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/xml', 'text/javascript',
+    'application/javascript', 'application/json', 'application/xml', 'image/svg+xml',
+}
+
+# ETag のあるレスポンス（静的ファイルなど）の圧縮結果を保持する合計バイト数と、1件あたりの上限
+COMPRESSED_CACHE_MAX_BYTES = 16 * 1024 * 1024
+COMPRESSED_CACHE_MAX_ITEM = 1024 * 1024
+
+
+@functools.lru_cache(maxsize=None)
+def _brotli():
+    """brotli は任意の依存（pip install Brotli）。なければ gzip のみ"""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+class _GzipCompressor:
+    def __init__(self):
+        self._z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._z.compress(data)
+
+    def flush(self):
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._z.flush(zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+    def __init__(self, brotli):
+        self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self._c.process(data)
+
+    def flush(self):
+        return self._c.flush()
+
+    def finish(self):
+        return self._c.finish()
+
+
+def _compressor(encoding):
+    if encoding == 'br':
+        return _BrotliCompressor(_brotli())
+    return _GzipCompressor()
+
+
+def _choose_encoding():
+    """Accept-Encoding から br / gzip を選ぶ（どちらも受け付けなければ None）"""
+    accepted = request.accept_encodings
+    candidates = []
+    if _brotli() is not None and accepted['br']:
+        candidates.append(('br', accepted['br']))
+    if accepted['gzip']:
+        candidates.append(('gzip', accepted['gzip']))
+    if not candidates:
+        return None
+    # 品質値が同じなら br を優先する
+    return max(candidates, key=lambda c: c[1])[0]
+
+
+class CompressedBodyCache:
+    """ETag ごとの圧縮済みの本文（同じファイルを毎回圧縮しない）"""
+
+    def __init__(self, max_bytes=COMPRESSED_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._bodies = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        if len(body) > COMPRESSED_CACHE_MAX_ITEM:
+            return
+        with self._lock:
+            previous = self._bodies.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._bodies[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._bodies.popitem(last=False)
+                self._size -= len(evicted)
+
+
+compressed_cache = CompressedBodyCache()
+
+
+def _stream(chunks, compressor):
+    """チャンクごとに圧縮して送る（flush するので、クライアントは届いた分から表示できる）"""
+    try:
+        for chunk in chunks:
+            if chunk:
+                data = compressor.compress(chunk) + compressor.flush()
+                if data:
+                    yield data
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def _compress(data, encoding):
+    compressor = _compressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_response(response):
+    """HTML / JSON などのレスポンスを Accept-Encoding に応じて br または gzip で圧縮する"""
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    length = response.content_length
+    if length is not None and length < COMPRESS_MIN_SIZE:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    etag, _ = response.get_etag()
+    buffered = response.is_sequence or (length is not None and length <= COMPRESSED_CACHE_MAX_ITEM)
+
+    if not buffered:
+        # 大きい・長さの分からないストリーミングのレスポンスは、全体を読み込まずに順に圧縮する
+        chunks = response.iter_encoded()
+        response.direct_passthrough = False
+        response.response = _stream(chunks, _compressor(encoding))
+        response.headers.pop('Content-Length', None)
+        source = 'stream'
+    else:
+        key = (request.path, etag, encoding) if etag else None
+        body = compressed_cache.get(key) if key else None
+        if body is not None:
+            # 圧縮済みの本文を使うので、元の本文（ファイルなど）は読まずに閉じる
+            close = getattr(response.response, 'close', None)
+            if close is not None:
+                close()
+            source = 'cache'
+        else:
+            # send_file のレスポンスはファイルを直接渡す設定になっているので、本文を読み込む
+            response.direct_passthrough = False
+            data = response.get_data()
+            if len(data) < COMPRESS_MIN_SIZE:
+                return response
+            body = _compress(data, encoding)
+            source = 'compressed'
+            if key:
+                compressed_cache.set(key, body)
+        response.direct_passthrough = False
+        response.set_data(body)
+
+    response.headers['Content-Encoding'] = encoding
+    # 圧縮後の本文に対しては範囲指定できない
+    response.headers.pop('Accept-Ranges', None)
+    if etag:
+        # 圧縮の有無で本文が変わるので弱い ETag にする（If-None-Match は弱い比較なので 304 はそのまま返る）
+        response.set_etag(etag, weak=True)
+    registry.inc('compressed_responses_total', (encoding, source))
+    return response
+
+
+def init_compression(app):
+    """レスポンスの圧縮を有効にする（計測の after_request より後に登録し、圧縮後のサイズを記録させる）"""
+    if not COMPRESSION_ENABLED:
+        return
+    app.after_request(compress_response)
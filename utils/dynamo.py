@@ -0,0 +1,337 @@
+import os
+import time
+import random
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from utils.aws import get_session
+
+
+# プロセス内で共有するDynamoDBリソース（テーブルへのアクセスはすべてここを通す）
+_dynamodb = None
+_dynamodb_client = None
+_dynamodb_lock = threading.Lock()
+_tables = {}
+
+# gunicorn gthread のスレッド数＋バックグラウンド処理のスレッド数より多めにする
+# 1回の呼び出しがワーカーを占有する時間は、おおよそ max_attempts × (connect_timeout + read_timeout) まで。
+# adaptive は指数バックオフ（ジッター付き）に加えて、スロットリングを受けると送信レートを自動で下げる
+DYNAMODB_CLIENT_CONFIG = Config(
+    max_pool_connections=int(os.getenv("DYNAMODB_MAX_POOL_CONNECTIONS", "32")),
+    connect_timeout=float(os.getenv("DYNAMODB_CONNECT_TIMEOUT", "2")),
+    read_timeout=float(os.getenv("DYNAMODB_READ_TIMEOUT", "5")),
+    tcp_keepalive=True,
+    retries={
+        'max_attempts': int(os.getenv("DYNAMODB_MAX_ATTEMPTS", "3")),
+        'mode': os.getenv("DYNAMODB_RETRY_MODE", "adaptive")
+    }
+)
+
+
+def get_dynamodb():
+    """プロセス内で共有するDynamoDBリソースを取得
+
+    スレッド（gthread）・グリーンレット（gevent）間で共有する。使うのは項目の読み書きの呼び出しだけで、
+    リソースの属性の load() などの状態を持つ操作は行わない。
+    """
+    global _dynamodb
+    if _dynamodb is None:
+        with _dynamodb_lock:
+            if _dynamodb is None:
+                _dynamodb = get_session().resource(
+                    'dynamodb',
+                    endpoint_url=os.getenv("DYNAMODB_ENDPOINT_URL") or None,
+                    config=DYNAMODB_CLIENT_CONFIG
+                )
+    return _dynamodb
+
+
+def get_dynamodb_client():
+    """プロセス内で共有する低レベルクライアントを取得
+
+    リソースの meta.client には入出力を Python の型と相互に変換するハンドラーが登録されるため、
+    AttributeValue（{'S': ...}）のまま読み書きする場合はこちらを使う。
+    """
+    global _dynamodb_client
+    if _dynamodb_client is None:
+        with _dynamodb_lock:
+            if _dynamodb_client is None:
+                _dynamodb_client = get_session().client(
+                    'dynamodb',
+                    endpoint_url=os.getenv("DYNAMODB_ENDPOINT_URL") or None,
+                    config=DYNAMODB_CLIENT_CONFIG
+                )
+    return _dynamodb_client
+
+
+def _reset_after_fork():
+    """fork したワーカーでは親のコネクションプールを使わないよう、作り直す"""
+    global _dynamodb, _dynamodb_client, _dynamodb_lock
+    _dynamodb = None
+    _dynamodb_client = None
+    _dynamodb_lock = threading.Lock()
+    _tables.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_table(name):
+    """テーブル名からTableを取得（Tableオブジェクトも使い回す）"""
+    table = _tables.get(name)
+    if table is None:
+        table = _tables.setdefault(name, get_dynamodb().Table(name))
+    return table
+
+
+# テーブル名は .env の読み込み後に決まるので、呼び出し時に環境変数を見る
+
+def users_table():
+    return get_table(os.getenv("TABLE_NAME_USER", "bad-users"))
+
+
+def schedules_table():
+    return get_table(os.getenv("TABLE_NAME_SCHEDULE") or os.getenv("DYNAMODB_TABLE_NAME", "bad_schedules"))
+
+
+def board_table():
+    return get_table(os.getenv("TABLE_NAME_BOARD", "bad-board-table"))
+
+
+def posts_table():
+    return get_table(os.getenv("TABLE_NAME_POSTS", "posts"))
+
+
+def follows_table():
+    return get_table(os.getenv("TABLE_NAME_FOLLOWS", "follows"))
+
+
+def feeds_table():
+    return get_table(os.getenv("TABLE_NAME_FEEDS", "feeds"))
+
+
+# ---- 低レベルクライアントでの読み込み（表示用の高速経路） ----
+#
+# リソース経由では数値がすべて Decimal になり、入れ子の値も1つずつ変換される。
+# 表示にしか使わない読み込みは、必要な属性だけを取得して int / str / list に直接変換する。
+
+SCHEDULE_FIELDS = (
+    'schedule_id', 'date', 'day_of_week', 'venue', 'start_time', 'end_time',
+    'max_participants', 'participants', 'participants_count', 'status'
+)
+USER_SUMMARY_FIELDS = ('user#user_id', 'display_name', 'user_name', 'badminton_experience')
+POST_FIELDS = (
+    'PK', 'SK', 'post_id', 'user_id', 'content', 'image_url', 'image_variants',
+    'image_status', 'created_at', 'updated_at', 'likes_count'
+)
+
+
+def _number(value):
+    return int(value) if value.lstrip('-').isdigit() else float(value)
+
+
+def _plain(value):
+    """AttributeValue（{'S': 'abc'} など）を Python の値に変換"""
+    for tag, v in value.items():
+        if tag == 'S':
+            return v
+        if tag == 'N':
+            return _number(v)
+        if tag == 'L':
+            return [_plain(x) for x in v]
+        if tag == 'M':
+            return {k: _plain(x) for k, x in v.items()}
+        if tag == 'BOOL':
+            return v
+        if tag == 'NULL':
+            return None
+        if tag == 'SS':
+            return list(v)
+        if tag == 'NS':
+            return [_number(x) for x in v]
+        return v  # B / BS はそのまま
+
+
+def plain_item(item):
+    """低レベルクライアントの項目を int / str / list / dict の辞書にする"""
+    return {k: _plain(v) for k, v in item.items()}
+
+
+def projection(fields):
+    """属性名の一覧から ProjectionExpression と ExpressionAttributeNames を作る（予約語・#対策）"""
+    names = {f"#p{i}": field for i, field in enumerate(fields)}
+    return ', '.join(names), names
+
+
+def scan_plain(table_name, fields, filter_expression=None, values=None, **scan_options):
+    """テーブル全体を低レベルクライアントでスキャンし、変換済みの項目を返す
+
+    values は低レベル形式（{':pk': {'S': 'POST#'}}）で渡す。
+    scan_options（segments / max_capacity_per_second）は iter_scan に渡す。
+    """
+    expression, names = projection(fields)
+    kwargs = {'TableName': table_name, 'ProjectionExpression': expression, 'ExpressionAttributeNames': names}
+    if filter_expression:
+        kwargs['FilterExpression'] = filter_expression
+        kwargs['ExpressionAttributeValues'] = values
+    return [plain_item(item) for item in iter_scan(get_dynamodb_client().scan, **scan_options, **kwargs)]
+
+
+# batch_get_item の UnprocessedKeys を読み直す回数と待ち時間（秒）
+UNPROCESSED_MAX_ATTEMPTS = 5
+UNPROCESSED_BACKOFF_BASE = 0.05
+UNPROCESSED_BACKOFF_CAP = 1.0
+
+
+def batch_get_plain(table_name, key_name, ids, fields, key=None):
+    """文字列キーの項目を100件ずつ一括取得し、{キー: 変換済みの項目} を返す
+
+    主キーが key_name でない場合（PK/SK の複合キーなど）は、key(id) で {属性名: 文字列} の主キーを作る。
+    結果は項目の key_name の値で引く。
+    """
+    if key is None:
+        key = lambda value: {key_name: value}
+    expression, names = projection(tuple(fields) if key_name in fields else (key_name, *fields))
+    ids = list(dict.fromkeys(ids))
+    result = {}
+    client = get_dynamodb_client()
+    for i in range(0, len(ids), 100):
+        request_items = {
+            table_name: {
+                'Keys': [
+                    {name: {'S': part} for name, part in key(value).items()}
+                    for value in ids[i:i + 100]
+                ],
+                'ProjectionExpression': expression,
+                'ExpressionAttributeNames': names
+            }
+        }
+        attempt = 0
+        while request_items:
+            if attempt:
+                # スロットリングで残った分は、ジッター付きの指数バックオフで読み直す
+                if attempt >= UNPROCESSED_MAX_ATTEMPTS:
+                    raise RuntimeError(f"batch_get_item on {table_name}: keys left unprocessed after {attempt} attempts")
+                time.sleep(random.uniform(0, min(UNPROCESSED_BACKOFF_CAP, UNPROCESSED_BACKOFF_BASE * 2 ** attempt)))
+            response = client.batch_get_item(RequestItems=request_items)
+            for item in response.get('Responses', {}).get(table_name, []):
+                item = plain_item(item)
+                result[item[key_name]] = item
+            request_items = response.get('UnprocessedKeys')
+            attempt += 1
+    return result
+
+
+# ---- スキャン ----
+
+class CapacityLimiter:
+    """消費した読み込みキャパシティ（RCU）が毎秒 rate を超えないように待たせる
+
+    スキャンの応答の ConsumedCapacity を記録し、使いすぎた分だけ次のページの前に待つ。
+    """
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self._lock = threading.Lock()
+        self._available = self.rate
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._available = min(self.rate, self._available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait(self):
+        """前のページで使いすぎた分が回復するまで待つ"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._available > 0:
+                    return
+                delay = -self._available / self.rate
+            time.sleep(delay)
+
+    def consume(self, units):
+        with self._lock:
+            self._refill()
+            self._available -= units
+
+
+def _scan_segment(scan, kwargs, limiter):
+    """1セグメント分のページを順に返す（LastEvaluatedKey がなくなるまで）"""
+    kwargs = dict(kwargs)
+    if limiter:
+        kwargs['ReturnConsumedCapacity'] = 'TOTAL'
+    while True:
+        if limiter:
+            limiter.wait()
+        response = scan(**kwargs)
+        if limiter:
+            limiter.consume(response.get('ConsumedCapacity', {}).get('CapacityUnits', 0))
+        yield response
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def iter_scan_pages(scan, segments=1, max_capacity_per_second=None, **kwargs):
+    """スキャンの応答をページごとに必要な分だけ返す
+
+    scan は Table.scan（リソース）でも client.scan（低レベル）でもよい。kwargs はそのまま渡す。
+    segments > 1 のときは Segment / TotalSegments で分割し、セグメントごとのスレッドで並行して読む
+    （ページの順序は保証しない）。max_capacity_per_second を指定すると全体の消費RCUを抑える。
+    """
+    limiter = CapacityLimiter(max_capacity_per_second) if max_capacity_per_second else None
+    if segments <= 1:
+        yield from _scan_segment(scan, kwargs, limiter)
+        return
+
+    # 読み終わっていないページが溜まりすぎないよう、セグメントあたり2ページまで先読みする
+    pages = queue.Queue(maxsize=segments * 2)
+    done = object()
+    stop = threading.Event()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _worker(segment):
+        try:
+            for page in _scan_segment(scan, {**kwargs, 'Segment': segment, 'TotalSegments': segments}, limiter):
+                if not _put(page):
+                    return
+        except Exception as e:
+            _put(e)
+        finally:
+            _put(done)
+
+    executor = ThreadPoolExecutor(max_workers=segments, thread_name_prefix='dynamo-scan')
+    try:
+        for segment in range(segments):
+            executor.submit(_worker, segment)
+        remaining = segments
+        while remaining:
+            page = pages.get()
+            if page is done:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield page
+    finally:
+        # 途中で読むのをやめた場合もスレッドを止める
+        stop.set()
+        executor.shutdown(wait=False)
+
+
+def iter_scan(scan, segments=1, max_capacity_per_second=None, **kwargs):
+    """スキャン結果の項目を1件ずつ返す（ページは必要になった時点で読む）"""
+    for page in iter_scan_pages(scan, segments, max_capacity_per_second, **kwargs):
+        yield from page.get('Items', [])
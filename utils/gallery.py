@@ -0,0 +1,183 @@
+import os
+import time
+import threading
+from boto3.dynamodb.conditions import Key
+from utils.images import variants_from_keys, default_url
+from utils.dynamo import get_table
+
+
+# ギャラリーの一覧を保持するテーブル（PK='GALLERY' のパーティションを使う）
+GALLERY_TABLE_NAME = os.getenv("TABLE_NAME_GALLERY", "posts")
+GALLERY_PK = 'GALLERY'
+VERSION_SK = 'VERSION'
+
+# 他のワーカーでの追加・削除を確認する間隔（秒）
+VERSION_CHECK_INTERVAL = 5
+
+GALLERY_PAGE_SIZE = 24
+
+
+class GalleryManifest:
+    """ギャラリー画像の一覧（マニフェスト）
+
+    画像ごとに PK='GALLERY', SK='IMAGE#<作成日時>#<id>' の項目を持ち、
+    追加・削除のたびに SK='VERSION' の version を増やす。
+    一覧はプロセス内にキャッシュし、version が変わったときだけ読み直す。
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self._lock = threading.Lock()
+        self._entries = None
+        self._version = None
+        self._checked_at = 0.0
+
+    # ---- 読み込み ----
+
+    def _remote_version(self):
+        response = self.table.get_item(
+            Key={'PK': GALLERY_PK, 'SK': VERSION_SK},
+            ProjectionExpression='version',
+            ConsistentRead=True
+        )
+        item = response.get('Item')
+        return int(item['version']) if item else None
+
+    def _load_entries(self):
+        entries = []
+        kwargs = {
+            'KeyConditionExpression': Key('PK').eq(GALLERY_PK) & Key('SK').begins_with('IMAGE#'),
+            'ScanIndexForward': False
+        }
+        while True:
+            response = self.table.query(**kwargs)
+            entries.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return entries
+
+    def entries(self):
+        """新しい順の画像一覧"""
+        now = time.time()
+        with self._lock:
+            if self._entries is not None and now - self._checked_at < VERSION_CHECK_INTERVAL:
+                return self._entries
+
+            version = self._remote_version()
+            self._checked_at = now
+            if self._entries is None or version != self._version:
+                self._entries = self._load_entries()
+                self._version = version
+            return self._entries
+
+    def page(self, page=1, per_page=GALLERY_PAGE_SIZE):
+        """1ページ分の画像と次ページの有無を返す"""
+        entries = self.entries()
+        start = (max(page, 1) - 1) * per_page
+        return entries[start:start + per_page], start + per_page < len(entries)
+
+    def get(self, image_id):
+        for entry in self.entries():
+            if entry['image_id'] == image_id:
+                return entry
+        return None
+
+    @property
+    def version(self):
+        """最後に確認した version（一度も作成されていなければ None）"""
+        return self._version
+
+    # ---- 更新 ----
+
+    def _bump_version(self):
+        self.table.update_item(
+            Key={'PK': GALLERY_PK, 'SK': VERSION_SK},
+            UpdateExpression='ADD version :one',
+            ExpressionAttributeValues={':one': 1}
+        )
+        # 自分の変更は次の表示ですぐ反映する
+        with self._lock:
+            self._checked_at = 0.0
+
+    @staticmethod
+    def _entry(image_id, image_url, variants, keys, created_at, digest=None):
+        entry = {
+            'PK': GALLERY_PK,
+            'SK': f"IMAGE#{created_at}#{image_id}",
+            'image_id': image_id,
+            'image_url': image_url,
+            'variants': [
+                {k: v[k] for k in ('url', 'width', 'height', 'format') if k in v}
+                for v in variants
+            ],
+            'keys': keys,
+            'created_at': created_at
+        }
+        if digest:
+            # 他の投稿と共有している画像（utils.image_refs の参照数で管理）
+            entry['digest'] = digest
+        return entry
+
+    def add(self, manifest, created_at):
+        """process_image のマニフェストを一覧に追加"""
+        keys = [v['key'] for v in manifest['variants']] + [f"{manifest['base_key']}/manifest.json"]
+        self.table.put_item(Item=self._entry(
+            manifest['id'], manifest['url'], manifest['variants'], keys, created_at,
+            digest=manifest.get('digest')
+        ))
+        self._bump_version()
+
+    def remove(self, entry):
+        self.table.delete_item(Key={'PK': entry['PK'], 'SK': entry['SK']})
+        self._bump_version()
+
+    def rebuild(self, objects, url_for_key):
+        """ストレージの一覧（[{'Key', 'LastModified'}]）から作り直す"""
+        grouped = {}
+        for obj in objects:
+            key = obj['Key']
+            if key == 'gallery/':
+                continue
+            parts = key.split('/')
+            image_id = parts[1] if len(parts) == 3 else parts[-1]
+            group = grouped.setdefault(image_id, {'keys': [], 'created_at': obj['LastModified']})
+            group['keys'].append(key)
+            group['created_at'] = min(group['created_at'], obj['LastModified'])
+
+        with self.table.batch_writer(overwrite_by_pkeys=['PK', 'SK']) as batch:
+            for image_id, group in grouped.items():
+                created_at = group['created_at'].isoformat()
+                if len(group['keys']) == 1 and group['keys'][0].split('/')[-1] == image_id:
+                    # 派生画像を持たない旧形式の画像
+                    batch.put_item(Item=self._entry(
+                        image_id, url_for_key(group['keys'][0]), [], group['keys'], created_at
+                    ))
+                    continue
+                variants = variants_from_keys(group['keys'], url_for_key)
+                if variants:
+                    batch.put_item(Item=self._entry(
+                        image_id, default_url(variants), variants, group['keys'], created_at
+                    ))
+
+        self._bump_version()
+        print(f"Gallery manifest rebuilt: {len(grouped)} images")
+
+
+def list_gallery_objects(storage):
+    """gallery/ 以下の全オブジェクトを取得（マニフェストの作り直し用）"""
+    return storage.list('gallery/')
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_gallery_manifest():
+    """プロセス内で共有するギャラリーマニフェスト"""
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                _manifest = GalleryManifest(get_table(GALLERY_TABLE_NAME))
+    return _manifest
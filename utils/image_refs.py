@@ -0,0 +1,122 @@
+import os
+import threading
+from botocore.exceptions import ClientError
+from utils.dynamo import get_table
+
+
+# 画像の内容ハッシュと参照数を保持するテーブル（PK='IMAGE#<ハッシュ>' の項目を使う）
+IMAGE_REFS_TABLE_NAME = os.getenv("TABLE_NAME_IMAGE_REFS", "posts")
+REFS_SK = 'REFS'
+
+
+def _plain_manifest(item):
+    """DynamoDBの項目（Decimal入り）を process_image のマニフェストの形に戻す"""
+    variants = [
+        {
+            'key': v['key'],
+            'url': v['url'],
+            'width': int(v['width']),
+            'height': int(v['height']),
+            'format': v['format'],
+            'bytes': int(v.get('bytes', 0))
+        }
+        for v in item['variants']
+    ]
+    return {
+        'url': item['url'],
+        'variants': variants,
+        'id': item['image_id'],
+        'base_key': item['base_key'],
+        'digest': item['digest']
+    }
+
+
+class ImageRefs:
+    """同じ画像を使い回すための内容ハッシュ -> 保存済み派生画像 の対応表
+
+    項目ごとに refcount を持ち、ギャラリーや投稿が画像を使うたびに 1 増やす。
+    削除時は 1 減らし、0 になったときだけ呼び出し元がストレージから消す。
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    @staticmethod
+    def _key(digest):
+        return {'PK': f"IMAGE#{digest}", 'SK': REFS_SK}
+
+    def acquire(self, digest):
+        """登録済みなら参照数を増やしてマニフェストを返す（未登録ならNone）"""
+        try:
+            response = self.table.update_item(
+                Key=self._key(digest),
+                UpdateExpression='ADD refcount :one',
+                ConditionExpression='attribute_exists(PK)',
+                ExpressionAttributeValues={':one': 1},
+                ReturnValues='ALL_NEW'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return None
+            raise
+        return _plain_manifest(response['Attributes'])
+
+    def register(self, digest, manifest):
+        """新しく保存した画像を参照数 1 で登録する
+
+        同じ画像が同時に登録されていた場合は False（呼び出し元は acquire し直す）。
+        """
+        item = {
+            **self._key(digest),
+            'digest': digest,
+            'image_id': manifest['id'],
+            'base_key': manifest['base_key'],
+            'url': manifest['url'],
+            'variants': manifest['variants'],
+            'refcount': 1
+        }
+        try:
+            self.table.put_item(Item=item, ConditionExpression='attribute_not_exists(PK)')
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+        return True
+
+    def release(self, digest):
+        """参照数を 1 減らす。最後の参照だった場合は項目を消して True を返す"""
+        response = self.table.update_item(
+            Key=self._key(digest),
+            UpdateExpression='ADD refcount :minus_one',
+            ConditionExpression='attribute_exists(PK)',
+            ExpressionAttributeValues={':minus_one': -1},
+            ReturnValues='UPDATED_NEW'
+        )
+        if int(response['Attributes']['refcount']) > 0:
+            return False
+        try:
+            # 削除までの間に acquire されていたら残す
+            self.table.delete_item(
+                Key=self._key(digest),
+                ConditionExpression='refcount <= :zero',
+                ExpressionAttributeValues={':zero': 0}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+        return True
+
+
+_refs = None
+_refs_lock = threading.Lock()
+
+
+def get_image_refs():
+    """プロセス内で共有する画像の参照表"""
+    global _refs
+    if _refs is None:
+        with _refs_lock:
+            if _refs is None:
+                _refs = ImageRefs(get_table(IMAGE_REFS_TABLE_NAME))
+    return _refs
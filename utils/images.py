@@ -0,0 +1,418 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+
+# 生成する幅（px）。表示幅に合わせてブラウザが srcset から選ぶ
+DERIVATIVE_WIDTHS = (160, 480, 960)
+
+# 形式ごとの拡張子・Content-Type・保存オプション
+DERIVATIVE_FORMATS = {
+    'webp': {'ext': 'webp', 'content_type': 'image/webp', 'save': {'format': 'WEBP', 'quality': 80, 'method': 4}},
+    'jpeg': {'ext': 'jpg', 'content_type': 'image/jpeg', 'save': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}},
+}
+
+# src（srcset非対応ブラウザ用）に使う画像
+DEFAULT_FORMAT = 'jpeg'
+
+# 保存先キーに使う内容ハッシュ（SHA-256の16進）の長さ
+CONTENT_KEY_LENGTH = 32
+_HASH_CHUNK = 1024 * 1024
+
+# 内容から決まるキー（内容が変わればキーも変わる）は再検証させない
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# manifest.json は同じキーのまま書き直すことがあるので短め
+MANIFEST_CACHE_CONTROL = 'public, max-age=300'
+
+# 画像処理用プロセスプール（Pillowの処理でリクエストスレッドを塞がないため）
+IMAGE_POOL_WORKERS = int(os.getenv("IMAGE_POOL_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+# 処理待ち＋処理中の上限。超えた分は IMAGE_QUEUE_TIMEOUT 秒まで空きを待つ
+IMAGE_POOL_MAX_PENDING = int(os.getenv("IMAGE_POOL_MAX_PENDING", str(IMAGE_POOL_WORKERS * 4)))
+IMAGE_QUEUE_TIMEOUT = float(os.getenv("IMAGE_QUEUE_TIMEOUT", "5"))
+# 1枚あたりの処理時間の上限（秒）
+IMAGE_PROCESS_TIMEOUT = float(os.getenv("IMAGE_PROCESS_TIMEOUT", "30"))
+# メモリ断片化を避けるため、一定数処理した子プロセスは入れ替える
+IMAGE_POOL_MAX_TASKS_PER_CHILD = 50
+
+# デコード前に確認する上限。スマートフォンの48MP写真は通す
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(30 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(64_000_000)))
+
+# アップロードを一時保存するディレクトリ（未指定ならOSの既定）
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+_COPY_CHUNK = 64 * 1024
+
+# 用途ごとの sizes 属性
+IMAGE_SIZES = {
+    'gallery': '(max-width: 576px) 100vw, 500px',
+    'post': '(max-width: 768px) 100vw, 600px',
+}
+
+
+class ImageProcessingError(Exception):
+    """画像処理に失敗した"""
+
+
+class ImageProcessingBusy(ImageProcessingError):
+    """処理待ちが上限に達している"""
+
+
+class ImageProcessingTimeout(ImageProcessingError):
+    """処理が制限時間内に終わらなかった"""
+
+
+class ImageTooLarge(ImageProcessingError):
+    """ファイルサイズまたは画素数が上限を超えている"""
+
+
+_pil_modules = None
+
+
+def _pil():
+    """Pillow を初回利用時に読み込む（画像を扱わないワーカーの起動を遅くしない）"""
+    global _pil_modules
+    if _pil_modules is None:
+        from PIL import Image, ImageOps
+        # Pillow自体の展開爆弾チェックも同じ上限にする（2倍を超えるとエラー）
+        Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+        _pil_modules = (Image, ImageOps)
+    return _pil_modules
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(IMAGE_POOL_MAX_PENDING)
+
+
+def _get_pool():
+    """プロセスプールを初回利用時に作成（gunicornのワーカーごとに1つ）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # スレッドを持つプロセスからの fork を避けるため spawn で起動
+                _pool = ProcessPoolExecutor(
+                    max_workers=IMAGE_POOL_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    max_tasks_per_child=IMAGE_POOL_MAX_TASKS_PER_CHILD
+                )
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def render_derivatives(image_bytes, widths=DERIVATIVE_WIDTHS):
+    """画像のバイト列から派生画像を作る"""
+    return make_derivatives(open_oriented(BytesIO(image_bytes), max(widths)), widths)
+
+
+def render_derivatives_file(path, widths=DERIVATIVE_WIDTHS):
+    """画像ファイルから派生画像を作る（プロセスプール内で実行）"""
+    with open(path, 'rb') as f:
+        return make_derivatives(open_oriented(f, max(widths)), widths)
+
+
+# init_upload_spooling でリクエストの本文を書き出した一時ファイルのうち、まだ spool_upload が引き取っていないもの
+_request_spools = set()
+_request_spools_lock = threading.Lock()
+
+
+def _claim_request_spool(path):
+    with _request_spools_lock:
+        if path in _request_spools:
+            _request_spools.discard(path)
+            return True
+    return False
+
+
+def init_upload_spooling(app):
+    """multipart のファイルを最初から名前付きの一時ファイルに書き、spool_upload がそのまま引き取れるようにする
+
+    Werkzeug の既定では 500KB を超えるファイルは名前のない一時ファイルに書かれ、
+    spool_upload がもう一度別の一時ファイルにコピーしていた（1回のアップロードで2回書き込む）。
+    引き取られなかったファイルはリクエストの終わりに削除する。
+    """
+    from flask import request
+
+    class UploadRequest(app.request_class):
+        def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+            tmp = tempfile.NamedTemporaryFile(prefix='upload-', dir=UPLOAD_TMP_DIR, delete=False)
+            with _request_spools_lock:
+                _request_spools.add(tmp.name)
+            self.__dict__.setdefault('upload_spools', []).append(tmp.name)
+            return tmp
+
+    app.request_class = UploadRequest
+
+    @app.teardown_request
+    def _remove_unclaimed_spools(exc):
+        for path in request.__dict__.get('upload_spools', ()):
+            if _claim_request_spool(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def spool_upload(fileobj, max_bytes=MAX_IMAGE_BYTES):
+    """アップロードを少しずつ一時ファイルに書き出してパスを返す（全体をメモリに載せない）
+
+    init_upload_spooling で書き出し済みのファイルなら、コピーせずにそのファイルを引き取る。
+    返したパスのファイルは呼び出し元が削除する。
+    """
+    stream = getattr(fileobj, 'stream', fileobj)
+    path = getattr(stream, 'name', None)
+    if isinstance(path, str) and _claim_request_spool(path):
+        stream.flush()
+        if os.path.getsize(path) > max_bytes:
+            os.remove(path)
+            raise ImageTooLarge(f"画像は{max_bytes // (1024 * 1024)}MBまでです")
+        return path
+
+    tmp = tempfile.NamedTemporaryFile(prefix='upload-', dir=UPLOAD_TMP_DIR, delete=False)
+    written = 0
+    try:
+        with tmp:
+            while True:
+                chunk = fileobj.read(_COPY_CHUNK)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise ImageTooLarge(f"画像は{max_bytes // (1024 * 1024)}MBまでです")
+                tmp.write(chunk)
+    except BaseException:
+        os.remove(tmp.name)
+        raise
+    return tmp.name
+
+
+def file_digest(path):
+    """ファイル内容の SHA-256（少しずつ読むので大きな画像でもメモリを使わない）"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(_HASH_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def inspect_image(fileobj):
+    """ヘッダーだけを読んで形式と大きさを確認する（画素はデコードしない）"""
+    Image, _ = _pil()
+    try:
+        with Image.open(fileobj) as img:
+            width, height = img.size
+            image_format = img.format
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    except (OSError, SyntaxError) as e:
+        raise ImageProcessingError(f"画像を読み込めません: {e}")
+
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(f"画像の画素数が大きすぎます（{width}x{height}）")
+    return image_format, width, height
+
+
+def run_in_pool(func, *args):
+    """関数をプロセスプールで実行し、結果を待つ
+
+    処理待ちが上限なら ImageProcessingBusy、制限時間を超えたら ImageProcessingTimeout。
+    """
+    if not _pool_slots.acquire(timeout=IMAGE_QUEUE_TIMEOUT):
+        raise ImageProcessingBusy("画像処理が混み合っています")
+    try:
+        future = _get_pool().submit(func, *args)
+        try:
+            return future.result(timeout=IMAGE_PROCESS_TIMEOUT)
+        except FutureTimeoutError:
+            future.cancel()
+            raise ImageProcessingTimeout("画像処理がタイムアウトしました")
+    except BrokenProcessPool:
+        # 子プロセスが異常終了した場合は作り直す
+        _reset_pool()
+        raise ImageProcessingError("画像処理プロセスが異常終了しました")
+    finally:
+        _pool_slots.release()
+
+
+def open_oriented(fileobj, target_width=None):
+    """画像を1回だけデコードし、EXIFの向きを反映したRGB画像を返す
+
+    JPEGは target_width 以上を保てる範囲で縮小しながらデコードする（draft）。
+    12MPの写真でも1/4に縮小して読めるため、展開後のメモリが約1/16になる。
+    """
+    Image, ImageOps = _pil()
+    img = Image.open(fileobj)
+    if img.width * img.height > MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(f"画像の画素数が大きすぎます（{img.width}x{img.height}）")
+    if target_width and img.format == 'JPEG':
+        # 回転後の幅が target_width を下回らないよう、縦横とも target_width 以上を要求する
+        img.draft('RGB', (target_width, target_width))
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    return img
+
+
+def make_derivatives(img, widths=DERIVATIVE_WIDTHS):
+    """幅ごと・形式ごとの派生画像を作る -> [{width, height, format, content_type, data}]
+
+    大きい幅から順に縮小し、次の幅はひとつ前の縮小結果から作る（元画像の再デコードはしない）。
+    元画像より大きい幅は作らない。
+    """
+    Image, _ = _pil()
+    derivatives = []
+    source = img
+    targets = sorted({min(w, img.width) for w in widths}, reverse=True)
+    for width in targets:
+        if source.width > width:
+            height = max(1, round(source.height * width / source.width))
+            source = source.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+
+        for fmt, spec in DERIVATIVE_FORMATS.items():
+            output = BytesIO()
+            source.save(output, **spec['save'])
+            derivatives.append({
+                'width': source.width,
+                'height': source.height,
+                'format': fmt,
+                'content_type': spec['content_type'],
+                'data': output.getvalue()
+            })
+    return derivatives
+
+
+def store_derivatives(storage, base_key, derivatives):
+    """派生画像を base_key/w<幅>.<拡張子> に保存し、マニフェストを返す
+
+    base_key は元画像の内容ハッシュから決まるため、同じキーの内容は変わらない。
+    ブラウザが再検証しないよう immutable のキャッシュ設定を付ける。
+
+    マニフェスト: {'url': 既定の画像URL, 'variants': [{key, url, width, height, format, bytes}]}
+    """
+    variants = []
+    for d in derivatives:
+        key = f"{base_key}/w{d['width']}.{DERIVATIVE_FORMATS[d['format']]['ext']}"
+        url = storage.put(key, d['data'], content_type=d['content_type'],
+                          cache_control=IMMUTABLE_CACHE_CONTROL)
+        variants.append({
+            'key': key,
+            'url': url,
+            'width': d['width'],
+            'height': d['height'],
+            'format': d['format'],
+            'bytes': len(d['data'])
+        })
+    return {'url': default_url(variants), 'variants': variants}
+
+
+def process_image(storage, source, prefix, refs=None):
+    """画像から派生画像を作り、prefix/<内容ハッシュ>/ 以下に保存してマニフェストを返す
+
+    source はファイルのパスかファイルオブジェクト。ファイルオブジェクトは一時ファイルに
+    書き出してから処理する。デコード前にサイズと画素数を確認し、デコード・縮小・
+    エンコードはプロセスプールで行う（保存は呼び出し元のスレッド）。
+
+    同じ画像は常に同じキーになるため、保存した派生画像は書き換わらない。
+    refs（utils.image_refs.ImageRefs）を渡すと内容のハッシュで重複を確認し、
+    保存済みの画像なら処理も保存もせずに既存のマニフェストを返す（参照数は1増える）。
+    """
+    if isinstance(source, str):
+        path, owned = source, False
+    else:
+        path, owned = spool_upload(source), True
+    try:
+        if os.path.getsize(path) > MAX_IMAGE_BYTES:
+            raise ImageTooLarge(f"画像は{MAX_IMAGE_BYTES // (1024 * 1024)}MBまでです")
+        digest = file_digest(path)
+        if refs is not None:
+            existing = refs.acquire(digest)
+            if existing:
+                print(f"Reusing stored image {existing['base_key']} ({digest[:12]})")
+                return existing
+        inspect_image(path)
+        derivatives = run_in_pool(render_derivatives_file, path)
+    finally:
+        if owned:
+            os.remove(path)
+    base_key = f"{prefix.rstrip('/')}/{digest[:CONTENT_KEY_LENGTH]}"
+    manifest = store_derivatives(storage, base_key, derivatives)
+    manifest['id'] = base_key.rsplit('/', 1)[-1]
+    manifest['base_key'] = base_key
+    manifest['digest'] = digest
+
+    if refs is not None and not refs.register(digest, manifest):
+        # 同じ画像が同時に保存された場合は先に登録された方を使う
+        existing = refs.acquire(digest)
+        if existing:
+            if existing['base_key'] != base_key:
+                delete_stored(storage, manifest)
+            return existing
+    return manifest
+
+
+def delete_stored(storage, manifest):
+    """process_image で保存した派生画像とマニフェストを削除"""
+    for v in manifest['variants']:
+        storage.delete(v['key'])
+    storage.delete(f"{manifest['base_key']}/manifest.json")
+
+
+def write_manifest(storage, manifest):
+    """マニフェストを派生画像と同じ場所に manifest.json として保存"""
+    storage.put(
+        f"{manifest['base_key']}/manifest.json",
+        json.dumps(manifest, ensure_ascii=False).encode('utf-8'),
+        content_type='application/json',
+        cache_control=MANIFEST_CACHE_CONTROL
+    )
+
+
+def default_url(variants):
+    """最大幅のJPEGのURL（srcset非対応時の src）"""
+    candidates = [v for v in variants if v['format'] == DEFAULT_FORMAT] or list(variants)
+    if not candidates:
+        return None
+    return max(candidates, key=lambda v: int(v['width']))['url']
+
+
+def build_srcset(variants, fmt=DEFAULT_FORMAT):
+    """srcset 属性の値を組み立てる"""
+    matching = sorted(
+        (v for v in variants or [] if v['format'] == fmt),
+        key=lambda v: int(v['width'])
+    )
+    return ', '.join(f"{v['url']} {int(v['width'])}w" for v in matching)
+
+
+def variants_from_keys(keys, url_for_key):
+    """保存先のキー名（.../<id>/w<幅>.<拡張子>）からマニフェストを復元"""
+    ext_to_format = {spec['ext']: fmt for fmt, spec in DERIVATIVE_FORMATS.items()}
+    variants = []
+    for key in keys:
+        name = key.rsplit('/', 1)[-1]
+        stem, _, ext = name.partition('.')
+        if not stem.startswith('w') or not stem[1:].isdigit() or ext not in ext_to_format:
+            continue
+        variants.append({
+            'key': key,
+            'url': url_for_key(key),
+            'width': int(stem[1:]),
+            'format': ext_to_format[ext]
+        })
+    return variants
@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import atexit
+import fcntl
+import threading
+import functools
+from collections import defaultdict
+from flask import request, g, abort, Response
+from flask_login import current_user
+
+
+# ワーカーごとの集計を書き出すディレクトリ。/metrics は全ワーカー分を合算して返す
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join('instance', 'metrics'))
+
+# ワーカーの集計をファイルに書き出す間隔（秒）
+FLUSH_INTERVAL = 5
+
+# 終了したワーカーの値をまとめるファイル
+ARCHIVE_FILE = 'archive.json'
+
+# /metrics をログインなしで取得するためのトークン（Authorization: Bearer <token>）
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# メトリクス名 -> (種類, 説明)
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Request latency by route'),
+    'http_response_size_bytes': ('histogram', 'Response body size by route'),
+    'http_requests_total': ('counter', 'Requests by route and status'),
+    'cache_requests_total': ('counter', 'Memoized function calls by result (hit/miss)'),
+    'backend_calls_total': ('counter', 'DynamoDB/S3 calls by operation'),
+    'backend_call_errors_total': ('counter', 'DynamoDB/S3 calls that returned an error status'),
+    'circuit_rejections_total': ('counter', 'DynamoDB calls skipped because the table circuit was open'),
+    'stale_responses_total': ('counter', 'Last good values served after a loader failed'),
+    'coalesced_calls_total': ('counter', 'DynamoDB reads answered by an identical call already in flight'),
+    'compressed_responses_total': ('counter', 'Compressed responses by encoding and source (compressed/cache/stream)'),
+}
+_BUCKETS = {
+    'http_request_duration_seconds': LATENCY_BUCKETS,
+    'http_response_size_bytes': SIZE_BUCKETS,
+}
+
+
+class MetricsRegistry:
+    """プロセス内のカウンターとヒストグラム
+
+    値は {メトリクス名: {ラベルのタプル: 値}} で持ち、ヒストグラムの値は
+    [各バケットの件数..., 合計, 件数] のリスト。
+    FLUSH_INTERVAL ごとに METRICS_DIR/<pid>.json へ書き出し、collect() が全ファイルを合算する
+    （gunicorn のワーカー間で共有メモリを使わずに集計するため）。
+    """
+
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._values = defaultdict(dict)
+        self._flushed_at = 0.0
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            series = self._values[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = _BUCKETS[name]
+        with self._lock:
+            series = self._values[name]
+            data = series.get(labels)
+            if data is None:
+                data = series[labels] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    # ---- ワーカー間の集計 ----
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def flush(self, force=False):
+        """集計をファイルに書き出す（FLUSH_INTERVAL 以内の再書き出しは省略）"""
+        now = time.time()
+        pid = os.getpid()
+        if not force and now - self._flushed_at < FLUSH_INTERVAL:
+            return
+        self._flushed_at = now
+        with self._lock:
+            snapshot = {
+                name: [[list(labels), value] for labels, value in series.items()]
+                for name, series in self._values.items()
+            }
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{self._path(pid)}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self._path(pid))
+        except OSError as e:
+            print(f"Error writing metrics: {e}")
+
+    @staticmethod
+    def _merge(merged, snapshot):
+        for name, series in snapshot.items():
+            target = merged.setdefault(name, {})
+            for labels, value in series:
+                labels = tuple(labels)
+                if isinstance(value, list):
+                    current = target.get(labels, [0] * len(value))
+                    target[labels] = [a + b for a, b in zip(current, value)]
+                else:
+                    target[labels] = target.get(labels, 0) + value
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _fold_dead_workers(self):
+        """終了したワーカーのファイルを archive.json にまとめる（再起動でファイルが増え続けないように）"""
+        archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+        archive = {}
+        self._merge(archive, self._read(archive_path) or {})
+        folded = []
+        for file_name in os.listdir(self.directory):
+            stem = file_name[:-len('.json')]
+            if not file_name.endswith('.json') or not stem.isdigit() or self._alive(int(stem)):
+                continue
+            snapshot = self._read(os.path.join(self.directory, file_name))
+            if snapshot:
+                self._merge(archive, snapshot)
+            folded.append(file_name)
+        if not folded:
+            return
+        tmp_path = f"{archive_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({name: [[list(labels), value] for labels, value in series.items()]
+                       for name, series in archive.items()}, f)
+        os.replace(tmp_path, archive_path)
+        for file_name in folded:
+            os.remove(os.path.join(self.directory, file_name))
+
+    def collect(self):
+        """全ワーカー（終了したワーカーを含む）の値を合算する"""
+        self.flush(force=True)
+        merged = {}
+        try:
+            with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+                # 同時に /metrics が呼ばれても二重に数えないよう排他する
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                self._fold_dead_workers()
+                for file_name in os.listdir(self.directory):
+                    if file_name.endswith('.json'):
+                        self._merge(merged, self._read(os.path.join(self.directory, file_name)) or {})
+        except OSError as e:
+            print(f"Error collecting metrics: {e}")
+        return merged
+
+
+registry = MetricsRegistry()
+
+
+def _reset_after_fork():
+    """preload 後に fork されたワーカーは親の値（マスターで計測した分）を引き継がない"""
+    registry._lock = threading.Lock()
+    registry._values = defaultdict(dict)
+    registry._flushed_at = 0.0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(lambda: registry.flush(force=True))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(label_names, labels, extra=None):
+    pairs = [f'{k}="{_escape(v)}"' for k, v in zip(label_names, labels)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+# メトリクスごとのラベル名
+LABELS = {
+    'http_request_duration_seconds': ('route', 'method'),
+    'http_response_size_bytes': ('route',),
+    'http_requests_total': ('route', 'method', 'status'),
+    'cache_requests_total': ('function', 'result'),
+    'backend_calls_total': ('service', 'operation', 'target'),
+    'backend_call_errors_total': ('service', 'operation', 'target'),
+    'circuit_rejections_total': ('table',),
+    'stale_responses_total': ('function',),
+    'coalesced_calls_total': ('service', 'operation', 'target'),
+    'compressed_responses_total': ('encoding', 'source'),
+}
+
+
+def render_exposition(values):
+    """Prometheus のテキスト形式に変換"""
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        label_names = LABELS[name]
+        for labels, value in sorted(values.get(name, {}).items()):
+            if kind == 'histogram':
+                cumulative = value[:-2]
+                for bound, count in zip(_BUCKETS[name], cumulative):
+                    le = f'le="{bound}"'
+                    lines.append(f"{name}_bucket{_label_text(label_names, labels, le)} {count}")
+                le = 'le="+Inf"'
+                lines.append(f"{name}_bucket{_label_text(label_names, labels, le)} {value[-1]}")
+                lines.append(f"{name}_sum{_label_text(label_names, labels)} {value[-2]}")
+                lines.append(f"{name}_count{_label_text(label_names, labels)} {value[-1]}")
+            else:
+                lines.append(f"{name}{_label_text(label_names, labels)} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+# ---- 記録 ----
+
+def record_backend_call(service, operation, target, status):
+    registry.inc('backend_calls_total', (service, operation, target))
+    if status is not None and status >= 400:
+        registry.inc('backend_call_errors_total', (service, operation, target))
+
+
+_memo_state = threading.local()
+
+
+def memoize(cache, timeout=None):
+    """cache.memoize と同じだが、ヒット・ミスの回数を記録する
+
+    関数本体が実行されたらミス、実行されずに値が返ればヒットとして数える。
+    cache.delete_memoized は元の関数と同じように使える。
+    refresh(*args) は有効期限を待たずに作り直してキャッシュを入れ替える（入れ替わるまでは古い値が返る）。
+    """
+    def decorator(f):
+        name = f.__name__
+
+        @functools.wraps(f)
+        def uncached(*args, **kwargs):
+            _memo_state.miss = True
+            return f(*args, **kwargs)
+
+        memoized = cache.memoize(timeout=timeout)(uncached)
+
+        @functools.wraps(memoized)
+        def wrapper(*args, **kwargs):
+            # memoize された関数の中から別の memoize 関数を呼ぶ場合に備えて退避する
+            outer_miss = getattr(_memo_state, 'miss', False)
+            _memo_state.miss = False
+            try:
+                result = memoized(*args, **kwargs)
+                registry.inc('cache_requests_total', (name, 'miss' if _memo_state.miss else 'hit'))
+                return result
+            finally:
+                _memo_state.miss = outer_miss
+
+        def refresh(*args, **kwargs):
+            value = f(*args, **kwargs)
+            cache.set(memoized.make_cache_key(memoized.uncached, *args, **kwargs), value, timeout=timeout)
+            return value
+
+        wrapper.refresh = refresh
+        return wrapper
+    return decorator
+
+
+def init_metrics(app):
+    """ルートごとのレイテンシ・レスポンスサイズを記録し、/metrics を追加する"""
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.get('metrics_start')
+        if start is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        registry.observe('http_request_duration_seconds', (route, request.method), time.perf_counter() - start)
+        registry.inc('http_requests_total', (route, request.method, str(response.status_code)))
+        if not response.direct_passthrough and response.content_length is not None:
+            registry.observe('http_response_size_bytes', (route,), response.content_length)
+        registry.flush()
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        """全ワーカー分のメトリクス（管理者またはトークン指定時のみ）"""
+        token = request.headers.get('Authorization', '')
+        authorized_by_token = METRICS_TOKEN and token == f"Bearer {METRICS_TOKEN}"
+        if not authorized_by_token:
+            if not current_user.is_authenticated or not current_user.administrator:
+                abort(403)
+        return Response(render_exposition(registry.collect()), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,206 @@
+import os
+import time
+import logging
+import threading
+import functools
+from collections import OrderedDict
+from flask import g, has_request_context
+from utils.metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+# テーブルへの呼び出しが連続でこの回数失敗したら、しばらく呼び出しを止める（すぐにエラーを返す）
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("DYNAMODB_BREAKER_FAILURES", "5"))
+
+# 止めてから試しに1回だけ通すまでの秒数
+BREAKER_RESET_SECONDS = float(os.getenv("DYNAMODB_BREAKER_RESET_SECONDS", "30"))
+
+# 失敗として数えるエラー（条件付き書き込みの失敗など、リクエスト側の問題は数えない）
+BACKEND_ERROR_CODES = {
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'InternalServerError',
+    'ServiceUnavailable',
+}
+
+# 直近の正常な値を保持する件数（関数と引数の組ごと）
+STALE_MAX_ENTRIES = 128
+
+
+class CircuitOpenError(RuntimeError):
+    """失敗が続いているテーブルへの呼び出しを止めている"""
+
+
+class CircuitBreaker:
+    """テーブルごとのサーキットブレーカー
+
+    closed: 通常どおり呼び出す
+    open: BREAKER_RESET_SECONDS の間は呼び出さずに CircuitOpenError
+    その後は1回だけ試しに通し、成功すれば closed に戻り、失敗すれば再び open になる。
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        return 'half-open' if self._probing else 'open'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.warning(f"Circuit closed for {self.name}")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Circuit opened for {self.name} after {self._failures} failures")
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(table_name):
+    breaker = _breakers.get(table_name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(table_name, CircuitBreaker(table_name))
+    return breaker
+
+
+def _before_call(context, **kwargs):
+    # 呼び出し先のテーブルは utils.call_target がパラメーターの組み立て前に記録している
+    for table in context.get('call_tables', []):
+        if not get_breaker(table).allow():
+            registry.inc('circuit_rejections_total', (table,))
+            raise CircuitOpenError(f"DynamoDB table {table} is failing; call skipped")
+
+
+def _after_call(http_response, parsed, context, **kwargs):
+    if context.get('coalesced'):
+        # 先行する呼び出しの結果を共有しただけなので、そちらで記録済み
+        return
+    code = parsed.get('Error', {}).get('Code')
+    status = http_response.status_code if http_response is not None else 500
+    failed = status >= 500 or code in BACKEND_ERROR_CODES
+    for table in context.get('call_tables', []):
+        if failed:
+            get_breaker(table).record_failure()
+        else:
+            get_breaker(table).record_success()
+
+
+def _after_call_error(exception, context, **kwargs):
+    # 接続・読み込みのタイムアウトなど、応答が得られなかった場合
+    for table in context.get('call_tables', []):
+        get_breaker(table).record_failure()
+
+
+def register_circuit_breakers(session):
+    """boto3 セッションの DynamoDB 呼び出しにテーブルごとのサーキットブレーカーを付ける
+
+    utils.call_target.register_call_target より後に登録する。
+    """
+    session.events.register('before-call.dynamodb.*', _before_call)
+    session.events.register('after-call.dynamodb.*', _after_call)
+    session.events.register('after-call-error.dynamodb.*', _after_call_error)
+
+
+# ---- 失敗時に直近の正常な値を返す ----
+
+_last_good = OrderedDict()
+_last_good_lock = threading.Lock()
+
+
+def mark_stale(source):
+    """このリクエストで古い値を返したことを記録する（レスポンスヘッダーとテンプレートで使う）"""
+    registry.inc('stale_responses_total', (source,))
+    if has_request_context():
+        g.setdefault('stale_sources', []).append(source)
+
+
+def is_stale():
+    return has_request_context() and bool(g.get('stale_sources'))
+
+
+def serve_stale(f):
+    """例外で失敗したとき、同じ引数で直近に成功した値を返す
+
+    memoize の外側に付ける（古い値を memoize のキャッシュに入れないため）。
+    一度も成功していなければ例外をそのまま送出する。
+    """
+    name = f.__name__
+
+    def remember(key, result):
+        with _last_good_lock:
+            _last_good[key] = (result, time.time())
+            _last_good.move_to_end(key)
+            while len(_last_good) > STALE_MAX_ENTRIES:
+                _last_good.popitem(last=False)
+
+    def make_key(args, kwargs):
+        return (name, repr(args), repr(sorted(kwargs.items())))
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        key = make_key(args, kwargs)
+        try:
+            result = f(*args, **kwargs)
+        except Exception as e:
+            with _last_good_lock:
+                entry = _last_good.get(key)
+            if entry is None:
+                raise
+            value, stored_at = entry
+            logger.warning(f"{name} failed ({e}); serving value from {time.time() - stored_at:.0f}s ago")
+            mark_stale(name)
+            return value
+        remember(key, result)
+        return result
+
+    if hasattr(f, 'refresh'):
+        # キャッシュの作り直し（utils.warmer）で得た値も直近の正常な値として残す
+        def refresh(*args, **kwargs):
+            result = f.refresh(*args, **kwargs)
+            remember(make_key(args, kwargs), result)
+            return result
+        wrapper.refresh = refresh
+    return wrapper
+
+
+def init_stale_responses(app):
+    """古い値を返したレスポンスに Warning ヘッダーを付け、テンプレートから判定できるようにする"""
+    app.add_template_global(is_stale, 'stale_data')
+
+    @app.after_request
+    def _stale_header(response):
+        if is_stale():
+            response.headers['Warning'] = '110 - "Response is Stale"'
+        return response
@@ -1,75 +1,111 @@
-import boto3
-from werkzeug.utils import secure_filename
-import uuid
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 import os
-from PIL import Image
-from io import BytesIO
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.aws import get_session
+
+
+# プロセス内で共有するS3クライアント（スレッドセーフ）
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+S3_CLIENT_CONFIG = Config(
+    max_pool_connections=int(os.getenv("S3_MAX_POOL_CONNECTIONS", "20")),
+    connect_timeout=5,
+    read_timeout=30,
+    tcp_keepalive=True,
+    retries={'max_attempts': 3, 'mode': 'standard'}
+)
+
+# 投稿画像は縮小後数百KB程度なので、通常は1回のPUTで送る
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=4,
+    use_threads=True
+)
+
+# バックグラウンドでのアップロード
+UPLOAD_WORKERS = int(os.getenv("IMAGE_UPLOAD_WORKERS", "2"))
+UPLOAD_QUEUE_SIZE = int(os.getenv("IMAGE_UPLOAD_QUEUE_SIZE", "16"))
+_upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='s3-upload')
+_upload_slots = threading.BoundedSemaphore(UPLOAD_QUEUE_SIZE)
+
+
+def get_s3_client():
+    """プロセス内で共有するS3クライアントを取得"""
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                _s3_client = get_session().client('s3', config=S3_CLIENT_CONFIG)
+    return _s3_client
+
+
+def _reset_after_fork():
+    """fork したワーカーでは親のコネクションプールを使わないよう、作り直す"""
+    global _s3_client, _s3_client_lock
+    _s3_client = None
+    _s3_client_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _upload_image_file(path):
+    """画像の派生画像（幅・形式ごと）を作ってアップロードし、マニフェストを返す（失敗時None）"""
+    # utils.storage は get_s3_client を使うため、ここで読み込む
+    from utils.storage import get_storage
+    from utils.images import process_image
+    from utils.image_refs import get_image_refs
 
-def resize_image(image_file, max_size=(800, 800)):
-    """画像を指定されたサイズに縮小"""
     try:
-        # PILイメージとして開く
-        img = Image.open(image_file)
-        
-        # EXIF情報に基づいて画像を回転
-        if hasattr(img, '_getexif') and img._getexif() is not None:
-            orientation = dict(img._getexif().items()).get(274)
-            if orientation:
-                rotate_values = {3: 180, 6: 270, 8: 90}
-                if orientation in rotate_values:
-                    img = img.rotate(rotate_values[orientation], expand=True)
-
-        # アスペクト比を保持しながらリサイズ
-        img.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        # BytesIOオブジェクトに保存
-        output = BytesIO()
-        
-        # 元の形式を保持
-        format = image_file.content_type.split('/')[-1].upper()
-        if format == 'JPG':
-            format = 'JPEG'
-        
-        # 画質を指定して保存（JPEG形式の場合）
-        if format == 'JPEG':
-            img.save(output, format=format, quality=85, optimize=True)
-        else:
-            img.save(output, format=format)
-        
-        output.seek(0)
-        return output
-        
+        return process_image(get_storage(), path, 'posts', refs=get_image_refs())
     except Exception as e:
-        print(f"Error resizing image: {e}")
+        print(f"Error uploading to S3: {e}")
         return None
 
+def spool_image(file):
+    """アップロードを一時ファイルに書き出してパスを返す（上限を超える場合は ImageTooLarge）
+
+    リクエスト終了後はファイルを読めないので、バックグラウンドで処理する前に呼ぶ。
+    """
+    from utils.images import spool_upload
+    return spool_upload(file.stream)
+
 def upload_image_to_s3(file):
     if not file:
         return None
-        
-    s3 = boto3.client(
-        's3',
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        region_name=os.getenv("AWS_REGION")
-    )
-    bucket_name = os.getenv("S3_BUCKET")  # 環境変数から取得
-    file_name = f"posts/{uuid.uuid4()}-{secure_filename(file.filename)}"
-    
+    path = spool_image(file)
     try:
-        # 画像を縮小
-        resized_image = resize_image(file)
-        if not resized_image:
-            return None
-            
-        # S3にアップロード
-        s3.upload_fileobj(
-            resized_image,
-            bucket_name,
-            file_name,
-            ExtraArgs={'ContentType': file.content_type}
-        )
-        return f"https://{bucket_name}.s3.amazonaws.com/{file_name}"
-    except Exception as e:
-        print(f"Error uploading to S3: {e}")
-        return None
\ No newline at end of file
+        manifest = _upload_image_file(path)
+    finally:
+        os.remove(path)
+    return manifest['url'] if manifest else None
+
+def enqueue_image_upload(path, on_complete):
+    """spool_image で書き出した画像のアップロードをバックグラウンドで行い、完了後に on_complete(manifest) を呼ぶ
+
+    manifest は失敗時 None。キューが満杯の場合はその場でアップロードする。一時ファイルは処理後に削除する。
+    """
+    def _run():
+        try:
+            on_complete(_upload_image_file(path))
+        except Exception as e:
+            print(f"Error in background upload: {e}")
+        finally:
+            os.remove(path)
+            _upload_slots.release()
+
+    if not _upload_slots.acquire(blocking=False):
+        print("Upload queue is full; uploading synchronously")
+        try:
+            on_complete(_upload_image_file(path))
+        finally:
+            os.remove(path)
+        return False
+
+    _upload_executor.submit(_run)
+    return True
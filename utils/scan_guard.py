@@ -0,0 +1,90 @@
+import os
+import logging
+import warnings
+from flask import g, request, current_app, has_request_context
+
+
+logger = logging.getLogger(__name__)
+
+# リクエスト処理中の Scan をどう扱うか（開発・ステージング用。本番は off）
+#   off   : 何もしない
+#   warn  : warnings.warn（開発サーバーやテストの出力に出る。同じ箇所は1回だけ）
+#   log   : リクエストごとにログに出す
+#   raise : その場で ScanInRequestError にする
+SCAN_GUARD_MODES = ('off', 'warn', 'log', 'raise')
+SCAN_GUARD_MODE = os.getenv("SCAN_GUARD_MODE", "off").lower()
+if SCAN_GUARD_MODE not in SCAN_GUARD_MODES:
+    raise ValueError(f"SCAN_GUARD_MODE must be one of {', '.join(SCAN_GUARD_MODES)}: {SCAN_GUARD_MODE}")
+
+
+class ScanInRequestError(RuntimeError):
+    """リクエスト処理中に許可されていない Scan が行われた"""
+
+
+class ScanInRequestWarning(RuntimeWarning):
+    pass
+
+
+def allow_scan(view):
+    """全件を読むのが前提のビュー（管理画面など）に付けて、検出の対象から外す
+
+    @app.route の直下に付ける。
+    """
+    view.scan_allowed = True
+    return view
+
+
+def _route():
+    rule = request.url_rule.rule if request.url_rule else request.path
+    return f"{request.method} {rule}"
+
+
+def _describe(route, table, stats):
+    return (f"Scan in request {route}: table={table} "
+            f"pages={stats['pages']} items_examined={stats['scanned']} items_returned={stats['returned']}")
+
+
+def _scan_allowed():
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, 'scan_allowed', False)
+
+
+def _after_scan(parsed, context, **kwargs):
+    if not has_request_context() or _scan_allowed():
+        return
+    scans = g.setdefault('request_scans', {})
+    # テーブル名は utils.call_target がパラメーターの組み立て前に記録している
+    table = context.get('call_target', '')
+    stats = scans.setdefault(table, {'pages': 0, 'scanned': 0, 'returned': 0})
+    stats['pages'] += 1
+    stats['scanned'] += parsed.get('ScannedCount', 0)
+    stats['returned'] += parsed.get('Count', 0)
+    if SCAN_GUARD_MODE == 'raise':
+        # 残りのページは読まないので、件数は最初のページまでの分
+        raise ScanInRequestError(_describe(_route(), table, stats))
+
+
+def register_scan_guard(session):
+    """boto3 セッションに Scan の検出を登録する（SCAN_GUARD_MODE=off のときは何もしない）"""
+    if SCAN_GUARD_MODE == 'off':
+        return
+    session.events.register('after-call.dynamodb.Scan', _after_scan)
+
+
+def init_scan_guard(app):
+    """リクエストの終わりに、そのリクエストで行われた Scan をテーブルごとに報告する"""
+    if SCAN_GUARD_MODE in ('off', 'raise'):
+        return
+
+    @app.teardown_request
+    def _report_scans(exc):
+        scans = g.pop('request_scans', None)
+        if not scans:
+            return
+        route = _route()
+        for table, stats in scans.items():
+            message = _describe(route, table, stats)
+            if SCAN_GUARD_MODE == 'warn':
+                warnings.warn(message, ScanInRequestWarning)
+            else:
+                logger.warning(message)
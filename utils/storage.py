@@ -0,0 +1,225 @@
+import os
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from utils.s3 import get_s3_client, TRANSFER_CONFIG
+from io import BytesIO
+
+
+# ブラウザから直接アップロードする際の受け入れ先
+INCOMING_PREFIX = 'incoming/'
+
+# 署名付きアップロードの有効期限（秒）
+PRESIGN_EXPIRES = 600
+
+
+# delete_objects で一度に削除できる件数の上限
+S3_DELETE_BATCH = 1000
+
+
+class Storage(ABC):
+    """画像などの保存先の共通インターフェース
+
+    キーは 'gallery/<id>/w480.webp' のような / 区切りの文字列。
+    list は {'Key', 'LastModified', 'Size'} を順に返す（S3の一覧と同じ形）。
+    """
+
+    @abstractmethod
+    def public_url(self, key):
+        pass
+
+    @abstractmethod
+    def put(self, key, data, content_type=None, cache_control=None):
+        """data（bytes かファイルオブジェクト）を保存して公開URLを返す"""
+
+    @abstractmethod
+    def get(self, key):
+        pass
+
+    @abstractmethod
+    def download(self, key, path):
+        pass
+
+    @abstractmethod
+    def list(self, prefix=''):
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    @abstractmethod
+    def presign_post(self, key, content_type, max_bytes, expires=PRESIGN_EXPIRES):
+        """ブラウザから直接アップロードするためのURLとフォーム項目を発行"""
+
+
+class S3Storage(Storage):
+    """S3バケットを使うストレージ"""
+
+    def __init__(self, bucket=None, region=None):
+        self.bucket = bucket or os.getenv("S3_BUCKET")
+        self.region = region or os.getenv("AWS_REGION")
+
+    def public_url(self, key):
+        return f"https://{self.bucket}.s3.{self.region}.amazonaws.com/{key}"
+
+    def put(self, key, data, content_type=None, cache_control=None):
+        extra_args = {}
+        if content_type:
+            extra_args['ContentType'] = content_type
+        if cache_control:
+            extra_args['CacheControl'] = cache_control
+        fileobj = BytesIO(data) if isinstance(data, bytes) else data
+        get_s3_client().upload_fileobj(fileobj, self.bucket, key, ExtraArgs=extra_args, Config=TRANSFER_CONFIG)
+        return self.public_url(key)
+
+    def get(self, key):
+        response = get_s3_client().get_object(Bucket=self.bucket, Key=key)
+        return response['Body'].read()
+
+    def download(self, key, path):
+        """オブジェクトをファイルに保存（メモリに全体を載せない）"""
+        get_s3_client().download_file(self.bucket, key, path, Config=TRANSFER_CONFIG)
+
+    def list(self, prefix=''):
+        paginator = get_s3_client().get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                yield {'Key': obj['Key'], 'LastModified': obj['LastModified'], 'Size': obj['Size']}
+
+    def delete(self, key):
+        get_s3_client().delete_object(Bucket=self.bucket, Key=key)
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        for i in range(0, len(keys), S3_DELETE_BATCH):
+            get_s3_client().delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': key} for key in keys[i:i + S3_DELETE_BATCH]]}
+            )
+
+    def presign_post(self, key, content_type, max_bytes, expires=PRESIGN_EXPIRES):
+        """ブラウザからS3へ直接POSTするためのURLとフォーム項目を発行"""
+        return get_s3_client().generate_presigned_post(
+            Bucket=self.bucket,
+            Key=key,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, max_bytes]
+            ],
+            ExpiresIn=expires
+        )
+
+
+class LocalStorage(Storage):
+    """ローカルディスクを使うストレージ（AWSなしでの開発・テスト用）
+
+    presign_post は署名付きのポリシーを発行し、uguu/upload.py のローカル受け口が検証する。
+    """
+
+    def __init__(self, root=None, base_url='/uploads/local', secret_key=None):
+        self.root = os.path.abspath(root or os.getenv("LOCAL_STORAGE_ROOT", os.path.join('instance', 'storage')))
+        self.base_url = base_url.rstrip('/')
+        self._serializer = URLSafeTimedSerializer(
+            secret_key or os.getenv("SECRET_KEY", "local-storage"),
+            salt='local-storage-upload'
+        )
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def public_url(self, key):
+        return f"{self.base_url}/{key}"
+
+    def put(self, key, data, content_type=None, cache_control=None):
+        # ローカルでは配信時（uguu/upload.py）にキャッシュ設定を付ける
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            if isinstance(data, bytes):
+                f.write(data)
+            else:
+                shutil.copyfileobj(data, f)
+        os.replace(tmp_path, path)
+        return self.public_url(key)
+
+    def get(self, key):
+        with open(self._path(key), 'rb') as f:
+            return f.read()
+
+    def download(self, key, path):
+        shutil.copyfile(self._path(key), path)
+
+    def list(self, prefix=''):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if not key.startswith(prefix) or name.endswith('.tmp'):
+                    continue
+                stat = os.stat(path)
+                yield {
+                    'Key': key,
+                    'LastModified': datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+                    'Size': stat.st_size
+                }
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def presign_post(self, key, content_type, max_bytes, expires=PRESIGN_EXPIRES):
+        policy = self._serializer.dumps({
+            'key': key,
+            'content_type': content_type,
+            'max_bytes': max_bytes,
+            'expires': expires
+        })
+        return {
+            'url': self.base_url,
+            'fields': {
+                'key': key,
+                'Content-Type': content_type,
+                'policy': policy
+            }
+        }
+
+    def verify_policy(self, policy):
+        """ローカル受け口で署名を検証し、ポリシーを返す（不正ならNone）"""
+        try:
+            data = self._serializer.loads(policy, max_age=PRESIGN_EXPIRES)
+        except (BadSignature, SignatureExpired):
+            return None
+        return data
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """STORAGE_BACKEND（s3 / local）に応じたストレージを取得"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if os.getenv("STORAGE_BACKEND", "s3") == "local":
+                    _storage = LocalStorage()
+                else:
+                    _storage = S3Storage()
+    return _storage
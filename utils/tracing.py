@@ -0,0 +1,142 @@
+import os
+import time
+import logging
+from collections import defaultdict
+from flask import g, request, has_request_context
+from utils.metrics import record_backend_call
+
+
+logger = logging.getLogger(__name__)
+
+# この時間（ミリ秒）を超えたリクエストは、バックエンド呼び出しの内訳をログに出す
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+
+# Server-Timing ヘッダーを付けるか（サービス単位の合計のみ。テーブル名は出さない）
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING", "1") == "1"
+
+# DynamoDBの呼び出しに ReturnConsumedCapacity=TOTAL を付けて消費キャパシティも記録する
+TRACE_CAPACITY = os.getenv("TRACE_CONSUMED_CAPACITY", "1") == "1"
+
+# 1リクエスト内で同じ操作がこの回数以上あれば N+1 の疑いとしてログに出す
+REPEATED_CALL_THRESHOLD = 5
+
+
+def _provide_params(params, model, **kwargs):
+    """消費キャパシティを返すよう指定する（呼び出し側が指定していない場合のみ）"""
+    if 'ReturnConsumedCapacity' in model.input_shape.members:
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+
+def _before_call(model, params, context, **kwargs):
+    context['trace_start'] = time.perf_counter()
+    # 呼び出し先（テーブル名・S3はバケット名）は utils.call_target がパラメーターの組み立て前に記録している
+    context['trace_target'] = context.get('call_target', '')
+
+
+def _consumed_capacity(parsed):
+    consumed = parsed.get('ConsumedCapacity')
+    if isinstance(consumed, dict):
+        return consumed.get('CapacityUnits', 0)
+    if isinstance(consumed, list):
+        return sum(c.get('CapacityUnits', 0) for c in consumed)
+    return 0
+
+
+def _after_call(http_response, parsed, model, context, **kwargs):
+    start = context.get('trace_start')
+    if start is None:
+        return
+    service = model.service_model.service_name
+    target = context.get('trace_target', '')
+    status = http_response.status_code if http_response is not None else None
+    # 回数はリクエスト外（バックグラウンド処理）の呼び出しも /metrics に含める
+    # 実行中の同じ呼び出しの結果を使った場合（utils.coalesce）はバックエンドへの呼び出しに数えない
+    if not context.get('coalesced'):
+        record_backend_call(service, model.name, target, status)
+    if not has_request_context():
+        return
+    calls = g.setdefault('backend_calls', [])
+    calls.append({
+        'service': service,
+        'operation': model.name,
+        'target': target,
+        'ms': (time.perf_counter() - start) * 1000,
+        'retries': parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0),
+        'capacity': 0 if context.get('coalesced') else _consumed_capacity(parsed),
+        'status': status
+    })
+
+
+def register_botocore_hooks(session):
+    """boto3 セッションにイベントを登録する（このセッションから作るクライアントすべてに効く）"""
+    if TRACE_CAPACITY:
+        session.events.register('provide-client-params.dynamodb.*', _provide_params)
+    session.events.register('before-call.*.*', _before_call)
+    session.events.register('after-call.*.*', _after_call)
+
+
+def summarize_calls(calls):
+    """サービスごとの {calls, ms} と、(サービス, 操作, 対象) ごとの {calls, ms, retries, capacity}"""
+    services = defaultdict(lambda: {'calls': 0, 'ms': 0.0})
+    operations = defaultdict(lambda: {'calls': 0, 'ms': 0.0, 'retries': 0, 'capacity': 0.0})
+    for call in calls:
+        services[call['service']]['calls'] += 1
+        services[call['service']]['ms'] += call['ms']
+        op = operations[(call['service'], call['operation'], call['target'])]
+        op['calls'] += 1
+        op['ms'] += call['ms']
+        op['retries'] += call['retries']
+        op['capacity'] += call['capacity']
+    return services, operations
+
+
+def _server_timing(services, total_ms):
+    entries = [
+        f'{service};dur={stats["ms"]:.1f};desc="{stats["calls"]} calls"'
+        for service, stats in sorted(services.items())
+    ]
+    entries.append(f'app;dur={total_ms:.1f}')
+    return ', '.join(entries)
+
+
+def _log_slow_request(total_ms, operations):
+    parts = []
+    for (service, operation, target), stats in sorted(operations.items(), key=lambda kv: -kv[1]['ms']):
+        part = f"{operation} {target} x{stats['calls']} {stats['ms']:.0f}ms"
+        if stats['retries']:
+            part += f" retries={stats['retries']}"
+        if stats['capacity']:
+            part += f" rcu/wcu={stats['capacity']:.1f}"
+        parts.append(part)
+    logger.warning(
+        f"Slow request {request.method} {request.path} {total_ms:.0f}ms "
+        f"({sum(s['calls'] for s in operations.values())} backend calls): " + '; '.join(parts)
+    )
+
+
+def init_backend_tracing(app):
+    """リクエストごとのバックエンド呼び出しを集計し、Server-Timing と遅いリクエストのログに出す"""
+
+    @app.before_request
+    def _start_trace():
+        g.request_start = time.perf_counter()
+        g.backend_calls = []
+
+    @app.after_request
+    def _finish_trace(response):
+        start = g.get('request_start')
+        if start is None:
+            return response
+        total_ms = (time.perf_counter() - start) * 1000
+        services, operations = summarize_calls(g.get('backend_calls', []))
+
+        if SERVER_TIMING_ENABLED:
+            response.headers.add('Server-Timing', _server_timing(services, total_ms))
+        if total_ms >= SLOW_REQUEST_MS:
+            _log_slow_request(total_ms, operations)
+        for (service, operation, target), stats in operations.items():
+            if stats['calls'] >= REPEATED_CALL_THRESHOLD and operation in ('GetItem', 'Query', 'Scan'):
+                logger.warning(
+                    f"Repeated {operation} on {target} x{stats['calls']} in {request.method} {request.path}"
+                )
+        return response
@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import random
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+# 0 にするとキャッシュの作り直しを行わない（スクリプトやテストなど）
+CACHE_WARMER_ENABLED = os.getenv("CACHE_WARMER", "1") == "1"
+
+# 有効期限のこの割合が過ぎた時点で作り直す（期限切れまでに間に合うように）
+REFRESH_AHEAD_RATIO = 0.75
+
+# 作り直しに失敗したときに再試行するまでの秒数（古い値は有効期限まで残る）
+RETRY_SECONDS = 30
+
+
+class CacheWarmer:
+    """登録したキャッシュを有効期限が切れる前にバックグラウンドで作り直す
+
+    キャッシュはプロセスごと（SimpleCache・DynamoDB._local_cache）なので、
+    ワーカーごとに1スレッドで動かす。gunicorn の preload_app ではマスターでキャッシュだけ作り、
+    スレッドは各ワーカーで開始する（fork 前にスレッドを作らない）。max_requests で入れ替わったワーカーは
+    マスターの古いキャッシュを引き継ぐので、gunicorn.conf.py の post_worker_init で作り直してから開始する。
+    """
+
+    def __init__(self):
+        self._jobs = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._app = None
+
+    def register(self, name, refresh, timeout):
+        """refresh() は値を作り直してキャッシュに入れる関数、timeout はそのキャッシュの有効期限（秒）"""
+        interval = timeout * REFRESH_AHEAD_RATIO
+        with self._lock:
+            self._jobs.append({'name': name, 'refresh': refresh, 'interval': interval, 'next_run': 0.0})
+
+    def _run_job(self, job):
+        start = time.perf_counter()
+        try:
+            with self._app.app_context():
+                job['refresh']()
+        except Exception as e:
+            logger.warning(f"Cache warmer: refreshing {job['name']} failed: {e}")
+            job['next_run'] = time.monotonic() + RETRY_SECONDS
+            return False
+        # ワーカー間で作り直しが同時に集中しないよう、少しずらす
+        job['next_run'] = time.monotonic() + job['interval'] * random.uniform(0.9, 1.0)
+        logger.info(f"Cache warmer: refreshed {job['name']} in {(time.perf_counter() - start) * 1000:.0f}ms")
+        return True
+
+    def warm(self, app):
+        """作り直す時期を過ぎたキャッシュをその場で作る（ワーカーがリクエストを受け付ける前に呼ぶ）
+
+        fork 直後のワーカーでは、マスターで作ってから時間が経ったキャッシュだけが対象になる。
+        """
+        self._app = app
+        with self._lock:
+            jobs = list(self._jobs)
+        now = time.monotonic()
+        for job in jobs:
+            if job['next_run'] <= now:
+                self._run_job(job)
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                jobs = list(self._jobs)
+            now = time.monotonic()
+            for job in jobs:
+                if job['next_run'] <= now:
+                    self._run_job(job)
+            with self._lock:
+                next_run = min((job['next_run'] for job in self._jobs), default=now + 60)
+            time.sleep(max(next_run - time.monotonic(), 1.0))
+
+    def start(self, app):
+        """このプロセスの作り直しスレッドを開始する（開始済みなら何もしない）"""
+        if self._pid == os.getpid():
+            return
+        self._app = app
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name='cache-warmer', daemon=True)
+            self._thread.start()
+
+
+warmer = CacheWarmer()
+
+
+def init_cache_warmer(app, jobs):
+    """jobs は (名前, 作り直す関数, 有効期限の秒数) のリスト"""
+    if not CACHE_WARMER_ENABLED:
+        return
+    for name, refresh, timeout in jobs:
+        warmer.register(name, refresh, timeout)
+    if 'gunicorn' not in sys.modules:
+        warmer.start(app)
+        return
+
+    # gunicorn のワーカー（preload 時はマスター）では、リクエストを受け付ける前に温めておく
+    warmer.warm(app)
+
+    # 通常は gunicorn.conf.py の post_worker_init で開始する。設定ファイルなしで起動した場合の保険
+    @app.before_request
+    def _start_warmer():
+        warmer.start(app)